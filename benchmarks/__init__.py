@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of srm.
+
+    startup    - startup time of the srm command;
+    operations - scaling of the WasteBasketManager operations;
+    tree       - synthetic trees of the operations benchmark.
+"""
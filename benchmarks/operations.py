@@ -0,0 +1,209 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module times WasteBasketManager operations on synthetic trees.
+
+For every count of files the tree is generated, see benchmarks.tree,
+and the operations are timed in turn:
+
+    remove       - remove_many of all files;
+    content      - listing of all items;
+    restore      - restore_matching by the prefix of the tree;
+    remove_regex - remove_regex of all files by their names;
+    time_policy  - clear_by_time_policy expiring all items;
+    size_policy  - clear_by_size_policy evicting all items, the oldest first;
+    clear        - clear of all items;
+    remove_dir   - remove of the tree dir, large dirs are not walked;
+    size_pending - recording of the size of the removed tree dir,
+                   srm does it in background, see srm.sizer.
+
+Results are JSON {"python", "counts", "results": {operation: {count: seconds}}}.
+They are compared with the baseline, an operation is a regression if it
+takes more than tolerance times the baseline.
+
+Usage:
+    python -m benchmarks.operations [--counts 1000,10000] [--depth 3] [--fanout 10]
+        [--file-size 0] [--output FILE] [--baseline FILE] [--save-baseline]
+        [--tolerance 1.5]
+
+Exits with 1 if a regression is found.
+"""
+
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.tree import generate_tree
+from srm.wastebasket_manager import WasteBasketManager
+
+
+COUNTS = (1000, 10000)
+TOLERANCE = 1.5
+# differences below it are noise of the timer
+MIN_DIFFERENCE = 0.02
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+OPERATIONS = ("remove", "content", "restore", "remove_regex",
+              "time_policy", "size_policy", "clear", "remove_dir", "size_pending")
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def timed(function, *args, **kwargs):
+    """
+    Return the time of the call in seconds.
+    """
+    start = timer()
+    function(*args, **kwargs)
+    return timer() - start
+
+
+def run_count(work_dir, count, depth, fanout, file_size):
+    """
+    Times the operations with count files under work_dir.
+    Return dictionary of operation: seconds.
+    """
+    tree = os.path.join(work_dir, "tree")
+    wastebasket = WasteBasketManager(wastebasket_path=os.path.join(work_dir, "Trash"))
+    results = {}
+
+    paths = generate_tree(tree, count, depth, fanout, file_size)
+    results["remove"] = timed(lambda: list(wastebasket.remove_many(paths)))
+    results["content"] = timed(lambda: list(wastebasket.content()))
+    results["restore"] = timed(wastebasket.restore_matching, prefix=tree + os.sep)
+
+    results["remove_regex"] = timed(wastebasket.remove_regex,
+                                    os.path.join(tree, r"f\d+\.dat"), search_dirs=True)
+    wastebasket.storage_time = datetime.timedelta(0)
+    results["time_policy"] = timed(wastebasket.clear_by_time_policy)
+
+    list(wastebasket.remove_many(generate_tree(tree, count, depth, fanout, file_size)))
+    wastebasket.max_size = -1
+    wastebasket.eviction = "oldest"
+    results["size_policy"] = timed(wastebasket.clear_by_size_policy)
+
+    list(wastebasket.remove_many(generate_tree(tree, count, depth, fanout, file_size)))
+    results["clear"] = timed(wastebasket.clear)
+
+    generate_tree(tree, count, depth, fanout, file_size)
+    wastebasket.rmdir = True
+    # the sizer is timed apart instead of running in background
+    wastebasket.spawn_sizer = lambda: None
+    results["remove_dir"] = timed(wastebasket.remove, tree)
+    results["size_pending"] = timed(wastebasket.size_pending)
+
+    return results
+
+
+def run(counts, depth, fanout, file_size):
+    """
+    Return the results of the operations for every count, see the module.
+    """
+    results = dict((operation, {}) for operation in OPERATIONS)
+    for count in counts:
+        work_dir = tempfile.mkdtemp()
+        try:
+            for operation, seconds in run_count(work_dir, count, depth, fanout, file_size).items():
+                results[operation][str(count)] = seconds
+        finally:
+            shutil.rmtree(work_dir)
+
+    return {
+        "python": "{0}.{1}.{2}".format(*sys.version_info[:3]),
+        "counts": list(counts),
+        "results": results
+    }
+
+
+def find_regressions(results, baseline, tolerance=TOLERANCE):
+    """
+    Return list of tuples (operation, count, seconds, baseline seconds)
+    of the operations slower than tolerance times the baseline.
+    """
+    regressions = []
+    for operation, times in sorted(results["results"].items()):
+        baseline_times = baseline["results"].get(operation, {})
+        for count, seconds in sorted(times.items(), key=lambda item: int(item[0])):
+            if count not in baseline_times:
+                continue
+            limit = baseline_times[count] * tolerance
+            if seconds > limit and seconds - baseline_times[count] > MIN_DIFFERENCE:
+                regressions.append((operation, count, seconds, baseline_times[count]))
+
+    return regressions
+
+
+def format_results(results):
+    """
+    Return the table of the results with the growth of the time
+    between the counts, it is 10 for a linear operation and 10x counts.
+    """
+    counts = [str(count) for count in results["counts"]]
+    lines = ["{0:<14}".format("operation") + "".join("{0:>12}".format(count) for count in counts)
+             + "  growth"]
+    for operation in OPERATIONS:
+        times = results["results"][operation]
+        line = "{0:<14}".format(operation)
+        line += "".join("{0:>11.3f}s".format(times[count]) for count in counts)
+        growth = [times[current] / max(times[previous], 1e-9)
+                  for previous, current in zip(counts, counts[1:])]
+        line += "  " + " ".join("x{0:.1f}".format(ratio) for ratio in growth)
+        lines.append(line)
+
+    return "\n".join(lines)
+
+
+def main():
+    """
+    Module entry point
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--counts", default=",".join(str(count) for count in COUNTS),
+                        help="Comma separated numbers of files, up to 1000000")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fanout", type=int, default=10)
+    parser.add_argument("--file-size", type=int, default=0)
+    parser.add_argument("--output", help="Writes the JSON results to the file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Writes the results to the baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    counts = [int(count) for count in args.counts.split(",")]
+    results = run(counts, args.depth, args.fanout, args.file_size)
+    print(format_results(results))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=4, sort_keys=True)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        return 0
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+
+    regressions = find_regressions(results, baseline, args.tolerance)
+    for operation, count, seconds, baseline_seconds in regressions:
+        print("regression: {operation} of {count} files takes {seconds:.3f}s, "
+              "baseline {baseline:.3f}s".format(operation=operation, count=count,
+                                                seconds=seconds, baseline=baseline_seconds))
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module measures the startup time of the srm command.
+
+The wall-clock time is measured for the interpreter alone, for importing
+srm.main and for the full srm run with an empty WasteBasket and config
+in a temporary HOME. On python 3.7+ the import time of srm.main
+is also reported by modules, like python -X importtime.
+
+Usage:
+    python -m benchmarks.startup [--runs N] [--budget MS] [--python PATH]
+
+The full run needs the interpreter srm works on, python 2.7 by now.
+Exits with 1 if the median of the full run exceeds the budget.
+"""
+
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+BUDGET = 50.0
+RUNS = 20
+TOP_IMPORTS = 15
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def time_command(command, env, runs=RUNS):
+    """
+    Runs the command once to warm up and then runs times.
+    Return list of wall-clock times in milliseconds.
+    """
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call(command, env=env, stdout=devnull, stderr=devnull)
+
+        times = []
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call(command, env=env, stdout=devnull, stderr=devnull)
+            times.append((time.time() - start) * 1000)
+
+    return times
+
+
+def import_times(python, env, top=TOP_IMPORTS):
+    """
+    Return list of tuples (cumulative us, self us, module) of the slowest
+    imports of srm.main or None if the interpreter cannot report them.
+    """
+    process = subprocess.Popen([python, "-X", "importtime", "-c", "import srm.main"],
+                               env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, report = process.communicate()
+    if process.returncode:
+        return None
+
+    imports = []
+    for line in report.decode("utf-8").splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue
+        imports.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+
+    return sorted(imports, reverse=True)[:top] or None
+
+
+def main():
+    """
+    Module entry point
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--budget", type=float, default=BUDGET,
+                        help="Median time of the full run in milliseconds")
+    parser.add_argument("--python", default=sys.executable)
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp()
+    try:
+        # installed srm is compiled, so bytecode is written at the warm-up run
+        env = dict(os.environ, HOME=home, PYTHONPATH=REPO_PATH)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        srm_command = [args.python, "-m", "srm.main", "--silent", "--content",
+                       "--config", os.path.join(home, "srm_config.json"),
+                       "--wastebasket-path", os.path.join(home, "Trash")]
+
+        imports = import_times(args.python, env)
+        if imports:
+            print("{0:>10} {1:>10}  {2}".format("cumul, us", "self, us", "module"))
+            for cumulative, own, module in imports:
+                print("{0:>10} {1:>10}  {2}".format(cumulative, own, module))
+            print("")
+
+        results = [
+            ("interpreter", time_command([args.python, "-c", "pass"], env, args.runs)),
+            ("import srm.main", time_command([args.python, "-c", "import srm.main"],
+                                             env, args.runs)),
+            ("srm --content", time_command(srm_command, env, args.runs)),
+        ]
+    finally:
+        shutil.rmtree(home)
+
+    for name, times in results:
+        print("{name:<16} median {median:7.1f} ms, min {min:7.1f} ms".format(
+            name=name, median=median(times), min=min(times)))
+
+    full_run = median(results[-1][1])
+    print("budget {budget:.1f} ms: {verdict}".format(
+        budget=args.budget, verdict="ok" if full_run <= args.budget else "exceeded"))
+
+    return 0 if full_run <= args.budget else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module generates synthetic directory trees for the benchmarks.
+"""
+
+
+import os
+
+
+def leaf_dirs(root, depth, fanout):
+    """
+    Returns list of paths of the leaf directories of the tree
+    with the given depth and fan-out, in breadth-first order.
+    """
+    leaves = [root]
+    for _ in range(depth):
+        leaves = [os.path.join(parent, "d{index}".format(index=index))
+                  for parent in leaves for index in range(fanout)]
+
+    return leaves
+
+
+def generate_tree(root, files, depth=3, fanout=10, file_size=0):
+    """
+    Creates the files f<N>.dat of file_size bytes spread over the leaf
+    directories of the tree under root, see leaf_dirs. Only as many
+    leaves are created as there are files.
+
+    Returns list of the file paths.
+    """
+    leaves = leaf_dirs(root, depth, fanout)[:max(files, 1)]
+    for leaf in leaves:
+        if not os.path.isdir(leaf):
+            os.makedirs(leaf)
+
+    data = b"x" * file_size
+    paths = []
+    for index in range(files):
+        path = os.path.join(leaves[index % len(leaves)], "f{index}.dat".format(index=index))
+        with open(path, "wb") as node:
+            node.write(data)
+        paths.append(path)
+
+    return paths
@@ -11,6 +11,10 @@ setup(
     version=srm.__version__,
     test_suite='tests',
     packages=find_packages(),
+    install_requires=[
+        'pytoml',
+        'scandir; python_version < "3.5"'
+    ],
     description="smart RM",
     author="Miroslav Ganevich",
     author_email="miroslav_ganevich@mail.com",
@@ -18,6 +22,7 @@ setup(
     long_description=open(join(dirname(__file__), 'README.md')).read(),
     entry_points={
         'console_scripts':
-            ['srm = srm.main:main']
+            ['srm = srm.main:main',
+             'srmd = srm.daemon:main']
         }
 )
\ No newline at end of file
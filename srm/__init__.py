@@ -13,14 +13,24 @@ To install, run the command:
 
 To use the package in the interpreter, import the required modules:
 
+    async_wastebasket_manager - the asyncio API of the WasteBasket, python 3.7+;
+    cold_tier           - to pack old trash items into compressed archives;
     config_manager      - to work with config files;
+    daemon              - srmd, the daemon owning the WasteBasket;
+    daemon_client       - the client of srmd used by main;
     exit_codes          - contain enum of exit codes;
     file_manager        - сontains some functions for working with the file system;
     logger              - the settings of the logger;
     main                - entry point when using the terminal;
+    metrics             - counters and latency histograms of the operations;
     move_error          - contain MoveErrror class;
+    packer              - packs the old items into the cold tier in background;
+    parallel_remove     - to remove many roots by the process pool;
+    plan                - the plan of the removal made without changes;
     remove_policy       - contain enum of remove policy
+    sizer               - records the sizes of the large removed dirs in background;
     timedelta_parser    - to parse string object to timedelta object;
+    tree_walker         - for traversal of directory trees;
     trashinfo           - for work with trashinfo;
     wastrbasket_manager - to work with the WasteBasket;
 """
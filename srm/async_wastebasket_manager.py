@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+
+"""
+The module provides the asyncio API of the WasteBasket, python 3.7+.
+
+Calls of WasteBasketManager run in the thread pool, every thread has
+its own WasteBasketManager, so its SQLite connection is not shared.
+At most concurrency calls run at once, the rest wait for their turn
+without taking a thread. Generators are streamed as async iterators
+by chunks through a bounded queue.
+"""
+
+
+import asyncio
+import concurrent.futures
+import threading
+
+from srm.wastebasket_manager import WasteBasketManager
+
+
+WORKERS = 4
+CHUNK_SIZE = 256
+# chunks waiting for the consumer, the producing thread waits if it is full
+QUEUE_CHUNKS = 4
+# seconds between the checks of the producing thread if the manager is closed
+POLL_INTERVAL = 0.1
+
+DONE = object()
+
+
+class AsyncWasteBasketManager(object):
+    """
+    The object of this class calls WasteBasketManager without blocking
+    the event loop.
+
+    workers     - threads of the executor;
+    concurrency - calls running at once, workers by default;
+    settings    - arguments of WasteBasketManager.
+
+    Use it as an async context manager or call close.
+    """
+
+    def __init__(self, workers=WORKERS, concurrency=None, **settings):
+        self.settings = settings
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.concurrency = concurrency or workers
+        self.semaphore = None
+        self.local = threading.local()
+        self.closed = False
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+
+    def close(self):
+        """
+        Waits for the running calls, streams not iterated to the end are stopped.
+        """
+        self.closed = True
+        self.executor.shutdown(wait=True)
+
+
+    def limit(self):
+        """
+        Return the semaphore of the calls, it is created in the running loop.
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+
+        return self.semaphore
+
+
+    def manager(self):
+        """
+        Return WasteBasketManager of the current thread.
+        """
+        wastebasket = getattr(self.local, "wastebasket", None)
+        if wastebasket is None:
+            wastebasket = WasteBasketManager(**self.settings)
+            self.local.wastebasket = wastebasket
+
+        return wastebasket
+
+
+    async def call(self, method, *args, **kwargs):
+        """
+        Return the result of the method of WasteBasketManager called in the executor.
+        """
+        def run():
+            return getattr(self.manager(), method)(*args, **kwargs)
+
+        async with self.limit():
+            return await asyncio.get_running_loop().run_in_executor(self.executor, run)
+
+
+    async def stream(self, method, *args, **kwargs):
+        """
+        Yields the items of the generator method of WasteBasketManager.
+
+        The generator runs in the executor and passes the items by chunks
+        through the queue. If the iteration is stopped early, the generator
+        is closed after its current chunk.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        # free places of the queue, taken by the producer and given back by the consumer
+        slots = threading.Semaphore(QUEUE_CHUNKS)
+        stopped = threading.Event()
+
+        def put(chunk):
+            # Return False if the stream is stopped or the manager is closed
+            while not slots.acquire(timeout=POLL_INTERVAL):
+                if self.closed or stopped.is_set():
+                    return False
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            except RuntimeError:
+                # the loop is closed
+                return False
+            return True
+
+        def produce():
+            try:
+                items = getattr(self.manager(), method)(*args, **kwargs)
+                try:
+                    chunk = []
+                    for item in items:
+                        chunk.append(item)
+                        if len(chunk) >= CHUNK_SIZE:
+                            if not put(chunk) or stopped.is_set():
+                                return
+                            chunk = []
+                    put(chunk)
+                finally:
+                    items.close()
+            except BaseException as exception:
+                put(exception)
+            finally:
+                put(DONE)
+
+        async with self.limit():
+            loop.run_in_executor(self.executor, produce)
+            try:
+                while True:
+                    chunk = await queue.get()
+                    slots.release()
+                    if chunk is DONE:
+                        break
+                    if isinstance(chunk, BaseException):
+                        raise chunk
+                    for item in chunk:
+                        yield item
+            finally:
+                # the producer stops after its current chunk,
+                # nothing is awaited on close
+                stopped.set()
+
+
+    # Remove methods
+    async def remove(self, *paths):
+        """
+        See WasteBasketManager.remove.
+        """
+        return await self.call("remove", *paths)
+
+
+    def remove_many(self, paths, **kwargs):
+        """
+        Async iterator of tuples from the old and new paths of the files
+        moved from the iterable, see WasteBasketManager.remove_many.
+        """
+        return self.stream("remove_many", paths, **kwargs)
+
+
+    async def remove_regex(self, pattern, search_dirs=False, workers=None, filters=None):
+        """
+        See WasteBasketManager.remove_regex.
+        """
+        return await self.call("remove_regex", pattern, search_dirs=search_dirs,
+                               workers=workers, filters=filters)
+
+
+    # Restore methods
+    async def restore(self, *names):
+        """
+        See WasteBasketManager.restore.
+        """
+        return await self.call("restore", *names)
+
+
+    async def restore_matching(self, prefix=None, pattern=None, since=None, until=None):
+        """
+        See WasteBasketManager.restore_matching.
+        """
+        return await self.call("restore_matching", prefix, pattern, since, until)
+
+
+    def restore_many(self, items, **kwargs):
+        """
+        Async iterator of tuples from the old and new paths of the items
+        restored from the iterable of (name, old path), see WasteBasketManager.restore_many.
+        """
+        return self.stream("restore_many", items, **kwargs)
+
+
+    # Show method
+    def content(self, *args, **kwargs):
+        """
+        Async iterator of tuples (name, trashinfo), see WasteBasketManager.content.
+        """
+        return self.stream("content", *args, **kwargs)
+
+
+    # Clear methods
+    async def clear(self, background=None):
+        """
+        See WasteBasketManager.clear.
+        """
+        return await self.call("clear", background)
+
+
+    async def clear_by_size_policy(self):
+        """
+        See WasteBasketManager.clear_by_size_policy.
+        """
+        return await self.call("clear_by_size_policy")
+
+
+    async def clear_by_time_policy(self):
+        """
+        See WasteBasketManager.clear_by_time_policy.
+        """
+        return await self.call("clear_by_time_policy")
+
+
+    async def enforce_policy(self, policy, force=False):
+        """
+        See WasteBasketManager.enforce_policy.
+        """
+        return await self.call("enforce_policy", policy, force=force)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module packs old WasteBasket items into compressed zip archives.
+
+Every item is stored under its trash name: a file as the member "name",
+a directory as "name/" followed by its nodes. The central directory of
+the zip archive is the member index, so a single item is extracted
+without decompressing the rest of the archive.
+"""
+
+
+import errno
+import os
+import shutil
+import stat
+import time
+import zipfile
+
+
+# compressions of zipfile, bzip2 and lzma are supported by python 3.3+
+ZIP_COMPRESSIONS = {
+    "deflate": "ZIP_DEFLATED",
+    "bzip2": "ZIP_BZIP2",
+    "lzma": "ZIP_LZMA"
+}
+
+# link targets are read from the archive as bytes
+fsdecode = getattr(os, "fsdecode", lambda path: path)
+
+
+def zip_compression(compression):
+    """
+    Return zipfile constant of the compression or raise ValueError
+    if the interpreter does not support it.
+    """
+    constant = getattr(zipfile, ZIP_COMPRESSIONS.get(compression, ""), None)
+    if constant is None:
+        raise ValueError("Compression {name} is not supported".format(name=compression))
+
+    return constant
+
+
+def walk_node(path, arcname):
+    """
+    Yields tuples (path, member name, stat) of the node and,
+    if it is a directory, of its nodes, parents first.
+    """
+    node_stat = os.lstat(path)
+    yield (path, arcname, node_stat)
+
+    if stat.S_ISDIR(node_stat.st_mode):
+        for name in sorted(os.listdir(path)):
+            for member in walk_node(os.path.join(path, name), arcname + "/" + name):
+                yield member
+
+
+def item_name(member_name):
+    return member_name.split("/", 1)[0]
+
+
+def pack(archive_path, nodes, compression="deflate"):
+    """
+    Packs the list of (name, path) into the new zip archive,
+    the node of the path is stored under the name.
+
+    Return dictionary of name: compressed bytes of the item.
+    """
+    with zipfile.ZipFile(archive_path, "w", zip_compression(compression),
+                         allowZip64=True) as archive:
+        for name, path in nodes:
+            for node_path, arcname, node_stat in walk_node(path, name):
+                if stat.S_ISLNK(node_stat.st_mode):
+                    info = zipfile.ZipInfo(arcname, time.localtime(node_stat.st_mtime)[:6])
+                    info.external_attr = node_stat.st_mode << 16
+                    archive.writestr(info, os.readlink(node_path))
+                elif stat.S_ISDIR(node_stat.st_mode) or stat.S_ISREG(node_stat.st_mode):
+                    archive.write(node_path, arcname)
+                else:
+                    raise OSError(errno.EINVAL, "Cannot pack special file", node_path)
+
+        sizes = dict((name, 0) for name, path in nodes)
+        for info in archive.infolist():
+            sizes[item_name(info.filename)] += info.compress_size
+
+    return sizes
+
+
+def item_sizes(archive_path):
+    """
+    Return dictionary of name: compressed bytes of the items in the archive.
+    """
+    sizes = {}
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            name = item_name(info.filename)
+            sizes[name] = sizes.get(name, 0) + info.compress_size
+
+    return sizes
+
+
+def extract(archive_path, name, dst):
+    """
+    Extracts the item of the archive to dst, only the members
+    of the item are decompressed. Modes and modification times are kept.
+
+    If the item is not in the archive, OSError will be raised.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [info for info in archive.infolist() if item_name(info.filename) == name]
+        if not members:
+            raise OSError(errno.ENOENT, "No such item in the archive", name)
+
+        directories = []
+        for info in members:
+            target = os.path.join(dst, info.filename[len(name):].strip("/"))
+            target = target.rstrip(os.sep) or os.sep
+            mode = info.external_attr >> 16
+
+            if stat.S_ISLNK(mode):
+                os.symlink(fsdecode(archive.read(info)), target)
+                continue
+
+            if info.filename.endswith("/"):
+                if not os.path.isdir(target):
+                    os.makedirs(target)
+                directories.append((target, info))
+                continue
+
+            with archive.open(info) as src, open(target, "wb") as member_file:
+                shutil.copyfileobj(src, member_file)
+            restore_attributes(target, info)
+
+        # directories are made read-only after their content is extracted
+        for target, info in reversed(directories):
+            restore_attributes(target, info)
+
+
+def restore_attributes(path, info):
+    mode = info.external_attr >> 16
+    if mode:
+        os.chmod(path, stat.S_IMODE(mode))
+
+    mtime = time.mktime(info.date_time + (0, 0, -1))
+    os.utime(path, (mtime, mtime))
@@ -5,7 +5,6 @@
 import json
 import logging
 import os
-import pytoml
 
 from srm.file_operations import get_full_path, create_path
 from srm.remove_policy import RemovePolicy
@@ -46,6 +45,7 @@ def create_config(path, config_dict=None):
         if file_extension == ".json":
             json.dump(config_dict, config_file, indent=4, sort_keys=True)
         elif file_extension == ".toml":
+            import pytoml
             pytoml.dump(config_dict, config_file, sort_keys=True)
         else:
             warning_message = """"{file}" has not been created!
@@ -72,6 +72,7 @@ The default config will be used.""".format(file=path)
         if file_extension == ".json":
             config = json.load(config_file)
         elif file_extension == ".toml":
+            import pytoml
             config = pytoml.load(config_file)
         else:
             warning_message = """The "{file}" does not match the format of toml in json!
@@ -100,6 +101,7 @@ def update_config(path="", config_dict=None):
         if file_extension == ".json":
             json.dump(config_dict, config_file, indent=4, sort_keys=True)
         elif file_extension == ".toml":
+            import pytoml
             pytoml.dump(config_dict, config_file, sort_keys=True)
         else:
             warning_message = """"{file}" has not been updated!
@@ -0,0 +1,212 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module provides srmd, the daemon owning the WasteBasket.
+
+The daemon keeps WasteBasketManager with its open trashinfo and trash
+roots and serves the requests of the srm command over the Unix socket
+srmd.sock in the WasteBasket, see srm.daemon_client for the protocol.
+Requests are served one by one, in the order of connections.
+
+If the metrics file is given, the metrics of srm.metrics are written
+to it after every request.
+
+Usage:
+    srmd [--wastebasket-path PATH] [--metadata-backend NAME] [--metrics-file PATH]
+"""
+
+
+import argparse
+import errno
+import logging
+import os
+import signal
+import socket
+import sys
+import types
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from srm import metrics
+from srm.daemon_client import (
+    socket_path,
+    send_message,
+    send_chunks,
+    receive_message
+)
+from srm.move_error import MoveError
+from srm.logger_tools import log_conflicts
+from srm.trashinfo import BACKENDS, DEFAULT_BACKEND
+from srm.wastebasket_manager import WasteBasketManager, TRASHDIR_PATH, SETTINGS
+
+
+# methods of WasteBasketManager served by the daemon
+METHODS = ("remove", "remove_regex", "remove_roots", "restore", "restore_matching",
+           "content", "clear", "recount", "enforce_policy", "fsck")
+# methods whose rows are streamed as they are read, see srm.daemon_client
+STREAMED_METHODS = ("content",)
+
+
+def call(wastebasket, request, default_settings):
+    """
+    Calls the method of the request with the settings of the request,
+    the settings missing in the request are default.
+    Return the response, the result of the streamed method is the generator.
+    """
+    method = request["method"]
+    if method not in METHODS:
+        raise ValueError("Unknown method {method}".format(method=method))
+
+    settings = dict(default_settings)
+    for name, value in request.get("settings", {}).items():
+        if name in SETTINGS:
+            settings[name] = value
+    wastebasket.configure(**settings)
+
+    try:
+        result = getattr(wastebasket, method)(*request.get("args", []),
+                                              **request.get("kwargs", {}))
+        if isinstance(result, types.GeneratorType) and method not in STREAMED_METHODS:
+            result = list(result)
+    except MoveError as exception:
+        return {"error": {
+            "message": exception.message,
+            "raised_path": exception.raised_path,
+            "success": exception.success
+        }}
+
+    return {"result": result}
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves the requests of the connection until it is closed.
+    """
+
+    def handle(self):
+        while True:
+            request = receive_message(self.request)
+            if request is None:
+                break
+
+            try:
+                response = call(self.server.wastebasket, request,
+                                self.server.default_settings)
+                rows = response.get("result")
+                if isinstance(rows, types.GeneratorType):
+                    try:
+                        send_chunks(self.request, rows)
+                    finally:
+                        rows.close()
+                    response = {"end": True}
+            except Exception as exception:
+                logging.exception("Request %s failed", request.get("method"))
+                response = {"error": {
+                    "message": str(exception), "raised_path": None, "success": []
+                }}
+            send_message(self.request, response)
+            self.server.write_metrics()
+
+
+class Server(socketserver.UnixStreamServer):
+    """
+    The object of this class serves the WasteBasket on its socket.
+    """
+
+    def __init__(self, wastebasket, metrics_file=None):
+        self.wastebasket = wastebasket
+        self.default_settings = wastebasket.settings()
+        self.socket_path = socket_path(wastebasket.wastebasket_path)
+        self.metrics_file = metrics_file
+        if metrics_file is not None:
+            metrics.load_textfile(metrics_file)
+
+        if is_running(self.socket_path):
+            raise OSError(errno.EADDRINUSE, "srmd is already running", self.socket_path)
+        if os.path.lexists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        old_umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.socket_path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+
+    def write_metrics(self):
+        if self.metrics_file is None:
+            return
+
+        metrics.set_gauge("wastebasket_size_bytes", self.wastebasket.total_size())
+        metrics.write_textfile(self.metrics_file)
+
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if os.path.lexists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def is_running(path):
+    """
+    Return True if the daemon accepts connections on the socket.
+    """
+    if not os.path.exists(path):
+        return False
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except socket.error:
+        return False
+    finally:
+        connection.close()
+
+    return True
+
+
+def main():
+    """
+    Module entry point
+    """
+    parser = argparse.ArgumentParser(prog="srmd")
+    parser.add_argument("--wastebasket-path", default=TRASHDIR_PATH,
+                        help="Sets the path to the wastebasket")
+    parser.add_argument("--metadata-backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND,
+                        help="Sets the trashinfo backend")
+    parser.add_argument("--metrics-file",
+                        help="Writes the metrics to the file in the Prometheus text format")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+
+    wastebasket = WasteBasketManager(wastebasket_path=args.wastebasket_path,
+                                     metadata_backend=args.metadata_backend,
+                                     background_clear=True)
+    log_conflicts(wastebasket.trashinfo.conflicts)
+    server = Server(wastebasket, args.metrics_file)
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+
+    msg = "srmd serves {path}".format(path=server.socket_path)
+    logging.info(msg)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
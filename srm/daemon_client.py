@@ -0,0 +1,304 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module provides the client of the srm daemon, see srm.daemon.
+
+Messages are JSON objects framed by their length, 4 bytes in network
+byte order. The request is
+    {"method": name, "args": [...], "kwargs": {...}, "settings": {...}},
+the response is {"result": value} or {"error": {"message", "raised_path", "success"}}.
+Rows of the streamed methods, see srm.daemon.STREAMED_METHODS, are sent
+by the frames {"chunk": [row, ...]} of at most CHUNK_SIZE rows as they are
+read, the stream is ended by {"end": true} or by the error response.
+Datetime and timedelta values are sent as {"__datetime__": epoch seconds}
+and {"__timedelta__": seconds}, moved nodes as {"__moved__": [src, dst, size]}.
+"""
+
+
+import datetime
+import errno
+import json
+import os
+import socket
+import struct
+import sys
+
+from srm.file_operations import MovedNode, get_full_path
+from srm.move_error import MoveError
+from srm.trashinfo import datetime_to_timestamp, get_full_prefix
+from srm.wastebasket_manager import SETTINGS
+
+
+SOCKET_NAME = "srmd.sock"
+HEADER = struct.Struct("!I")
+MAX_MESSAGE_SIZE = 256 * 1024 ** 2
+CHUNK_SIZE = 1000
+
+
+def socket_path(wastebasket_path):
+    """
+    Returns the path to the socket of the daemon of the WasteBasket.
+    """
+    return os.path.join(get_full_path(wastebasket_path), SOCKET_NAME)
+
+
+def to_json(value):
+    """
+    Converts the value of the message into JSON types, see the protocol.
+    """
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": datetime_to_timestamp(value)}
+    if isinstance(value, datetime.timedelta):
+        return {"__timedelta__": value.total_seconds()}
+    if isinstance(value, MovedNode):
+        return {"__moved__": [value[0], value[1], value.size]}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return dict((key, to_json(item)) for key, item in value.items())
+
+    return value
+
+
+def to_native(value):
+    """
+    Converts the value of the loaded message back, see to_json.
+    Strings are converted into the native str.
+    """
+    if sys.version_info[0] == 2 and isinstance(value, type(u"")):
+        return value.encode("utf-8")
+    if isinstance(value, list):
+        return [to_native(item) for item in value]
+    if isinstance(value, dict):
+        if list(value) == ["__datetime__"]:
+            return datetime.datetime.fromtimestamp(value["__datetime__"])
+        if list(value) == ["__timedelta__"]:
+            return datetime.timedelta(seconds=value["__timedelta__"])
+        if list(value) == ["__moved__"]:
+            return MovedNode(*to_native(value["__moved__"]))
+        return dict((to_native(key), to_native(item)) for key, item in value.items())
+
+    return value
+
+
+def receive_exactly(connection, size):
+    """
+    Return size bytes from the connection or None if it is closed.
+    """
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1024 ** 2))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def send_message(connection, message):
+    """
+    Sends the framed message.
+    """
+    data = json.dumps(to_json(message)).encode("utf-8")
+    connection.sendall(HEADER.pack(len(data)) + data)
+
+
+def send_chunks(connection, rows):
+    """
+    Sends the rows from the iterable by the frames of CHUNK_SIZE rows,
+    see the protocol. The end of the stream is not sent.
+    """
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            send_message(connection, {"chunk": chunk})
+            chunk = []
+
+    if chunk:
+        send_message(connection, {"chunk": chunk})
+
+
+def receive_message(connection):
+    """
+    Return the framed message or None if the connection is closed.
+    """
+    header = receive_exactly(connection, HEADER.size)
+    if header is None:
+        return None
+
+    size = HEADER.unpack(header)[0]
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError("Message is too large")
+
+    data = receive_exactly(connection, size)
+    if data is None:
+        return None
+
+    return to_native(json.loads(data.decode("utf-8")))
+
+
+def raise_error(response):
+    """
+    Raises MoveError of the error response.
+    """
+    if "error" in response:
+        error = response["error"]
+        raise MoveError(message=error["message"], raised_path=error["raised_path"],
+                        success=error["success"])
+
+
+def connect(wastebasket_path=None, **settings):
+    """
+    Return DaemonClient of the daemon of the WasteBasket
+    or None if the daemon is not running.
+
+    Takes the arguments of WasteBasketManager.
+    """
+    if wastebasket_path is None:
+        wastebasket_path = "~/Trash"
+
+    path = socket_path(wastebasket_path)
+    if not os.path.exists(path):
+        return None
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except socket.error as exception:
+        connection.close()
+        if exception.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+
+    return DaemonClient(connection, settings)
+
+
+class DaemonClient(object):
+    """
+    The object of this class calls the methods of WasteBasketManager
+    in the daemon, see srm.daemon.METHODS.
+
+    Results are returned as lists instead of tuples, content is yielded
+    as it is streamed by the daemon.
+    Only the settings supported by WasteBasketManager.configure are sent,
+    the rest, like progress, are dropped.
+    """
+
+    def __init__(self, connection, settings):
+        self.connection = connection
+        self.settings = dict((name, value) for name, value in settings.items()
+                             if name in SETTINGS)
+
+
+    def send_request(self, method, args, kwargs):
+        send_message(self.connection, {
+            "method": method, "args": list(args), "kwargs": kwargs, "settings": self.settings
+        })
+
+
+    def receive_response(self):
+        response = receive_message(self.connection)
+        if response is None:
+            raise IOError(errno.ECONNRESET, "srm daemon closed the connection")
+
+        return response
+
+
+    def call(self, method, *args, **kwargs):
+        """
+        Calls the method of WasteBasketManager in the daemon.
+        Return its result. MoveError raised by the method is raised.
+        """
+        self.send_request(method, args, kwargs)
+        response = self.receive_response()
+        raise_error(response)
+
+        return response["result"]
+
+
+    def stream(self, method, *args, **kwargs):
+        """
+        Calls the streamed method of WasteBasketManager in the daemon,
+        see srm.daemon.STREAMED_METHODS. Yields the rows as their chunks arrive.
+        """
+        self.send_request(method, args, kwargs)
+        response = self.receive_response()
+        try:
+            while "chunk" in response:
+                for row in response["chunk"]:
+                    yield row
+                response = self.receive_response()
+        finally:
+            # the rest of the stream is skipped if the rows are not consumed,
+            # so the next call receives its own response
+            while "chunk" in response:
+                response = self.receive_response()
+
+        raise_error(response)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    # paths are sent in full, the daemon works in another directory
+    def remove(self, *paths):
+        return self.call("remove", *[get_full_path(path) for path in paths])
+
+
+    def remove_many(self, paths):
+        return self.remove(*paths)
+
+
+    def remove_regex(self, pattern, search_dirs=False, workers=None, filters=None):
+        return self.call("remove_regex", get_full_path(pattern), search_dirs=search_dirs,
+                         workers=workers, filters=filters)
+
+
+    def remove_roots(self, roots, regex=False, search_dirs=False, processes=None,
+                     filters=None):
+        return self.call("remove_roots", [get_full_path(root) for root in roots],
+                         regex=regex, search_dirs=search_dirs, processes=processes,
+                         filters=filters)
+
+
+    def restore(self, *names):
+        return self.call("restore", *names)
+
+
+    def restore_matching(self, prefix=None, pattern=None, since=None, until=None):
+        if prefix:
+            prefix = get_full_prefix(prefix)
+        if pattern is not None:
+            pattern = get_full_path(pattern)
+        return self.call("restore_matching", prefix, pattern, since, until)
+
+
+    def content(self, sort="name", reverse=False, prefix=None, pattern=None,
+                since=None, until=None, limit=None, offset=0):
+        if prefix:
+            prefix = get_full_prefix(prefix)
+        if pattern is not None:
+            pattern = get_full_path(pattern)
+        return self.stream("content", sort, reverse, prefix, pattern, since, until, limit,
+                           offset)
+
+
+    def clear(self):
+        return self.call("clear")
+
+
+    def recount(self):
+        return self.call("recount")
+
+
+    def fsck(self):
+        return self.call("fsck")
+
+
+    def enforce_policy(self, policy, force=False):
+        return self.call("enforce_policy", policy, force=force)
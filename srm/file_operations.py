@@ -1,12 +1,62 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
 
+import contextlib
+import errno
+import fcntl
 import os
+import stat
 
+from srm import metrics
 
-def move(src, dst, dry_run=False):
+try:
+    from os import scandir
+except ImportError:
+    def scandir(path="."):
+        """
+        The scandir backport for python < 3.5, it is slow to import,
+        so it is imported at the first call.
+        """
+        from scandir import scandir as backport_scandir
+        return backport_scandir(path)
+
+
+# Nodes are removed relative to directory file descriptors where possible
+SUPPORTS_DIR_FD = (
+    hasattr(os, "supports_fd") and os.scandir in os.supports_fd and
+    os.open in os.supports_dir_fd and os.unlink in os.supports_dir_fd and
+    os.rmdir in os.supports_dir_fd and os.stat in os.supports_dir_fd
+)
+DIR_FLAGS = os.O_RDONLY | getattr(os, "O_DIRECTORY", 0) | getattr(os, "O_NOFOLLOW", 0)
+
+COPY_CHUNK_SIZE = 8 * 1024 ** 2
+# errors after which copy_file tries the next way of copying
+COPY_FALLBACK_ERRORS = set([errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                            errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP])
+
+
+class MovedNode(tuple):
+    """
+    The tuple from the old and new paths of the moved node with its size
+    in bytes, the size known by the caller, so the node is not stated again.
+    """
+
+    def __new__(cls, src, dst, size=0):
+        moved_node = tuple.__new__(cls, (src, dst))
+        moved_node.size = size
+        return moved_node
+
+
+    def __reduce__(self):
+        return (MovedNode, (self[0], self[1], self.size))
+
+
+def move(src, dst, dry_run=False, progress=None):
     """
     Moves from src to dst.
+
+    If they are on different file systems, src is copied and removed,
+    see move_across.
     """
     src = get_full_path(src)
     dst = get_full_path(dst)
@@ -15,11 +65,141 @@ def move(src, dst, dry_run=False):
         if os.path.exists(dst) and os.path.isdir(dst) and os.path.isdir(src):
             merge_dirs(src, dst)
         else:
-            os.rename(src, dst)
+            rename(src, dst, progress)
 
     return (src, dst)
 
 
+def rename(src, dst, progress=None):
+    """
+    Renames src to dst, falls back to move_across if they are
+    on different file systems.
+    """
+    try:
+        os.rename(src, dst)
+    except OSError as exception:
+        if exception.errno != errno.EXDEV:
+            raise
+        move_across(src, dst, progress)
+
+
+def move_across(src, dst, progress=None):
+    """
+    Moves src to dst on another file system by copying and removing src.
+    See copy_node. If the copying fails, the partial dst is removed.
+    """
+    existed = os.path.lexists(dst)
+    copied = False
+    try:
+        copy_node(src, dst, progress)
+        copied = True
+    finally:
+        if not copied and not existed:
+            purge(os.path.dirname(dst), [os.path.basename(dst)])
+    purge(os.path.dirname(src), [os.path.basename(src)])
+    metrics.increment("cross_device_moves_total")
+
+
+def copy_node(src, dst, progress=None):
+    """
+    Recursively copies the file, the symlink or the dir with their modes and times.
+
+    progress - if set, it is called with the number of bytes
+               after every copied chunk.
+    """
+    src_stat = os.lstat(src)
+
+    if stat.S_ISLNK(src_stat.st_mode):
+        os.symlink(os.readlink(src), dst)
+        return
+
+    if stat.S_ISDIR(src_stat.st_mode):
+        os.mkdir(dst)
+        for entry in scandir(src):
+            copy_node(entry.path, os.path.join(dst, entry.name), progress)
+    elif stat.S_ISREG(src_stat.st_mode):
+        copy_file(src, dst, progress)
+    else:
+        raise OSError(errno.EXDEV, "Cannot copy special file", src)
+
+    import shutil
+    shutil.copystat(src, dst)
+
+
+def copy_file(src, dst, progress=None):
+    """
+    Copies the content of the file by chunks.
+
+    The copying is done in the kernel by copy_file_range or sendfile if
+    it is possible, otherwise falls back to read and write.
+    """
+    copy_methods = [copy_chunk_by_read]
+    if hasattr(os, "sendfile"):
+        copy_methods.insert(0, copy_chunk_by_sendfile)
+    if hasattr(os, "copy_file_range"):
+        copy_methods.insert(0, copy_chunk_by_range)
+
+    with open(src, "rb") as src_file:
+        with open(dst, "wb") as dst_file:
+            src_fd, dst_fd = src_file.fileno(), dst_file.fileno()
+
+            offset = 0
+            while True:
+                try:
+                    count = copy_methods[0](src_fd, dst_fd, offset, COPY_CHUNK_SIZE)
+                except OSError as exception:
+                    if exception.errno not in COPY_FALLBACK_ERRORS or len(copy_methods) == 1:
+                        raise
+                    copy_methods.pop(0)
+                    continue
+
+                if not count:
+                    break
+
+                offset += count
+                if progress is not None:
+                    progress(count)
+
+    metrics.increment("bytes_copied_total", offset)
+
+
+def copy_chunk_by_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+
+def copy_chunk_by_sendfile(src_fd, dst_fd, offset, count):
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+
+def copy_chunk_by_read(src_fd, dst_fd, offset, count):
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+
+    data = os.read(src_fd, count)
+    written = 0
+    while written < len(data):
+        written += os.write(dst_fd, data[written:])
+
+    return len(data)
+
+
+def find_mount_point(path):
+    """
+    Returns the top directory of the file system containing the path.
+    """
+    path = get_full_path(path)
+    device = os.lstat(path).st_dev
+
+    while path != os.path.dirname(path):
+        parent = os.path.dirname(path)
+        if os.lstat(parent).st_dev != device:
+            break
+        path = parent
+
+    return path
+
+
 def merge_dirs(src, dst):
     """
     Merge dirs, replace all files in dst with files from src
@@ -49,6 +229,32 @@ def get_full_path(path):
     return os.path.abspath(os.path.expanduser(path))
 
 
+@contextlib.contextmanager
+def locked(path):
+    """
+    Holds the exclusive flock of the file path + ".lock" in the block,
+    so the read-modify-write of the file by concurrent processes is serialized.
+    """
+    lock_fd = os.open(get_full_path(path) + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(lock_fd)
+
+
+def replace_file(path, text):
+    """
+    Atomically replaces the content of the file by the text,
+    the file is never read partially written.
+    """
+    path = get_full_path(path)
+    temp_path = "{path}.{pid}.tmp".format(path=path, pid=os.getpid())
+    with open(temp_path, "w") as temp_file:
+        temp_file.write(text)
+    os.rename(temp_path, path)
+
+
 def create_path(path, is_file=False):
     """
     Takes the full path to the directory or file,
@@ -65,13 +271,17 @@ def create_path(path, is_file=False):
         os.makedirs(path)
 
 
-def get_dir_size(directory):
+def get_dir_size(directory, limit=None):
     """
-    Returns the total amount of space occupied by files in the dir.
+    Returns the total amount of space occupied by files in the dir
+    or None if it has more than limit entries, the rest is not walked.
     """
-    total_size = 0
+    total_size, entries = 0, 0
 
     for root, dirs, files in os.walk(directory):
+        entries += len(files) + len(dirs)
+        if limit is not None and entries > limit:
+            return None
         for file_name in files:
             file_path = os.path.join(root, file_name)
             if not os.path.islink(file_path):
@@ -84,18 +294,162 @@ def get_dir_size(directory):
     return total_size
 
 
+def get_node_size(path, node_stat=None, limit=None):
+    """
+    Returns the amount of space occupied by the file or the dir
+    in the same way as get_dir_size counts it.
+
+    node_stat - result of os.lstat for the path if it is already known;
+    limit     - if set, None is returned for the dir with more entries.
+    """
+    if node_stat is None:
+        node_stat = os.lstat(path)
+
+    if stat.S_ISLNK(node_stat.st_mode):
+        return 0
+    if stat.S_ISDIR(node_stat.st_mode):
+        dir_size = get_dir_size(path, limit)
+        return node_stat.st_size + dir_size if dir_size is not None else None
+
+    return node_stat.st_size
+
+
 def clear_dir(directory):
     """
-    Recursively deletes all files in the specified directory
+    Recursively deletes all files in the specified directory.
+
+    Returns a tuple (removed files, freed bytes), see purge.
+    """
+    return purge(directory)
+
+
+def purge(directory, names=None, workers=1, count_bytes=False):
+    """
+    Recursively deletes the nodes with the names from the directory,
+    all nodes if names is None. Nonexistent names are ignored.
+
+    Node types are taken from the directory entries without stat, nodes
+    are removed relative to the descriptor of their dir if the platform
+    supports it.
+
+    workers     - number of threads removing top-level nodes;
+    count_bytes - if set, stats removed files to count freed bytes.
+
+    Returns a tuple (removed files, freed bytes). Dirs are not counted
+    and freed bytes are 0 unless count_bytes is set.
+    """
+    directory = get_full_path(directory)
+
+    dir_fd = None
+    if SUPPORTS_DIR_FD:
+        dir_fd = os.open(directory, DIR_FLAGS & ~getattr(os, "O_NOFOLLOW", 0))
+
+    def purge_node(node):
+        name, is_dir = node
+        if dir_fd is not None:
+            return purge_node_at(dir_fd, name, is_dir, count_bytes)
+        return purge_node_by_path(os.path.join(directory, name), is_dir, count_bytes)
+
+    pool = None
+    try:
+        nodes = list_nodes(directory if dir_fd is None else dir_fd, names)
+
+        if workers > 1 and len(nodes) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(workers)
+            results = pool.imap_unordered(purge_node, nodes)
+        else:
+            results = (purge_node(node) for node in nodes)
+
+        removed_files, freed_bytes = 0, 0
+        for files, size in results:
+            removed_files += files
+            freed_bytes += size
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if dir_fd is not None:
+            os.close(dir_fd)
+
+    metrics.increment("files_unlinked_total", removed_files)
+    return (removed_files, freed_bytes)
+
+
+def list_nodes(directory, names=None):
+    """
+    Returns a list of tuples (name, is_dir) for the directory
+    given by path or descriptor.
+    """
+    if names is None:
+        return [(entry.name, entry.is_dir(follow_symlinks=False))
+                for entry in scandir(directory)]
+
+    nodes = []
+    for name in names:
+        try:
+            if isinstance(directory, int):
+                node_stat = os.stat(name, dir_fd=directory, follow_symlinks=False)
+            else:
+                node_stat = os.lstat(os.path.join(directory, name))
+        except OSError as exception:
+            if exception.errno != errno.ENOENT:
+                raise
+            continue
+
+        nodes.append((name, stat.S_ISDIR(node_stat.st_mode)))
+
+    return nodes
+
+
+def purge_node_at(dir_fd, name, is_dir, count_bytes=False):
+    """
+    Removes the node relative to the dir descriptor.
+    Returns a tuple (removed files, freed bytes).
     """
-    for node in os.listdir(directory):
-        full_path = os.path.join(directory, node)
+    if not is_dir:
+        size = 0
+        if count_bytes:
+            size = os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_size
+        os.unlink(name, dir_fd=dir_fd)
+        return (1, size)
+
+    removed_files, freed_bytes = 0, 0
+
+    fd = os.open(name, DIR_FLAGS, dir_fd=dir_fd)
+    try:
+        for entry in list(scandir(fd)):
+            files, size = purge_node_at(fd, entry.name,
+                                        entry.is_dir(follow_symlinks=False), count_bytes)
+            removed_files += files
+            freed_bytes += size
+    finally:
+        os.close(fd)
+
+    os.rmdir(name, dir_fd=dir_fd)
+    return (removed_files, freed_bytes)
+
+
+def purge_node_by_path(path, is_dir, count_bytes=False):
+    """
+    Removes the node by the full path.
+    Returns a tuple (removed files, freed bytes).
+    """
+    if not is_dir:
+        size = os.lstat(path).st_size if count_bytes else 0
+        os.remove(path)
+        return (1, size)
+
+    removed_files, freed_bytes = 0, 0
+    for entry in list(scandir(path)):
+        files, size = purge_node_by_path(entry.path,
+                                         entry.is_dir(follow_symlinks=False), count_bytes)
+        removed_files += files
+        freed_bytes += size
+
+    os.rmdir(path)
+    return (removed_files, freed_bytes)
 
-        if os.path.isfile(full_path) or os.path.islink(full_path):
-            os.remove(full_path)
-        elif os.path.isdir(full_path):
-            clear_dir(full_path)
-            os.rmdir(full_path)
 
 def cut_leafs(*tree):
     """
@@ -2,34 +2,188 @@
 # -*- coding: utf-8 -*-
 
 
+import json
 import logging
+import os
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 
 from srm.file_operations import get_full_path
 
 
-def setup_console_logger(str_format="%(levelname)s: %(message)s", level=logging.INFO):
+# records waiting for the background thread, emit blocks when it is full
+QUEUE_SIZE = 10000
+# attributes of the records passed in extra and written by JsonFormatter
+STRUCTURED_FIELDS = ("event", "src", "dst", "item")
+
+
+class BackgroundHandler(logging.Handler):
     """
-    Setup console logger.
+    Passes the records through the queue to the handler in the background
+    thread, so the caller does not wait for formatting and writing.
+
+    The queue is drained on flush and close, logging.shutdown does it at exit.
+    """
+
+    def __init__(self, handler, queue_size=QUEUE_SIZE):
+        logging.Handler.__init__(self, handler.level)
+        self.handler = handler
+        self.queue = queue.Queue(queue_size)
+
+        self.thread = threading.Thread(target=self.process)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def emit(self, record):
+        self.queue.put(record)
+
+
+    def process(self):
+        while True:
+            record = self.queue.get()
+            try:
+                if record is None:
+                    break
+                self.handler.handle(record)
+            finally:
+                self.queue.task_done()
+
+
+    def flush(self):
+        if self.thread.is_alive():
+            self.queue.join()
+        self.handler.flush()
+
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.handler.close()
+        logging.Handler.close(self)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the record as a compact JSON line with the time, the level,
+    the message and the STRUCTURED_FIELDS given in extra.
+    """
+
+    def format(self, record):
+        entry = {"time": round(record.created, 3), "level": record.levelname}
+        if getattr(record, "event", None) is None:
+            entry["message"] = record.getMessage()
+        for field in STRUCTURED_FIELDS:
+            if getattr(record, field, None) is not None:
+                entry[field] = getattr(record, field)
+
+        return json.dumps(entry, sort_keys=True, separators=(",", ":"))
+
+
+class MoveSummary(object):
+    """
+    The object of this class aggregates the moved nodes by their directories,
+    so a bulk operation is logged by a line per directory instead of per node.
+    """
+
+    def __init__(self):
+        self.directories = {}
+
+
+    def add(self, directory, size):
+        counts = self.directories.setdefault(directory, [0, 0])
+        counts[0] += 1
+        counts[1] += size
+
+
+    def log(self, action, preposition="in", level=logging.INFO):
+        """
+        Logs the count and the bytes of the nodes of every directory.
+        """
+        for directory, (count, size) in sorted(self.directories.items()):
+            msg = '{action} {count} items, {size} bytes {preposition} "{directory}".'.format(
+                action=action, count=count, size=size, preposition=preposition,
+                directory=directory)
+            logging.log(level, msg)
+
+
+def log_moved_files(moved_files, action, event, by_source=True):
+    """
+    Logs the tuples (src, dst) of the moved nodes from the iterable
+    as they are moved: a DEBUG record per node and the INFO summary
+    per directory of src or, unless by_source, of dst, see MoveSummary.
+
+    Sizes are taken from the tuples, see srm.file_operations.MovedNode,
+    nodes are not stated. Return the number of moved nodes.
     """
     root_logger = logging.getLogger()
-    formatter = logging.Formatter(str_format)
+    per_node = root_logger.isEnabledFor(logging.DEBUG)
+
+    summary, count = MoveSummary(), 0
+    try:
+        for src_dst in moved_files:
+            src, dst = src_dst
+            count += 1
+            summary.add(os.path.dirname(src if by_source else dst), getattr(src_dst, "size", 0))
 
-    shandler = logging.StreamHandler()
-    shandler.setLevel(level)
-    shandler.setFormatter(formatter)
+            if per_node:
+                msg = '{action} from "{src}" to "{dst}".'.format(action=action, src=src, dst=dst)
+                root_logger.debug(msg, extra={"event": event, "src": src, "dst": dst})
+    finally:
+        # the nodes moved before an error are summarized too
+        summary.log(action, "from" if by_source else "to")
 
-    root_logger.addHandler(shandler)
-    root_logger.setLevel(level)
+    return count
+
+
+def log_conflicts(names):
+    """
+    Warns of the trashinfo items left in the json layout, see TrashInfo.conflicts.
+    """
+    for name in names:
+        msg = 'Trashinfo "{name}" is not migrated, the name is taken already.'.format(name=name)
+        logging.warning(msg, extra={"event": "conflict", "item": name})
 
 
-def setup_file_logger(filename="", str_format="%(levelname)s: %(message)s", level=logging.INFO):
-    """Setup file logger"""
+def add_handler(handler, str_format, level, background):
     root_logger = logging.getLogger()
-    formatter = logging.Formatter(str_format)
+    if not isinstance(handler.formatter, JsonFormatter):
+        handler.setFormatter(logging.Formatter(str_format))
+    handler.setLevel(level)
+
+    if background:
+        handler = BackgroundHandler(handler)
+
+    root_logger.addHandler(handler)
+    # the root level passes the records of the most verbose handler
+    root_logger.setLevel(min(root_logger.level or logging.WARNING, level))
+
+
+def setup_console_logger(str_format="%(levelname)s: %(message)s", level=logging.INFO,
+                         background=False):
+    """
+    Setup console logger.
 
+    background - if set, records are written in the background thread,
+                 see BackgroundHandler.
+    """
+    add_handler(logging.StreamHandler(), str_format, level, background)
+
+
+def setup_file_logger(filename="", str_format="%(levelname)s: %(message)s", level=logging.INFO,
+                      background=False, structured=False):
+    """
+    Setup file logger.
+
+    structured - if set, records are written as JSON lines, see JsonFormatter.
+    """
     fhandler = logging.FileHandler(get_full_path(filename))
-    fhandler.setLevel(level)
-    fhandler.setFormatter(formatter)
+    if structured:
+        fhandler.setFormatter(JsonFormatter())
 
-    root_logger.addHandler(fhandler)
-    root_logger.setLevel(level)
+    add_handler(fhandler, str_format, level, background)
@@ -8,20 +8,33 @@ Module for working with Remover in console
 
 
 import argparse
+import datetime
+import itertools
+import json
 import logging
 import os
 import sys
-import pytoml
 
 from srm.remove_policy import RemovePolicy
-from srm.logger_tools import setup_console_logger, setup_file_logger
+from srm.logger_tools import (
+    setup_console_logger, setup_file_logger, log_moved_files, log_conflicts
+)
+from srm.file_operations import get_full_path, locked
+from srm.trashinfo import SORT_FIELDS
 from srm.config_operations import(
     create_config,
     load_config,
     update_config,
     cat_config
 )
-from srm.wastebasket_manager import WasteBasketManager
+from srm.wastebasket_manager import(
+    WasteBasketManager,
+    EVICTION_ORDERS,
+    COMPRESSIONS,
+    HIGH_WATERMARK,
+    LOW_WATERMARK
+)
+from srm import daemon_client, metrics
 from srm.exit_codes import ExitCode
 from srm.move_error import MoveError
 from srm.timedelta_parser import parse_timedelta
@@ -33,6 +46,8 @@ WASTEBASKET_PATH = os.path.expanduser("~/Trash")
 POLICY = RemovePolicy.SIZE
 STORAGE_TIME = "30 days, 0:0:0"
 MAX_SIZE = 32.0
+PROGRESS_STEP = 256 * 1024 ** 2
+SIZE_SUFFIXES = "KMG"
 
 def srm_process(func):
     def srm_process_wrapper():
@@ -44,7 +59,9 @@ def srm_process(func):
             exit_code = ExitCode.MOVE_ERROR
         except KeyboardInterrupt as exception:
             exit_code = ExitCode.SIGINT
-        except pytoml.core.TomlError as exception:
+        except Exception as exception:
+            if not is_toml_error(exception):
+                raise
             logging.error("Cannot parse like toml.")
             exit_code = ExitCode.INCORRECT_CONFIG_FORMAT
 
@@ -53,6 +70,109 @@ def srm_process(func):
     return srm_process_wrapper
 
 
+def is_toml_error(exception):
+    """
+    Returns True if the exception is raised by the toml parser.
+
+    The parser is imported only for toml configs, so if it is not
+    imported, the exception is not its.
+    """
+    pytoml = sys.modules.get("pytoml")
+    return pytoml is not None and isinstance(exception, pytoml.core.TomlError)
+
+
+def create_progress_logger(step=PROGRESS_STEP):
+    """
+    Returns a function logging the number of bytes copied between
+    file systems after every step bytes.
+    """
+    copied_bytes = [0]
+
+    def log_progress(count):
+        previous_steps = copied_bytes[0] // step
+        copied_bytes[0] += count
+        if copied_bytes[0] // step > previous_steps:
+            msg = "Copied {size} MB between file systems.".format(size=copied_bytes[0] // 1024 ** 2)
+            logging.info(msg)
+
+    return log_progress
+
+
+def write_content(items, stream, output="text", short=False, in_lines=False):
+    """
+    Writes the WasteBasket items from the iterable of (name, trashinfo)
+    to the stream as they are read.
+
+    output - "json" for JSON line per item, "null" for names separated by NUL,
+             "text" for names or, unless short, lines of the item fields.
+    """
+    separator = "\n" if in_lines or not short else ", "
+    for index, (name, trashinfo) in enumerate(items):
+        if output == "json":
+            record = dict(trashinfo, name=name)
+            stream.write(json.dumps(record, sort_keys=True) + "\n")
+            continue
+        if output == "null":
+            stream.write(name + "\0")
+            continue
+
+        line = name
+        if not short:
+            line = '{name}: "{path}", deleted {date}, {size} bytes'.format(
+                name=name, path=trashinfo["old path"],
+                date=trashinfo["deletion date"], size=trashinfo["size"])
+        stream.write((separator if index else "") + line)
+
+    if output == "text":
+        stream.write("\n")
+    stream.flush()
+
+
+def parse_size(text):
+    """
+    Return the number of bytes of the size like 100, 10K, 5M or 1G.
+    """
+    text = text.strip().upper()
+    multiplier = 1
+    if text and text[-1] in SIZE_SUFFIXES:
+        multiplier = 1024 ** (SIZE_SUFFIXES.index(text[-1]) + 1)
+        text = text[:-1]
+
+    try:
+        return int(float(text) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid size: {text}".format(text=text))
+
+
+def get_filters(args):
+    """
+    Return a dictionary of the predicates of the regex search.
+    """
+    filters = {}
+    if args.older_than:
+        filters["older_than"] = parse_timedelta(args.older_than)
+    if args.larger_than is not None:
+        filters["larger_than"] = args.larger_than
+    if args.node_type:
+        filters["node_type"] = args.node_type
+    if args.exclude:
+        filters["exclude"] = [get_full_pattern(pattern) for pattern in args.exclude]
+
+    return filters
+
+
+def get_full_pattern(pattern):
+    """
+    Return the full path of the exclude pattern with a separator, see make_exclude
+    of srm.tree_walker, the trailing glob is kept. The patterns of names and
+    the patterns starting by a glob, matching anywhere, are returned as they are.
+    """
+    if os.sep not in pattern or pattern[0] in "*?[":
+        return pattern
+
+    return get_full_path(pattern)
+
+
 def create_parser():
     """
     Returns an ArgumentParser with arguments added
@@ -61,12 +181,28 @@ def create_parser():
 
     parser.add_argument("--restore", action="store_true",
                         help="Action for work")
+    parser.add_argument("--prefix",
+                        help="Restores or shows the items deleted from the paths \
+                        starting with the prefix")
+    parser.add_argument("--glob",
+                        help="Restores or shows the items deleted from the paths \
+                        matching the glob pattern")
+    parser.add_argument("--deleted-within",
+                        help="Restores or shows the items deleted not earlier than \
+                        the given time ago. Format: 0 days, 1:0:0")
     parser.add_argument("--silent", action="store_true",
                         help="Don't show the actions performed")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Shows every moved file instead of the summary per directory")
     parser.add_argument("--dry-run", action="store_true",
                         help="Simulates action to be performed on console")
     parser.add_argument("--force", action="store_true",
                         help="Ignore non-existent files and arguments")
+    parser.add_argument("--save-plan",
+                        help="Plans the removal without changes and writes the plan \
+                        to the given file")
+    parser.add_argument("--apply-plan",
+                        help="Removes the items of the plan written by --save-plan")
     parser.add_argument("--wastebasket-path", default=WASTEBASKET_PATH,
                         help="Sets the path to the wastebasket")
 
@@ -74,6 +210,22 @@ def create_parser():
                         help="Remove directories")
     parser.add_argument("--regex", action="store_true",
                         help="Remove nodes by regular expression")
+    parser.add_argument("--older-than",
+                        help="With --regex, removes only the nodes modified earlier than \
+                        the given time ago. Format: 0 days, 1:0:0")
+    parser.add_argument("--larger-than", type=parse_size,
+                        help="With --regex, removes only the nodes larger than the given \
+                        size, in bytes or with the suffix K, M, G")
+    parser.add_argument("--type", choices=("d", "f", "l"), dest="node_type",
+                        help="With --regex, removes only the files, dirs or symlinks")
+    parser.add_argument("--exclude", action="append", default=[],
+                        help="With --regex, skips the nodes and the subtrees matching \
+                        the glob pattern by the name or, with a separator, by the path")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Number of threads searching by regular expression and purging")
+    parser.add_argument("-P", "--processes", type=int, default=1,
+                        help="Number of processes removing the paths or the regex roots "
+                             "in parallel, 0 starts one per device of the roots")
 
     parser.add_argument("--content", action="store_true",
                         help="Shows the wastebasket contents")
@@ -81,8 +233,25 @@ def create_parser():
                        help="Shows the wastebasket contents")
     parser.add_argument("--in-lines", action="store_true",
                         help="Shows the wastebasket contents")
+    parser.add_argument("--sort", choices=sorted(SORT_FIELDS), default="name",
+                        help="Sorts the wastebasket contents")
+    parser.add_argument("--reverse", action="store_true",
+                        help="Sorts the wastebasket contents in the reverse order")
+    parser.add_argument("--limit", type=int,
+                        help="Shows at most the given number of items")
+    parser.add_argument("--offset", type=int, default=0,
+                        help="Skips the given number of items")
+    parser.add_argument("--json", action="store_true",
+                        help="Shows the wastebasket contents as JSON lines")
+    parser.add_argument("-0", "--null", action="store_true",
+                        help="Shows the names of the wastebasket items separated by NUL")
     parser.add_argument("--clear", action="store_true",
                         help="Clear WasteBasket")
+    parser.add_argument("--recount", action="store_true",
+                        help="Recount the WasteBasket size")
+    parser.add_argument("--fsck", action="store_true",
+                        help="Adopts the removed files without trashinfo and drops \
+                        the trashinfo without removed files")
 
     parser.add_argument("--update-config", action="store_true",
                         help="Update config file")
@@ -98,11 +267,36 @@ def create_parser():
                         help="Sets the clean policy")
     parser.add_argument("--max-size", type=float, default=MAX_SIZE,
                         help="Sets the maximum volume value for the wastebasket (in GB)")
+    parser.add_argument("--eviction", choices=EVICTION_ORDERS,
+                        help="Removes items in the given order instead of clearing \
+                        the wastebasket when the maximum volume is exceeded")
+    parser.add_argument("--high-watermark", type=float, default=HIGH_WATERMARK,
+                        help="Part of the maximum volume above which the size policy is applied")
+    parser.add_argument("--low-watermark", type=float, default=LOW_WATERMARK,
+                        help="Part of the maximum volume to which items are evicted")
+    parser.add_argument("--enforce-now", action="store_true",
+                        help="Checks the cleaning policy even if the check interval \
+                        has not passed")
     parser.add_argument("--storage-time", default=STORAGE_TIME,
                         help="Determines how long the files should \
                         be stored from the time of deletion. Format: 2017-08-09T23:59:03")
+    parser.add_argument("--ttl",
+                        help="Determines how long the removed files should be stored \
+                        regardless of the storage time. Format: 30 days, 0:0:0")
+    parser.add_argument("--cold-after",
+                        help="Packs the files removed earlier than the given time ago \
+                        into compressed archives. Format: 7 days, 0:0:0")
+    parser.add_argument("--compression", choices=COMPRESSIONS, default=COMPRESSIONS[0],
+                        help="Compression of the archives of the removed files")
 
     parser.add_argument("--log", help="Specifies the path to log file.")
+    parser.add_argument("--log-format", choices=("text", "json"), default="text",
+                        help="Format of the log file, json logs every moved file \
+                        as a compact JSON line")
+    parser.add_argument("--metrics-file",
+                        help="Writes the metrics of the runs to the file in the Prometheus \
+                        text format for the node_exporter textfile collector. \
+                        With srmd running, the metrics are written by srmd")
 
     parser.add_argument("paths", nargs='*', help="Name of the file(s) or directory(ies) to restore")
 
@@ -192,7 +386,7 @@ def main():
     """
     args = create_parser().parse_args()
 
-    if not os.path.exists(CONFIG_PATH):
+    if not os.path.exists(get_full_path(args.config)):
         create_config(args.config, get_args_from_console(args))
 
     if args.create_config:
@@ -201,58 +395,152 @@ def main():
         update_config(args.config, get_args_from_console(args))
 
     working_args_dict = get_merged_args(args)
+    # records are written in background, per-file records are DEBUG
+    verbose_level = logging.DEBUG if args.verbose else logging.INFO
     if not working_args_dict["silent"]:
-        setup_console_logger()
+        setup_console_logger(level=verbose_level, background=True)
     if args.log:
-        setup_file_logger(filename=args.log)
+        structured = args.log_format == "json"
+        setup_file_logger(filename=args.log, background=True, structured=structured,
+                          level=logging.DEBUG if structured else verbose_level)
 
     if args.cat_config:
         cat_config(args.config)
 
     wastebasket_args = get_wastebasket_args(working_args_dict)
     wastebasket_args["storage_time"] = parse_timedelta(wastebasket_args["storage_time"])
-    wastebasket = WasteBasketManager(**wastebasket_args)
-
-    if working_args_dict["cleaning_policy"] == RemovePolicy.SIZE:
-        if wastebasket.clear_by_size_policy():
-            logging.info("WasteBasket was cleaned.")
-    elif working_args_dict["cleaning_policy"] == RemovePolicy.TIME:
-        auto_removed_files = wastebasket.clear_by_time_policy()
-        for filename in auto_removed_files:
-            msg = "Auto-removed {name}".format(name=filename)
-            logging.info(msg)
+    if args.ttl:
+        wastebasket_args["ttl"] = parse_timedelta(args.ttl)
+    if args.cold_after:
+        wastebasket_args["cold_after"] = parse_timedelta(args.cold_after)
+    wastebasket_args["compression"] = args.compression
+    wastebasket_args["eviction"] = args.eviction
+    wastebasket_args["high_watermark"] = args.high_watermark
+    wastebasket_args["low_watermark"] = args.low_watermark
+    wastebasket_args["workers"] = args.jobs
+    if args.save_plan:
+        # planning changes nothing, the policy is only simulated too
+        wastebasket_args["dry_run"] = True
+    wastebasket_args["background_clear"] = True
+    wastebasket_args["progress"] = create_progress_logger()
+    # the daemon is used if it is running, see srm.daemon,
+    # plans are made and applied here, names are taken atomically anyway
+    wastebasket = None
+    if not (args.save_plan or args.apply_plan):
+        wastebasket = daemon_client.connect(**wastebasket_args)
+    if wastebasket is None:
+        wastebasket = WasteBasketManager(**wastebasket_args)
+        log_conflicts(wastebasket.trashinfo.conflicts)
+
+    try:
+        run_actions(args, working_args_dict, wastebasket)
+    finally:
+        if args.metrics_file and isinstance(wastebasket, WasteBasketManager):
+            write_metrics(args.metrics_file, wastebasket)
+
+
+def write_metrics(path, wastebasket):
+    """
+    Adds the metrics of this run to the metrics file, see srm.metrics.
+    The file is locked while it is merged, so concurrent runs lose no counts.
+    """
+    metrics.set_gauge("wastebasket_size_bytes", wastebasket.total_size())
+    with locked(path):
+        metrics.load_textfile(path)
+        metrics.write_textfile(path)
+
+
+def run_actions(args, working_args_dict, wastebasket):
+    """
+    Performs the actions of the arguments with the WasteBasket.
+    """
+    if args.fsck:
+        adopted_names, dropped_names = wastebasket.fsck()
+        for name in adopted_names:
+            msg = "Adopted {name}".format(name=name)
+            logging.debug(msg, extra={"event": "adopted", "item": name})
+        for name in dropped_names:
+            msg = "Dropped trashinfo of {name}".format(name=name)
+            logging.debug(msg, extra={"event": "dropped", "item": name})
+        msg = "Adopted {adopted} removed files, dropped {dropped} trashinfo items.".format(
+            adopted=len(adopted_names), dropped=len(dropped_names))
+        logging.info(msg)
+
+    if args.recount:
+        msg = "WasteBasket size is {size} bytes.".format(size=wastebasket.recount())
+        logging.info(msg)
+
+    cleaned, auto_removed_files = wastebasket.enforce_policy(
+        working_args_dict["cleaning_policy"], force=args.enforce_now)
+    if cleaned:
+        logging.info("WasteBasket was cleaned.")
+
+    for filename in auto_removed_files:
+        msg = "Auto-removed {name}".format(name=filename)
+        logging.debug(msg, extra={"event": "auto-removed", "item": filename})
+    if auto_removed_files:
+        msg = "Auto-removed {count} items.".format(count=len(auto_removed_files))
+        logging.info(msg)
+
+    since = None
+    if args.deleted_within:
+        since = datetime.datetime.now() - parse_timedelta(args.deleted_within)
 
     if working_args_dict["content"]:
-        short = working_args_dict["short"]
-        in_lines = working_args_dict["in_lines"]
-        
-        separator = "\n" if in_lines else ", "
-        
-        wastebasket_content = unicode(wastebasket.trashinfo)
-        if short:
-            wastebasket_content = separator.join(wastebasket.trashinfo.iterkeys())
-        
-        logging.info(wastebasket_content)
-        
+        output = "json" if args.json else "null" if args.null else "text"
+        items = wastebasket.content(args.sort, args.reverse, args.prefix, args.glob, since,
+                                    limit=args.limit, offset=args.offset)
+        write_content(items, sys.stdout, output,
+                      working_args_dict["short"], working_args_dict["in_lines"])
+
     if working_args_dict["clear"]:
-        wastebasket.clear()
+        removed_files, freed_bytes = wastebasket.clear()
+        if working_args_dict["dry_run"] or args.save_plan:
+            msg = "WasteBasket would be cleared: {size} bytes would be freed.".format(
+                size=freed_bytes)
+        elif removed_files is None:
+            msg = "WasteBasket was cleared: {size} bytes are freed in background.".format(
+                size=freed_bytes)
+        else:
+            msg = "WasteBasket was cleared: {count} files, {size} bytes are freed.".format(
+                count=removed_files, size=freed_bytes)
+        logging.info(msg)
 
     if working_args_dict["restore"]:
-        moved_files = wastebasket.restore(*args.paths)
-        for src, dst in moved_files:
-            msg = 'Restored from "{src}" to "{dst}".'.format(src=src, dst=dst)
+        if args.prefix or args.glob or since is not None:
+            moved_files = wastebasket.restore_matching(args.prefix, args.glob, since)
+        else:
+            moved_files = wastebasket.restore(*args.paths)
+        log_moved_files(moved_files, "Restored", "restored", by_source=False)
+    elif args.save_plan:
+        paths = args.paths
+        if working_args_dict["regex"]:
+            paths = itertools.chain.from_iterable(
+                wastebasket.find_regex(pattern, search_dirs=True, filters=get_filters(args))
+                for pattern in args.paths)
+        plan = wastebasket.plan_remove(paths)
+        plan.save(args.save_plan)
+
+        for wastebasket_path, (count, size) in sorted(plan.summary().items()):
+            msg = 'Planned {count} items, {size} bytes to "{path}".'.format(
+                count=count, size=size, path=wastebasket_path)
             logging.info(msg)
+    elif args.apply_plan:
+        from srm.plan import load_plan
+
+        moved_files = wastebasket.apply_plan(load_plan(args.apply_plan))
+        log_moved_files(moved_files, "Removed", "removed")
     else:
+        processes = args.processes or None
         if working_args_dict["regex"] and args.paths:
-            moved_files = wastebasket.remove_regex(args.paths[0], search_dirs=True)
-            for src, dst in moved_files:
-                msg = 'Removed from "{src}" to "{dst}".'.format(src=src, dst=dst)
-                logging.info(msg)
+            moved_files = wastebasket.remove_roots(args.paths, regex=True, search_dirs=True,
+                                                   processes=processes,
+                                                   filters=get_filters(args))
+        elif processes != 1 and len(args.paths) > 1:
+            moved_files = wastebasket.remove_roots(args.paths, processes=processes)
         else:
-            moved_files = wastebasket.remove(*args.paths)
-            for src, dst in moved_files:
-                msg = 'Removed from "{src}" to "{dst}".'.format(src=src, dst=dst)
-                logging.info(msg)
+            moved_files = wastebasket.remove_many(args.paths)
+        log_moved_files(moved_files, "Removed", "removed")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module keeps the metrics of srm operations in the process.
+
+Counters, gauges and latency histograms of METRICS are kept in
+the registry, REGISTRY by default, and written in the Prometheus text
+format, so node_exporter collects them by its textfile collector.
+Values are updated once per batch, not per file.
+"""
+
+
+import contextlib
+import errno
+import os
+import re
+import threading
+import time
+
+
+PREFIX = "srm_"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0, 120.0)
+
+# name: (type, help)
+METRICS = {
+    "items_removed_total": ("counter", "Items moved into the WasteBasket."),
+    "bytes_removed_total": ("counter", "Bytes of the items moved into the WasteBasket."),
+    "items_restored_total": ("counter", "Items restored from the WasteBasket."),
+    "items_purged_total": ("counter", "Items removed from the WasteBasket permanently."),
+    "bytes_purged_total": ("counter", "Bytes freed by the permanent removal of items."),
+    "items_archived_total": ("counter", "Items packed into the cold tier."),
+    "files_unlinked_total": ("counter", "Files unlinked by purging directories."),
+    "cross_device_moves_total": ("counter", "Nodes copied between file systems."),
+    "bytes_copied_total": ("counter", "Bytes copied between file systems."),
+    "errors_total": ("counter", "Failed operations by the operation and the error."),
+    "operation_seconds": ("histogram", "Latency of the operations, remove and restore by batch."),
+    "wastebasket_size_bytes": ("gauge", "Total size of the WasteBasket."),
+}
+
+SAMPLE_PATTERN = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$")
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def error_name(exception):
+    """
+    Return the errno name of the exception, like ENOENT,
+    or the name of its class.
+    """
+    code = getattr(exception, "errno", None)
+    return errno.errorcode.get(code, type(exception).__name__)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+
+    return "{" + ",".join('{name}="{value}"'.format(
+        name=name, value=str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels) + "}"
+
+
+def parse_labels(text):
+    return tuple(sorted((name, value.replace('\\"', '"').replace("\\\\", "\\"))
+                        for name, value in LABEL_PATTERN.findall(text or "")))
+
+
+class Histogram(object):
+    """
+    The latency histogram, bucket counts are cumulative
+    like in the text format.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry(object):
+    """
+    The object of this class keeps the values of METRICS by their labels.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.histograms = {}
+
+
+    def key(self, name, labels):
+        if name not in METRICS:
+            raise KeyError("Unknown metric {name}".format(name=name))
+        return (name, tuple(sorted(labels.items())))
+
+
+    def increment(self, name, value=1, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+    def set(self, name, value, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.values[key] = value
+
+
+    def observe(self, name, seconds, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """
+        Observes the time spent in the with block.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+
+    def get(self, name, **labels):
+        """
+        Return the value of the counter or the gauge, 0 if it is not set,
+        or the Histogram.
+        """
+        key = self.key(name, labels)
+        if METRICS[name][0] == "histogram":
+            return self.histograms.get(key)
+        return self.values.get(key, 0)
+
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.histograms.clear()
+
+
+    def to_text(self):
+        """
+        Return the metrics in the Prometheus text format.
+        """
+        with self.lock:
+            lines = []
+            for name in sorted(METRICS):
+                kind, description = METRICS[name]
+                full_name = PREFIX + name
+                if kind == "histogram":
+                    samples = sorted((key[1], histogram) for key, histogram
+                                     in self.histograms.items() if key[0] == name)
+                else:
+                    samples = sorted((key[1], value) for key, value
+                                     in self.values.items() if key[0] == name)
+                if not samples:
+                    continue
+
+                lines.append("# HELP {name} {help}".format(name=full_name, help=description))
+                lines.append("# TYPE {name} {type}".format(name=full_name, type=kind))
+                for labels, value in samples:
+                    if kind != "histogram":
+                        lines.append("{name}{labels} {value}".format(
+                            name=full_name, labels=format_labels(labels), value=value))
+                        continue
+
+                    bounds = [repr(float(bound)) for bound in value.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, value.counts + [value.count]):
+                        lines.append("{name}_bucket{labels} {count}".format(
+                            name=full_name, labels=format_labels(labels + (("le", bound),)),
+                            count=count))
+                    lines.append("{name}_sum{labels} {sum!r}".format(
+                        name=full_name, labels=format_labels(labels), sum=value.sum))
+                    lines.append("{name}_count{labels} {count}".format(
+                        name=full_name, labels=format_labels(labels), count=value.count))
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+    def merge_text(self, text):
+        """
+        Adds the counters and the histograms of the text format to the registry,
+        gauges are taken if they are not set. Unknown samples are ignored.
+        """
+        for line in text.splitlines():
+            match = SAMPLE_PATTERN.match(line.strip())
+            if match is None:
+                continue
+            sample_name, labels, value = match.groups()
+            if not sample_name.startswith(PREFIX):
+                continue
+            self.merge_sample(sample_name[len(PREFIX):], parse_labels(labels), float(value))
+
+
+    def merge_sample(self, sample_name, labels, value):
+        for suffix in ("_bucket", "_sum", "_count"):
+            name = sample_name[:-len(suffix)]
+            if sample_name.endswith(suffix) and METRICS.get(name, ("",))[0] == "histogram":
+                break
+        else:
+            name, suffix = sample_name, None
+
+        if name not in METRICS:
+            return
+        kind = METRICS[name][0]
+
+        with self.lock:
+            if kind == "counter":
+                key = (name, labels)
+                self.values[key] = self.values.get(key, 0) + int(value)
+            elif kind == "gauge":
+                self.values.setdefault((name, labels), value)
+            elif suffix is not None:
+                bound = dict(labels).get("le")
+                labels = tuple(label for label in labels if label[0] != "le")
+                histogram = self.histograms.setdefault((name, labels), Histogram())
+                if suffix == "_sum":
+                    histogram.sum += value
+                elif suffix == "_count":
+                    histogram.count += int(value)
+                elif bound != "+Inf":
+                    bounds = [float(bucket) for bucket in histogram.buckets]
+                    if bound is not None and float(bound) in bounds:
+                        histogram.counts[bounds.index(float(bound))] += int(value)
+
+
+REGISTRY = Registry()
+
+
+def increment(name, value=1, **labels):
+    REGISTRY.increment(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    REGISTRY.set(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    REGISTRY.observe(name, seconds, **labels)
+
+
+def timer(name, **labels):
+    return REGISTRY.timer(name, **labels)
+
+
+def load_textfile(path, registry=REGISTRY):
+    """
+    Merges the metrics written before into the registry, see Registry.merge_text,
+    so the counters of the runs are accumulated. A missing file is ignored.
+    """
+    try:
+        with open(path) as metrics_file:
+            registry.merge_text(metrics_file.read())
+    except IOError as exception:
+        if exception.errno != errno.ENOENT:
+            raise
+
+
+def write_textfile(path, registry=REGISTRY):
+    """
+    Writes the metrics of the registry to the file for the textfile
+    collector of node_exporter. The file is replaced atomically,
+    so the collector never reads it partially written.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    temp_path = "{path}.{pid}.tmp".format(path=path, pid=os.getpid())
+    with open(temp_path, "w") as metrics_file:
+        metrics_file.write(registry.to_text())
+    os.rename(temp_path, path)
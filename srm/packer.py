@@ -0,0 +1,88 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module packs the old items of the WasteBasket into the cold tier in background.
+
+WasteBasketManager.enforce_policy does not pack the items itself, the packing
+of the large items takes long, it starts the packer instead. The packer
+packs the items removed more than cold_after ago, see
+WasteBasketManager.archive_old. Only one packer works with the WasteBasket
+at a time.
+
+Usage:
+    python -m srm.packer <wastebasket path> <metadata backend> <cold after seconds>
+                         <compression> <workers> <route devices>
+"""
+
+
+import datetime
+import os
+import subprocess
+import sys
+
+from srm.file_operations import get_full_path
+from srm.reclaimer import lock
+
+
+LOCK_NAME = "packer"
+
+
+def lock_path(wastebasket_path):
+    return os.path.join(get_full_path(wastebasket_path), LOCK_NAME)
+
+
+def spawn(wastebasket_path, metadata_backend, cold_after, compression, workers=1,
+          route_devices=True):
+    """
+    Starts the detached packer process for the WasteBasket
+    if it is not running yet.
+    """
+    lock_fd = lock(lock_path(wastebasket_path))
+    if lock_fd is None:
+        return None
+    os.close(lock_fd)
+
+    command = [sys.executable, "-m", "srm.packer", get_full_path(wastebasket_path),
+               metadata_backend, str(cold_after.total_seconds()), compression,
+               str(workers), str(int(route_devices))]
+    with open(os.devnull, "r+") as devnull:
+        return subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull,
+                                close_fds=True, preexec_fn=os.setsid)
+
+
+def pack(wastebasket_path, metadata_backend, cold_after, compression, workers=1,
+         route_devices=True):
+    """
+    Packs the items of the WasteBasket removed more than cold_after ago.
+
+    Return list of the packed filenames or None if another packer
+    works with the WasteBasket.
+    """
+    from srm.wastebasket_manager import WasteBasketManager
+
+    lock_fd = lock(lock_path(wastebasket_path))
+    if lock_fd is None:
+        return None
+
+    try:
+        wastebasket = WasteBasketManager(wastebasket_path=wastebasket_path,
+                                         metadata_backend=metadata_backend,
+                                         cold_after=cold_after, compression=compression,
+                                         workers=workers, route_devices=route_devices)
+        return wastebasket.archive_old()
+    finally:
+        os.close(lock_fd)
+
+
+def main():
+    """
+    Module entry point
+    """
+    pack(sys.argv[1], sys.argv[2], datetime.timedelta(seconds=float(sys.argv[3])),
+         sys.argv[4], int(sys.argv[5]), bool(int(sys.argv[6])))
+
+
+if __name__ == "__main__":
+    main()
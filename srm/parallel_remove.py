@@ -0,0 +1,177 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module removes independent roots in parallel by the process pool.
+
+Every worker process has its own WasteBasketManager with the settings
+of the caller and removes a shard of the roots, see shard_roots: the paths
+by remove_many at once, so their trashinfo is written by batches,
+or the patterns in turn by remove_regex. Names and trashinfo are allocated
+atomically in the shared metadata store, see TrashInfo.push_many,
+so the workers do not collide. Unless force is set, all workers stop
+at the first MoveError of any of them, like remove stops at it, see stop_event.
+Metrics of the workers are merged into the registry of the caller.
+"""
+
+
+import collections
+import multiprocessing
+import os
+
+from srm.file_operations import get_full_path
+from srm.move_error import MoveError
+from srm import metrics
+
+
+# WasteBasketManager of the worker process, see init_worker
+worker_wastebasket = None
+# multiprocessing.Event set by the worker failed without force
+stop_event = None
+
+
+def root_device(root, regex=False):
+    """
+    Return the device of the root, of the dir of the pattern if regex,
+    or None if it does not exist.
+    """
+    path = get_full_path(root)
+    if regex:
+        path = os.path.dirname(path)
+
+    try:
+        return os.lstat(path).st_dev
+    except OSError:
+        return None
+
+
+def count_processes(roots, regex=False):
+    """
+    Return the number of workers for the roots, one per device,
+    but not more than the CPUs.
+    """
+    devices = set(root_device(root, regex) for root in roots)
+    return max(1, min(len(devices), multiprocessing.cpu_count()))
+
+
+def shard_roots(roots, processes, regex=False):
+    """
+    Return at most processes lists of the roots grouped by their devices,
+    see root_device. The smallest groups are merged if there are more devices
+    than processes, the largest ones are split if there are fewer.
+    The order of the roots is kept in the lists.
+    """
+    devices = collections.OrderedDict()
+    for root in roots:
+        devices.setdefault(root_device(root, regex), []).append(root)
+
+    shards = sorted(devices.values(), key=len, reverse=True)
+    while len(shards) > processes:
+        smallest = shards.pop()
+        shards[-1].extend(smallest)
+        shards.sort(key=len, reverse=True)
+
+    while shards and len(shards) < processes and len(shards[0]) > 1:
+        largest = shards.pop(0)
+        middle = len(largest) // 2
+        shards.extend([largest[:middle], largest[middle:]])
+        shards.sort(key=len, reverse=True)
+
+    return shards
+
+
+def init_worker(settings, event):
+    global worker_wastebasket, stop_event
+    from srm.wastebasket_manager import WasteBasketManager
+
+    worker_wastebasket = WasteBasketManager(**settings)
+    stop_event = event
+
+
+def remove_paths(paths, errors):
+    """
+    Removes the paths from the iterable by remove_many of the worker
+    until MoveError is raised, it is appended to errors as a tuple
+    (message, raised path) and the other workers are stopped too.
+    The failed paths are skipped by remove_many itself if force is set.
+    Return the list of the moved files.
+    """
+    moved_files = []
+    moves = worker_wastebasket.remove_many(paths)
+    try:
+        for src_dst in moves:
+            moved_files.append(src_dst)
+            if stop_event.is_set():
+                break
+    except MoveError as exception:
+        errors.append((exception.message, exception.raised_path))
+        stop_event.set()
+    finally:
+        # trashinfo of the paths not moved yet is removed by remove_many
+        moves.close()
+
+    return moved_files
+
+
+def remove_shard(task):
+    """
+    Removes the shard of the task (roots, regex, search_dirs, filters) in the worker.
+
+    Return a tuple (moved files, error, metrics), error is a tuple
+    (message, raised path) of the first MoveError or None, metrics is the text
+    of the registry of the task. MoveError is not pickled with its fields.
+    """
+    roots, regex, search_dirs, filters = task
+    metrics.REGISTRY.clear()
+
+    moved_files, errors = [], []
+    if regex:
+        for pattern in roots:
+            if stop_event.is_set():
+                break
+            moved_files.extend(remove_paths(
+                worker_wastebasket.find_regex(pattern, search_dirs, filters=filters), errors))
+    elif not stop_event.is_set():
+        moved_files = remove_paths(roots, errors)
+
+    return (moved_files, errors[0] if errors else None, metrics.REGISTRY.to_text())
+
+
+def remove_roots(settings, roots, regex=False, search_dirs=False, processes=None,
+                 filters=None):
+    """
+    Removes the roots, or the matches of the patterns if regex,
+    by the pool of processes, see count_processes by default.
+    Every process removes a shard of the roots, see shard_roots.
+
+    settings - arguments of WasteBasketManager of the workers;
+    filters  - predicates of the regex search, see WasteBasketManager.remove_regex.
+
+    Returns a list of tuples from the old and new paths. If MoveError
+    is raised by a root, the workers stop and the first error is raised
+    with all moved files. With force the failed roots are skipped.
+    """
+    if processes is None:
+        processes = count_processes(roots, regex)
+    processes = max(1, min(processes, len(roots)))
+    tasks = [(shard, regex, search_dirs, filters)
+             for shard in shard_roots(roots, processes, regex)]
+
+    moved_files, errors = [], []
+    pool = multiprocessing.Pool(processes, init_worker, (settings, multiprocessing.Event()))
+    try:
+        for shard_moved_files, error, metrics_text in pool.imap_unordered(remove_shard, tasks):
+            moved_files.extend(shard_moved_files)
+            metrics.REGISTRY.merge_text(metrics_text)
+            if error is not None:
+                errors.append(error)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    if errors:
+        message, raised_path = errors[0]
+        raise MoveError(message=message, raised_path=raised_path, success=moved_files)
+
+    return moved_files
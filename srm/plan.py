@@ -0,0 +1,99 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module provides the plan of the removal.
+
+The plan is built by WasteBasketManager.plan_remove without any writes
+and applied later by WasteBasketManager.apply_plan without walking
+the trees again. It is saved as JSON
+    {"version", "created", "items": [item, ...]},
+the item is
+    {"path", "name", "wastebasket", "size", "device", "inode"}:
+the node, its planned name in the WasteBasket, the WasteBasket taking it,
+its size and the device and the inode the node has when it is planned.
+"""
+
+
+import datetime
+import json
+import os
+
+from srm.file_operations import MovedNode, get_full_path
+from srm.trashinfo import DATE_FORMAT
+
+
+VERSION = 1
+
+
+class Plan(object):
+    """
+    The object of this class keeps the items of the planned removal, see the module.
+    """
+
+    def __init__(self, items=None, created=None):
+        self.items = items if items is not None else []
+        self.created = created or datetime.datetime.now().strftime(DATE_FORMAT)
+
+
+    def __len__(self):
+        return len(self.items)
+
+
+    def add(self, path, name, wastebasket_path, size, node_stat):
+        self.items.append({
+            "path": path,
+            "name": name,
+            "wastebasket": wastebasket_path,
+            "size": size,
+            "device": node_stat.st_dev,
+            "inode": node_stat.st_ino
+        })
+
+
+    def total_size(self):
+        return sum(item["size"] for item in self.items)
+
+
+    def moves(self):
+        """
+        Return list of tuples from the old and the planned new paths, see MovedNode.
+        """
+        return [MovedNode(item["path"], os.path.join(item["wastebasket"], "files", item["name"]),
+                          item["size"])
+                for item in self.items]
+
+
+    def summary(self):
+        """
+        Return dictionary of the WasteBasket path: [items, bytes],
+        every WasteBasket is on its own device.
+        """
+        summary = {}
+        for item in self.items:
+            counts = summary.setdefault(item["wastebasket"], [0, 0])
+            counts[0] += 1
+            counts[1] += item["size"]
+
+        return summary
+
+
+    def save(self, path):
+        with open(get_full_path(path), "w") as plan_file:
+            json.dump({"version": VERSION, "created": self.created, "items": self.items},
+                      plan_file)
+
+
+def load_plan(path):
+    """
+    Return the Plan saved to the file or raise ValueError
+    if it is not a plan of this version.
+    """
+    with open(get_full_path(path)) as plan_file:
+        data = json.load(plan_file)
+
+    if not isinstance(data, dict) or data.get("version") != VERSION:
+        raise ValueError("{path} is not a removal plan".format(path=path))
+
+    return Plan(data["items"], data["created"])
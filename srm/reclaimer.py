@@ -0,0 +1,138 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module reclaims space of the cleared WasteBasket in background.
+
+WasteBasketManager.clear renames files/ and info/ into a generation of
+the purging dir, the reclaimer removes the generations. Only one reclaimer
+works with the purging dir at a time. Generations are staged under names
+with STAGING_PREFIX and renamed when they are complete, the reclaimer
+skips the staged ones.
+
+Usage:
+    python -m srm.reclaimer <purging dir> [<workers>]
+"""
+
+
+import errno
+import fcntl
+import os
+import subprocess
+import sys
+import time
+
+from srm.file_operations import get_full_path, purge
+
+
+STAGING_PREFIX = "."
+# seconds after which the staged generation is left by the crashed clear
+STAGING_TIMEOUT = 3600
+
+
+def lock(purging_dir):
+    """
+    Locks the purging dir for the reclaimer.
+
+    Return the descriptor of the lock file or None if it is locked by
+    another reclaimer. The lock is released by closing the descriptor.
+    """
+    lock_path = get_full_path(purging_dir) + ".lock"
+    lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError) as exception:
+        os.close(lock_fd)
+        if exception.errno in (errno.EAGAIN, errno.EACCES):
+            return None
+        raise
+
+    return lock_fd
+
+
+def is_reclaiming(purging_dir):
+    """
+    Return True if the reclaimer works with the purging dir.
+    """
+    lock_fd = lock(purging_dir)
+    if lock_fd is None:
+        return True
+
+    os.close(lock_fd)
+    return False
+
+
+def ready_generations(purging_dir):
+    """
+    Return list of the names of the complete generations of the purging dir
+    and of the staged ones left by the crashed clear.
+    """
+    now = time.time()
+    generations = []
+    for name in os.listdir(purging_dir):
+        if name.startswith(STAGING_PREFIX):
+            try:
+                staged_time = os.lstat(os.path.join(purging_dir, name)).st_mtime
+            except OSError:
+                continue
+            if now - staged_time < STAGING_TIMEOUT:
+                continue
+        generations.append(name)
+
+    return generations
+
+
+def reclaim(purging_dir, workers=1):
+    """
+    Removes all generations of the purging dir, including ones left
+    by the crashed reclaimers.
+
+    Return the number of removed files or None if another reclaimer
+    works with the purging dir.
+    """
+    lock_fd = lock(purging_dir)
+    if lock_fd is None:
+        return None
+
+    removed_files = 0
+    try:
+        generations = ready_generations(purging_dir)
+        while generations:
+            for generation in generations:
+                path = os.path.join(purging_dir, generation)
+                removed_files += purge(path, workers=workers)[0]
+                os.rmdir(path)
+
+            generations = ready_generations(purging_dir)
+    finally:
+        os.close(lock_fd)
+
+    return removed_files
+
+
+def spawn(purging_dir, workers=1):
+    """
+    Starts the detached reclaimer process for the purging dir
+    if it is not running yet.
+    """
+    if is_reclaiming(purging_dir):
+        return None
+
+    command = [sys.executable, "-m", "srm.reclaimer", get_full_path(purging_dir), str(workers)]
+    with open(os.devnull, "r+") as devnull:
+        return subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull,
+                                close_fds=True, preexec_fn=os.setsid)
+
+
+def main():
+    """
+    Module entry point
+    """
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    reclaim(sys.argv[1], workers)
+
+
+if __name__ == "__main__":
+    main()
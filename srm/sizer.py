@@ -0,0 +1,81 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module records the sizes of the large dirs of the WasteBasket in background.
+
+WasteBasketManager.remove does not walk the dirs with more entries than
+SIZE_WALK_LIMIT, they are recorded with 0 bytes and their sizes are pending,
+see TrashInfo.pending_sizes. The sizer walks them in files/ and records
+their sizes, see WasteBasketManager.size_pending. Only one sizer works
+with the WasteBasket at a time.
+
+Usage:
+    python -m srm.sizer <wastebasket path> <metadata backend>
+"""
+
+
+import os
+import subprocess
+import sys
+
+from srm.file_operations import get_full_path
+from srm.reclaimer import lock
+
+
+LOCK_NAME = "sizer"
+
+
+def lock_path(wastebasket_path):
+    return os.path.join(get_full_path(wastebasket_path), LOCK_NAME)
+
+
+def spawn(wastebasket_path, metadata_backend):
+    """
+    Starts the detached sizer process for the WasteBasket
+    if it is not running yet.
+    """
+    lock_fd = lock(lock_path(wastebasket_path))
+    if lock_fd is None:
+        return None
+    os.close(lock_fd)
+
+    command = [sys.executable, "-m", "srm.sizer", get_full_path(wastebasket_path),
+               metadata_backend]
+    with open(os.devnull, "r+") as devnull:
+        return subprocess.Popen(command, stdin=devnull, stdout=devnull, stderr=devnull,
+                                close_fds=True, preexec_fn=os.setsid)
+
+
+def size(wastebasket_path, metadata_backend):
+    """
+    Records the pending sizes of the WasteBasket.
+
+    Return the number of the sized items or None if another sizer
+    works with the WasteBasket.
+    """
+    from srm.wastebasket_manager import WasteBasketManager
+
+    lock_fd = lock(lock_path(wastebasket_path))
+    if lock_fd is None:
+        return None
+
+    try:
+        wastebasket = WasteBasketManager(wastebasket_path=wastebasket_path,
+                                         metadata_backend=metadata_backend,
+                                         route_devices=False)
+        return wastebasket.size_pending()
+    finally:
+        os.close(lock_fd)
+
+
+def main():
+    """
+    Module entry point
+    """
+    size(sys.argv[1], sys.argv[2])
+
+
+if __name__ == "__main__":
+    main()
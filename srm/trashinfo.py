@@ -1,89 +1,1156 @@
 #!/usr/bin/env python2.7
 # -*- coding: utf-8 -*-
 
+import contextlib
 import json
 import datetime
+import errno
 import os
+import re
+import sqlite3
+import time
 
-from srm.file_operations import get_full_path, clear_dir
+from srm.file_operations import get_full_path, clear_dir, replace_file
 
 
 TRASHINFO_PATH = os.path.expanduser("~/.info.json")
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# sort keys of trashinfo elements and their fields, the name is the key itself
+SORT_FIELDS = {
+    "name": None,
+    "path": "old path",
+    "date": "deletion date",
+    "size": "size"
+}
+
+
+def to_timestamp(date_string):
+    """
+    Converts "deletion date" string of trashinfo to epoch seconds.
+    """
+    date = datetime.datetime.strptime(date_string, DATE_FORMAT)
+    return int(time.mktime(date.timetuple()))
+
+
+def to_date_string(timestamp):
+    """
+    Converts epoch seconds to "deletion date" string of trashinfo.
+    """
+    return datetime.datetime.fromtimestamp(timestamp).strftime(DATE_FORMAT)
+
+
+def datetime_to_timestamp(date):
+    """
+    Converts datetime object to epoch seconds.
+    """
+    return time.mktime(date.timetuple()) + date.microsecond / 1e6
+
+
+def expiration_timestamp(trashinfo):
+    """
+    Return "expiration date" of trashinfo as epoch seconds or None.
+    """
+    expiration_date = trashinfo.get("expiration date")
+    return to_timestamp(expiration_date) if expiration_date else None
+
+
+def prefix_end(prefix):
+    """
+    Return the least string greater than all strings starting with the prefix
+    or None if there is none, the greatest chars at the end are carried.
+    """
+    while prefix:
+        try:
+            return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        except ValueError:
+            prefix = prefix[:-1]
+
+    return None
+
+
+def get_full_prefix(prefix):
+    """
+    Return full path of the path prefix, the trailing separator is kept.
+    """
+    full_prefix = get_full_path(prefix)
+    if prefix.endswith(os.sep) and not full_prefix.endswith(os.sep):
+        full_prefix += os.sep
+
+    return full_prefix
+
+
+def glob_prefix(pattern):
+    """
+    Return the beginning of the glob pattern without wildcards.
+    """
+    for index, char in enumerate(pattern):
+        if char in "*?[":
+            return pattern[:index]
+
+    return pattern
+
+
+def compile_glob(pattern):
+    """
+    Return the regex matching the whole path by the glob pattern.
+    Like in the shell, *, ? and [!...] do not match the separator.
+    """
+    separator = re.escape(os.sep)
+    parts, index = [], 0
+    while index < len(pattern):
+        char = pattern[index]
+        index += 1
+        if char == "*":
+            parts.append("[^{sep}]*".format(sep=separator))
+        elif char == "?":
+            parts.append("[^{sep}]".format(sep=separator))
+        elif char == "[":
+            end = index
+            if end < len(pattern) and pattern[end] == "!":
+                end += 1
+            if end < len(pattern) and pattern[end] == "]":
+                end += 1
+            end = pattern.find("]", end)
+            if end < 0:
+                parts.append(re.escape(char))
+                continue
+
+            chars = pattern[index:end].replace("\\", "\\\\")
+            index = end + 1
+            if chars.startswith("!"):
+                chars = "^" + separator + chars[1:]
+            elif chars.startswith("^"):
+                chars = "\\" + chars
+            parts.append("[" + chars + "]")
+        else:
+            parts.append(re.escape(char))
+
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+def sort_key(sort):
+    """
+    Return function of (name, trashinfo) giving the key of the sort,
+    see SORT_FIELDS.
+    """
+    field = SORT_FIELDS[sort]
+    if field is None:
+        return lambda item: item[0]
+
+    return lambda item: (item[1].get(field), item[0])
+
+
+def trash_name(basename, index):
+    return "{filename}.{index}".format(filename=basename, index=index)
+
+
+def no_such_trashinfo(name):
+    return IOError(errno.ENOENT, "No such trashinfo", name)
+
+
+class JsonBackend(object):
+    """
+    Keeps one json file per trash item in the trashinfo dir.
+
+    It is the original layout of the WasteBasket, every request
+    goes to the file system. The held sizes of the archives, see
+    TrashInfo.release_archive, are kept in one json file near the dir.
+    """
+
+    def __init__(self, trashinfo_path):
+        self.trashinfo_path = get_full_path(trashinfo_path)
+        self.held_sizes_path = self.trashinfo_path + ".held"
+
+
+    def names(self):
+        return os.listdir(self.trashinfo_path)
+
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.trashinfo_path, name))
+
+
+    def insert(self, name, trashinfo):
+        trashinfo_filename = os.path.join(self.trashinfo_path, name)
+        with open(trashinfo_filename, 'w') as trashinfo_file:
+            json.dump(trashinfo, trashinfo_file)
+
+
+    def get(self, name):
+        trashinfo_filename = os.path.join(self.trashinfo_path, name)
+        with open(trashinfo_filename, 'r') as trashinfo_file:
+            return json.load(trashinfo_file)
+
+
+    def insert_many(self, items):
+        for name, trashinfo in items:
+            self.insert(name, trashinfo)
+
+
+    def unique_names(self, basenames):
+        names, indexes = [], {}
+        for basename in basenames:
+            index = indexes.get(basename, 0)
+            while self.exists(trash_name(basename, index)):
+                index += 1
+            names.append(trash_name(basename, index))
+            indexes[basename] = index + 1
+
+        return names
+
+
+    def insert_unique(self, items):
+        # the trashinfo file is created exclusively, so the name is taken once
+        names = []
+        for basename, trashinfo in items:
+            index = 0
+            while True:
+                name = trash_name(basename, index)
+                try:
+                    trashinfo_fd = os.open(os.path.join(self.trashinfo_path, name),
+                                           os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+                except OSError as exception:
+                    if exception.errno != errno.EEXIST:
+                        raise
+                    index += 1
+                    continue
+                break
+
+            with os.fdopen(trashinfo_fd, "w") as trashinfo_file:
+                json.dump(trashinfo, trashinfo_file)
+            names.append(name)
+
+        return names
+
+
+    def delete(self, name):
+        self.delete_many([name])
+
+
+    def delete_many(self, names):
+        held_sizes = {}
+        try:
+            for name in names:
+                try:
+                    trashinfo = self.get(name)
+                except (IOError, ValueError):
+                    trashinfo = {}
+                os.remove(os.path.join(self.trashinfo_path, name))
+
+                archive = trashinfo.get("archive")
+                if archive:
+                    held_sizes[archive] = held_sizes.get(archive, 0) + (trashinfo.get("size") or 0)
+        finally:
+            if held_sizes:
+                self.hold_sizes(held_sizes)
+
+
+    def held_sizes(self):
+        if not os.path.exists(self.held_sizes_path):
+            return {}
+
+        try:
+            with open(self.held_sizes_path, "r") as held_file:
+                return json.load(held_file)
+        except ValueError:
+            return {}
+
+
+    def hold_sizes(self, sizes):
+        held_sizes = self.held_sizes()
+        for archive, size in sizes.items():
+            held_sizes[archive] = held_sizes.get(archive, 0) + size
+        replace_file(self.held_sizes_path, json.dumps(held_sizes))
+
+
+    def release_archive(self, archive):
+        held_sizes = self.held_sizes()
+        if held_sizes.pop(archive, None) is not None:
+            replace_file(self.held_sizes_path, json.dumps(held_sizes))
+
+
+    def update_sizes(self, sizes):
+        for name, size in sizes:
+            if not self.exists(name):
+                continue
+            trashinfo = self.get(name)
+            trashinfo["size"] = size
+            trashinfo.pop("size pending", None)
+            self.insert(name, trashinfo)
+
+
+    def pending_sizes(self):
+        return sorted(name for name in self.names() if self.get(name).get("size pending"))
+
+
+    def total_size(self):
+        return (sum(self.get(name).get("size", 0) for name in self.names())
+                + sum(self.held_sizes().values()))
+
+
+    def deleted_before(self, timestamp):
+        return [name for name in self.names()
+                if to_timestamp(self.get(name)["deletion date"]) < timestamp]
+
+
+    def unarchived_before(self, timestamp):
+        return [name for name in self.deleted_before(timestamp)
+                if not self.get(name).get("archive")]
+
+
+    def set_archive(self, archive, sizes):
+        for name, size in sizes:
+            trashinfo = self.get(name)
+            trashinfo["archive"] = archive
+            trashinfo["size"] = size
+            trashinfo.pop("size pending", None)
+            self.insert(name, trashinfo)
+
+
+    def archives(self, names):
+        archives = {}
+        for name in names:
+            if self.exists(name) and self.get(name).get("archive"):
+                archives[name] = self.get(name)["archive"]
+
+        return archives
+
+
+    def sizes(self, names):
+        return dict((name, self.get(name).get("size") or 0)
+                    for name in names if self.exists(name))
+
+
+    def archive_used(self, archive):
+        return any(self.get(name).get("archive") == archive for name in self.names())
+
+
+    def name_archives(self):
+        for name in sorted(self.names()):
+            yield (name, self.get(name).get("archive"))
+
+
+    def expired(self, now, deadline=None):
+        expired_names = []
+        for name in self.names():
+            trashinfo = self.get(name)
+            expires_at = expiration_timestamp(trashinfo)
+            if expires_at is not None:
+                if expires_at <= now:
+                    expired_names.append(name)
+            elif deadline is not None and to_timestamp(trashinfo["deletion date"]) < deadline:
+                expired_names.append(name)
+
+        return expired_names
+
+
+    def eviction_candidates(self, order):
+        candidates = []
+        for name in self.names():
+            trashinfo = self.get(name)
+            size = trashinfo.get("size", 0)
+            key = to_timestamp(trashinfo["deletion date"]) if order == "oldest" else -size
+            candidates.append((key, name, size))
+
+        for candidate in sorted(candidates):
+            yield candidate
+
+
+    def find_by_old_path(self, old_path):
+        return [name for name in self.names()
+                if self.get(name)["old path"] == old_path]
+
+
+    def items(self, prefix=None, since=None, until=None, sort="name", reverse=False, limit=None):
+        items = []
+        for name in self.names():
+            trashinfo = self.get(name)
+            deleted_at = to_timestamp(trashinfo["deletion date"])
+            if prefix and not trashinfo["old path"].startswith(prefix):
+                continue
+            if since is not None and deleted_at < int(since):
+                continue
+            if until is not None and deleted_at > until:
+                continue
+            items.append((name, trashinfo))
+
+        items.sort(key=sort_key(sort), reverse=reverse)
+        for item in items[:limit]:
+            yield item
+
+
+    def clear(self):
+        clear_dir(self.trashinfo_path)
+        if os.path.exists(self.held_sizes_path):
+            os.remove(self.held_sizes_path)
+
+
+class SqliteBackend(object):
+    """
+    Keeps trashinfo in the SQLite database near the trashinfo dir.
+
+    The database works in WAL mode and has indexes on the trash name,
+    the old path, the deletion date, the expiration date, the size and
+    the archive.
+    The total size of the items is kept up to date by triggers, the sizes
+    of the items deleted from the archives stay in it, see held_sizes.
+
+    The next index of every basename is kept in name_counters, so a unique
+    name is found without probing the indexes taken before.
+    """
+
+    # seconds to wait for the write lock taken by other srm processes
+    TIMEOUT = 60.0
+
+    DELETE_TRIGGER = """
+        CREATE TRIGGER IF NOT EXISTS trashinfo_delete AFTER DELETE ON trashinfo BEGIN
+            UPDATE meta SET value = value - OLD.size
+                WHERE key = 'total size' AND OLD.archive IS NULL;
+            INSERT OR IGNORE INTO held_sizes (archive, size)
+                SELECT OLD.archive, 0 WHERE OLD.archive IS NOT NULL;
+            UPDATE held_sizes SET size = size + OLD.size WHERE archive = OLD.archive;
+            DELETE FROM pending_sizes WHERE name = OLD.name;
+        END;
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS trashinfo (
+            name TEXT PRIMARY KEY,
+            old_path TEXT NOT NULL,
+            deleted_at INTEGER NOT NULL,
+            expires_at INTEGER,
+            size INTEGER NOT NULL DEFAULT 0,
+            archive TEXT
+        );
+        CREATE INDEX IF NOT EXISTS trashinfo_old_path ON trashinfo (old_path);
+        CREATE INDEX IF NOT EXISTS trashinfo_deleted_at ON trashinfo (deleted_at);
+        CREATE INDEX IF NOT EXISTS trashinfo_expires_at ON trashinfo (expires_at)
+            WHERE expires_at IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS trashinfo_size ON trashinfo (size);
+        CREATE INDEX IF NOT EXISTS trashinfo_archive ON trashinfo (archive)
+            WHERE archive IS NOT NULL;
+
+        CREATE TABLE IF NOT EXISTS name_counters (
+            basename TEXT PRIMARY KEY,
+            next INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS pending_sizes (
+            name TEXT PRIMARY KEY
+        );
+
+        CREATE TABLE IF NOT EXISTS held_sizes (
+            archive TEXT PRIMARY KEY,
+            size INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('total size', 0);
+
+        CREATE TRIGGER IF NOT EXISTS trashinfo_insert AFTER INSERT ON trashinfo BEGIN
+            UPDATE meta SET value = value + NEW.size WHERE key = 'total size';
+        END;
+        """ + DELETE_TRIGGER + """
+        CREATE TRIGGER IF NOT EXISTS trashinfo_update_size AFTER UPDATE OF size ON trashinfo BEGIN
+            UPDATE meta SET value = value - OLD.size + NEW.size WHERE key = 'total size';
+        END;
+    """
+
+    def __init__(self, trashinfo_path):
+        self.trashinfo_path = get_full_path(trashinfo_path)
+        self.database_path = self.trashinfo_path + ".db"
+
+        self.connection = sqlite3.connect(self.database_path, timeout=self.TIMEOUT)
+        self.connection.text_factory = str
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+
+
+    def names(self):
+        cursor = self.connection.execute("SELECT name FROM trashinfo ORDER BY name")
+        return [row[0] for row in cursor]
+
+
+    def exists(self, name):
+        cursor = self.connection.execute("SELECT 1 FROM trashinfo WHERE name = ?", (name,))
+        return cursor.fetchone() is not None
+
+
+    INSERT = ("INSERT {conflict} INTO trashinfo "
+              "(name, old_path, deleted_at, expires_at, size, archive) "
+              "VALUES (?, ?, ?, ?, ?, ?)")
+
+    @staticmethod
+    def to_row(name, trashinfo):
+        return (name, trashinfo["old path"], to_timestamp(trashinfo["deletion date"]),
+                expiration_timestamp(trashinfo), trashinfo.get("size", 0),
+                trashinfo.get("archive"))
+
+
+    def insert(self, name, trashinfo):
+        with self.connection:
+            self.connection.execute(self.INSERT.format(conflict=""), self.to_row(name, trashinfo))
+
+
+    @staticmethod
+    def to_trashinfo(row):
+        return {
+            "old path": row[0],
+            "deletion date": to_date_string(row[1]),
+            "expiration date": to_date_string(row[2]) if row[2] is not None else None,
+            "size": row[3],
+            "archive": row[4]
+            }
+
+
+    def get(self, name):
+        cursor = self.connection.execute(
+            "SELECT old_path, deleted_at, expires_at, size, archive FROM trashinfo WHERE name = ?",
+            (name,)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            raise no_such_trashinfo(name)
+
+        return self.to_trashinfo(row)
+
+
+    def insert_many(self, items):
+        items = list(items)
+        with self.connection:
+            self.connection.executemany(
+                self.INSERT.format(conflict=""),
+                (self.to_row(name, trashinfo) for name, trashinfo in items)
+            )
+            self.insert_pending(name for name, trashinfo in items
+                                if trashinfo.get("size pending"))
+
+
+    def insert_pending(self, names):
+        self.connection.executemany("INSERT OR IGNORE INTO pending_sizes (name) VALUES (?)",
+                                    ((name,) for name in names))
+
+
+    def next_indexes(self, basenames):
+        """
+        Return list of unique names for the basenames and dictionary
+        of basename: next index after them.
+
+        The search starts from the counter of the basename and skips
+        the names taken by the items not counted, like migrated ones.
+        """
+        names, indexes = [], {}
+        for basename in basenames:
+            if basename not in indexes:
+                row = self.connection.execute(
+                    "SELECT next FROM name_counters WHERE basename = ?", (basename,)
+                ).fetchone()
+                indexes[basename] = row[0] if row is not None else 0
+
+            index = indexes[basename]
+            while self.exists(trash_name(basename, index)):
+                index += 1
+            names.append(trash_name(basename, index))
+            indexes[basename] = index + 1
+
+        return (names, indexes)
+
+
+    def unique_names(self, basenames):
+        return self.next_indexes(basenames)[0]
+
+
+    @contextlib.contextmanager
+    def immediate_transaction(self):
+        """
+        Runs the block in the transaction holding the write lock from its start.
+        The statements are not committed implicitly, DDL included.
+        """
+        isolation_level = self.connection.isolation_level
+        self.connection.isolation_level = None
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        finally:
+            self.connection.isolation_level = isolation_level
+
+
+    def insert_unique(self, items):
+        # names are taken and inserted in one transaction holding the write lock,
+        # so other processes wait for it and see the advanced counters
+        with self.immediate_transaction():
+            names, indexes = self.next_indexes([basename for basename, _ in items])
+            self.connection.executemany(
+                self.INSERT.format(conflict=""),
+                (self.to_row(name, trashinfo)
+                 for name, (_, trashinfo) in zip(names, items))
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO name_counters (basename, next) VALUES (?, ?)",
+                indexes.items()
+            )
+            self.insert_pending(name for name, (_, trashinfo) in zip(names, items)
+                                if trashinfo.get("size pending"))
+
+        return names
+
+
+    def delete(self, name):
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM trashinfo WHERE name = ?", (name,))
+        if not cursor.rowcount:
+            raise no_such_trashinfo(name)
+
+
+    def delete_many(self, names):
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM trashinfo WHERE name = ?", ((name,) for name in names)
+            )
+
+
+    def update_sizes(self, sizes):
+        sizes = list(sizes)
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE trashinfo SET size = ? WHERE name = ?",
+                ((size, name) for name, size in sizes)
+            )
+            self.connection.executemany("DELETE FROM pending_sizes WHERE name = ?",
+                                        ((name,) for name, _ in sizes))
+
+
+    def pending_sizes(self):
+        cursor = self.connection.execute("SELECT name FROM pending_sizes ORDER BY name")
+        return [row[0] for row in cursor]
+
+
+    def held_sizes(self):
+        return dict(self.connection.execute("SELECT archive, size FROM held_sizes"))
+
+
+    def release_archive(self, archive):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE meta SET value = value - "
+                "(SELECT size FROM held_sizes WHERE archive = ?) "
+                "WHERE key = 'total size' AND EXISTS "
+                "(SELECT 1 FROM held_sizes WHERE archive = ?)", (archive, archive)
+            )
+            self.connection.execute("DELETE FROM held_sizes WHERE archive = ?", (archive,))
+
+
+    def total_size(self):
+        cursor = self.connection.execute("SELECT value FROM meta WHERE key = 'total size'")
+        return cursor.fetchone()[0]
+
+
+    def deleted_before(self, timestamp):
+        cursor = self.connection.execute(
+            "SELECT name FROM trashinfo WHERE deleted_at < ? ORDER BY deleted_at", (timestamp,)
+        )
+        return [row[0] for row in cursor]
+
+
+    def unarchived_before(self, timestamp):
+        cursor = self.connection.execute(
+            "SELECT name FROM trashinfo WHERE deleted_at < ? AND archive IS NULL "
+            "ORDER BY deleted_at", (timestamp,)
+        )
+        return [row[0] for row in cursor]
+
+
+    def set_archive(self, archive, sizes):
+        sizes = list(sizes)
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE trashinfo SET archive = ?, size = ? WHERE name = ?",
+                ((archive, size, name) for name, size in sizes)
+            )
+            self.connection.executemany("DELETE FROM pending_sizes WHERE name = ?",
+                                        ((name,) for name, _ in sizes))
+
+
+    # names are queried by chunks below the limit of SQLite variables
+    IN_SIZE = 500
+
+    def archives(self, names):
+        archives = {}
+        for start in range(0, len(names), self.IN_SIZE):
+            chunk = names[start:start + self.IN_SIZE]
+            cursor = self.connection.execute(
+                "SELECT name, archive FROM trashinfo WHERE archive IS NOT NULL "
+                "AND name IN ({marks})".format(marks=", ".join("?" * len(chunk))), chunk
+            )
+            archives.update(cursor)
+
+        return archives
+
+
+    def sizes(self, names):
+        sizes = {}
+        for start in range(0, len(names), self.IN_SIZE):
+            chunk = names[start:start + self.IN_SIZE]
+            cursor = self.connection.execute(
+                "SELECT name, size FROM trashinfo WHERE name IN ({marks})".format(
+                    marks=", ".join("?" * len(chunk))), chunk
+            )
+            sizes.update(cursor)
+
+        return sizes
+
+
+    def archive_used(self, archive):
+        cursor = self.connection.execute(
+            "SELECT 1 FROM trashinfo WHERE archive = ? LIMIT 1", (archive,)
+        )
+        return cursor.fetchone() is not None
+
+
+    def name_archives(self):
+        cursor = self.connection.execute("SELECT name, archive FROM trashinfo ORDER BY name")
+        for row in cursor:
+            yield row
+
+
+    def expired(self, now, deadline=None):
+        cursor = self.connection.execute(
+            "SELECT name FROM trashinfo WHERE expires_at <= ? ORDER BY expires_at", (now,)
+        )
+        expired_names = [row[0] for row in cursor]
+
+        if deadline is not None:
+            cursor = self.connection.execute(
+                "SELECT name FROM trashinfo WHERE deleted_at < ? AND expires_at IS NULL "
+                "ORDER BY deleted_at", (deadline,)
+            )
+            expired_names.extend(row[0] for row in cursor)
+
+        return expired_names
+
+
+    EVICTION_ORDERS = {
+        "oldest": "SELECT deleted_at, name, size FROM trashinfo ORDER BY deleted_at",
+        "largest": "SELECT -size, name, size FROM trashinfo ORDER BY size DESC"
+    }
+    FETCH_SIZE = 1000
+
+    def eviction_candidates(self, order):
+        cursor = self.connection.execute(self.EVICTION_ORDERS[order])
+        try:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            while rows:
+                for row in rows:
+                    yield row
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+        finally:
+            cursor.close()
+
+
+    def find_by_old_path(self, old_path):
+        cursor = self.connection.execute(
+            "SELECT name FROM trashinfo WHERE old_path = ? ORDER BY deleted_at", (old_path,)
+        )
+        return [row[0] for row in cursor]
+
+
+    SORT_COLUMNS = {
+        "name": "name",
+        "path": "old_path",
+        "date": "deleted_at",
+        "size": "size"
+    }
+
+    def items(self, prefix=None, since=None, until=None, sort="name", reverse=False, limit=None):
+        conditions, parameters = [], []
+        if prefix:
+            conditions.append("old_path >= ?")
+            parameters.append(prefix)
+            end = prefix_end(prefix)
+            if end is not None:
+                conditions.append("old_path < ?")
+                parameters.append(end)
+        if since is not None:
+            conditions.append("deleted_at >= ?")
+            parameters.append(int(since))
+        if until is not None:
+            conditions.append("deleted_at <= ?")
+            parameters.append(until)
+
+        query = "SELECT name, old_path, deleted_at, expires_at, size, archive FROM trashinfo"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY {column} {direction}, name {direction}".format(
+            column=self.SORT_COLUMNS[sort], direction="DESC" if reverse else "ASC")
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+
+        cursor = self.connection.execute(query, parameters)
+        try:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            while rows:
+                for row in rows:
+                    yield (row[0], self.to_trashinfo(row[1:]))
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+        finally:
+            cursor.close()
+
+
+    def clear(self):
+        # without the delete trigger the table is truncated at once
+        # instead of row by row, the total size is reset instead
+        with self.immediate_transaction():
+            self.connection.execute("DROP TRIGGER trashinfo_delete")
+            self.connection.execute("DELETE FROM trashinfo")
+            self.connection.execute("DELETE FROM name_counters")
+            self.connection.execute("DELETE FROM pending_sizes")
+            self.connection.execute("DELETE FROM held_sizes")
+            self.connection.execute("UPDATE meta SET value = 0 WHERE key = 'total size'")
+            self.connection.execute(self.DELETE_TRIGGER)
+
+
+    def migrate(self, json_backend):
+        """
+        Moves the items of the json layout into the database.
+
+        Items whose names are taken in the database are left in the json
+        layout, it is not known which of the two owns the payload.
+        Return a tuple (list of migrated names, list of conflicting names).
+        """
+        migrated_names, conflicting_names = [], []
+        with self.connection:
+            for name in json_backend.names():
+                try:
+                    self.connection.execute(self.INSERT.format(conflict=""),
+                                            self.to_row(name, json_backend.get(name)))
+                except sqlite3.IntegrityError:
+                    conflicting_names.append(name)
+                    continue
+                migrated_names.append(name)
+        for name in migrated_names:
+            json_backend.delete(name)
+
+        return (migrated_names, conflicting_names)
+
+
+BACKENDS = {
+    "json": JsonBackend,
+    "sqlite": SqliteBackend
+}
+DEFAULT_BACKEND = "sqlite"
 
 
 class TrashInfo(object):
     """
     The class provides information about the deleted files.
 
-    Attention! Do not work directly with the _files_dict!
-    Use methods of push, pop and clear for work with it.
+    The information is kept by the backend, see BACKENDS.
+    If the backend is not "json", items of the old json layout
+    found in the trashinfo dir are migrated into it, the items
+    whose names are taken already are kept in conflicts.
     """
 
-    def __init__(self, trashinfo_path=TRASHINFO_PATH):
+    def __init__(self, trashinfo_path=TRASHINFO_PATH, backend=DEFAULT_BACKEND):
         self.trashinfo_path = get_full_path(trashinfo_path)
+        self.backend = BACKENDS[backend](self.trashinfo_path)
+
+        self.migrated, self.conflicts = [], []
+        if backend != "json" and os.listdir(self.trashinfo_path):
+            self.migrated, self.conflicts = self.backend.migrate(JsonBackend(self.trashinfo_path))
 
 
     def content(self):
-        """Return list of full path trashinfo items."""
-        return [os.path.join(self.trashinfo_path, filename) for filename in os.listdir(self.trashinfo_path)]
+        """Return list of trashinfo names."""
+        return self.backend.names()
 
 
-    def push(self, path):
+    def push(self, path, size=0, ttl=None):
         """
         Created trashinfo element. Return filename in trashinfo.
+
+        size - the amount of space occupied by the element in bytes
+               or None if it is not known yet, see pending_sizes.
+        ttl  - timedelta after which the element expires regardless
+               of the storage time of the WasteBasket.
+        """
+        return self.push_many([(path, size)], ttl=ttl)[0]
+
+
+    def push_many(self, nodes, ttl=None):
+        """
+        Created trashinfo elements for the list of (path, size)
+        in one write to the backend. Return list of filenames in trashinfo.
         """
         deletion_date = datetime.datetime.now()
-        old_path = get_full_path(path)
+        expiration_date = None
+        if ttl is not None:
+            expiration_date = (deletion_date + ttl).strftime(DATE_FORMAT)
 
-        filename = os.path.basename(old_path)
-        index = 0
+        items = []
+        for path, size in nodes:
+            full_path = get_full_path(path)
+            trashinfo = {
+                "old path": full_path,
+                "deletion date": deletion_date.strftime(DATE_FORMAT),
+                "expiration date": expiration_date,
+                "size": size or 0,
+                "archive": None
+                }
+            if size is None:
+                trashinfo["size pending"] = True
+            items.append((os.path.basename(full_path), trashinfo))
 
-        unique_name = "{filename}.{index}".format(filename=filename, index=index)
-        trashinfo_list = os.listdir(self.trashinfo_path)
+        return self.backend.insert_unique(items)
 
-        while unique_name in trashinfo_list:
-            index += 1
-            unique_name = "{filename}.{index}".format(filename=filename, index=index)
 
-        trashinfo = {
-            "old path": old_path,
-            "deletion date": deletion_date.strftime("%Y-%m-%dT%H:%M:%S")
-            }
-        trashinfo_filename = os.path.join(self.trashinfo_path, unique_name)
+    def adopt(self, items):
+        """
+        Creates trashinfo elements with the given names for the list of
+        (name, old path, deletion datetime, size) in one write to the backend.
+        """
+        self.backend.insert_many((name, {
+            "old path": get_full_path(old_path),
+            "deletion date": deletion_date.strftime(DATE_FORMAT),
+            "expiration date": None,
+            "size": size,
+            "archive": None
+            }) for name, old_path, deletion_date, size in items)
 
-        with open(trashinfo_filename, 'w') as trashinfo_file:
-            json.dump(trashinfo, trashinfo_file)
 
-        return unique_name
+    def allocate_names(self, paths):
+        """
+        Return list of unique filenames in trashinfo for the paths.
+        Nothing is written to the backend, so the names are not taken,
+        see push_many.
+        """
+        return self.backend.unique_names([os.path.basename(get_full_path(path))
+                                          for path in paths])
 
 
     def pop(self, name):
         """
-        Return trashinfo for a given name or raise KeyError if don't exist.
+        Return trashinfo for a given name or raise IOError if don't exist.
         """
         trashinfo = self.get(name)
-        
-        full_path_to_trashinfo_file = os.path.join(self.trashinfo_path, name)
-        os.remove(full_path_to_trashinfo_file)
+        self.backend.delete(name)
 
         return trashinfo
 
 
+    def pop_many(self, names):
+        """
+        Removes trashinfo elements for the names in one write to the backend.
+        """
+        self.backend.delete_many(names)
+
+
     def get(self, name):
         """
         Get trashinfo for a given name or raice IOError if don't exist.
         """
-        full_path_to_trashinfo_file = os.path.join(self.trashinfo_path, name)
+        return self.backend.get(name)
+
+
+    def update_sizes(self, sizes):
+        """
+        Sets sizes of trashinfo elements from the iterable of (name, size).
+        """
+        self.backend.update_sizes(sizes)
+
+
+    def pending_sizes(self):
+        """
+        Return list of names of the elements pushed without their size,
+        they are counted by 0 bytes until their sizes are set.
+        """
+        return self.backend.pending_sizes()
+
+
+    def total_size(self):
+        """
+        Return the total size of trashinfo elements in bytes
+        with the held sizes of the archives, see release_archive.
+        """
+        return self.backend.total_size()
+
+
+    def deleted_before(self, date):
+        """
+        Return list of trashinfo names deleted before the datetime.
+        """
+        return self.backend.deleted_before(datetime_to_timestamp(date))
+
+
+    def unarchived_before(self, date):
+        """
+        Return list of trashinfo names deleted before the datetime
+        which are not packed into archives.
+        """
+        return self.backend.unarchived_before(datetime_to_timestamp(date))
+
+
+    def set_archive(self, archive, sizes):
+        """
+        Marks the trashinfo elements as packed into the archive.
+
+        sizes - dictionary of name: compressed bytes, they become
+                the sizes of the elements.
+        """
+        self.backend.set_archive(archive, sizes.items())
+
+
+    def archives(self, names):
+        """
+        Return dictionary of name: archive of the packed elements among the names.
+        """
+        return self.backend.archives(list(names))
+
+
+    def sizes(self, names):
+        """
+        Return dictionary of name: size in bytes of the elements among the names.
+        """
+        return self.backend.sizes(list(names))
+
+
+    def archive_used(self, archive):
+        """
+        Return True if some trashinfo element is packed into the archive.
+        """
+        return self.backend.archive_used(archive)
 
-        trashinfo = None
-        with open(full_path_to_trashinfo_file, 'r') as trashinfo_file:
-            trashinfo = json.load(trashinfo_file)
-        
-        return trashinfo
+
+    def held_sizes(self):
+        """
+        Return dictionary of archive: compressed bytes of the elements
+        popped from the archive before it is released.
+        """
+        return self.backend.held_sizes()
+
+
+    def release_archive(self, archive):
+        """
+        Stops counting the compressed bytes of the elements popped from
+        the archive. They are counted by total_size until the archive is
+        released, it takes the space of cold/ till it is removed.
+        """
+        self.backend.release_archive(archive)
+
+
+    def name_archives(self):
+        """
+        Yields tuples (name, archive) of all trashinfo elements sorted by name,
+        the archive is None if the element is not packed.
+        """
+        return self.backend.name_archives()
+
+
+    def expired(self, now, storage_time=None):
+        """
+        Return list of trashinfo names which expiration date has passed
+        by the datetime now. If storage_time is given, names without
+        the expiration date deleted more than storage_time ago are
+        returned too.
+
+        Only expired elements are read from the index.
+        """
+        deadline = None
+        if storage_time is not None:
+            deadline = datetime_to_timestamp(now - storage_time)
+
+        return self.backend.expired(datetime_to_timestamp(now), deadline)
+
+
+    def eviction_candidates(self, order):
+        """
+        Yields tuples (key, name, size) of trashinfo elements in the order
+        of eviction, sorted by key:
+
+            "oldest"  - the earliest deleted first;
+            "largest" - the largest first.
+
+        The elements are read from the index lazily.
+        """
+        return self.backend.eviction_candidates(order)
+
+
+    def find_by_old_path(self, path):
+        """
+        Return list of trashinfo names deleted from the path.
+        """
+        return self.backend.find_by_old_path(get_full_path(path))
+
+
+    def items(self, sort="name", reverse=False, prefix=None, pattern=None,
+              since=None, until=None, limit=None):
+        """
+        Yields tuples (name, trashinfo) of trashinfo elements deleted from
+        the paths starting with prefix and matching the glob pattern between
+        the datetimes since and until, sorted by the key of SORT_FIELDS.
+
+        The elements are read from the index lazily, by the old path index
+        for the prefix or the beginning of the pattern without wildcards.
+        At most limit elements are yielded.
+        """
+        if prefix:
+            prefix = get_full_prefix(prefix)
+
+        index_prefix, regex = prefix, None
+        if pattern is not None:
+            pattern = get_full_path(pattern)
+            regex = compile_glob(pattern)
+            if len(glob_prefix(pattern)) > len(index_prefix or ""):
+                index_prefix = glob_prefix(pattern)
+
+        items = self.backend.items(
+            index_prefix,
+            datetime_to_timestamp(since) if since is not None else None,
+            datetime_to_timestamp(until) if until is not None else None,
+            sort, reverse,
+            # the glob is matched here, so the limit is applied here too
+            limit if pattern is None else None
+        )
+
+        count = 0
+        try:
+            for name, trashinfo in items:
+                if limit is not None and count >= limit:
+                    break
+                old_path = trashinfo["old path"]
+                if prefix and not old_path.startswith(prefix):
+                    continue
+                if regex is not None and regex.match(old_path) is None:
+                    continue
+
+                count += 1
+                yield (name, trashinfo)
+        finally:
+            items.close()
+
+
+    def find(self, prefix=None, pattern=None, since=None, until=None):
+        """
+        Return list of tuples (name, old path) of trashinfo elements
+        deleted from the paths starting with prefix and matching
+        the glob pattern between the datetimes since and until,
+        sorted by old path. See items.
+        """
+        return [(name, trashinfo["old path"]) for name, trashinfo
+                in self.items("path", prefix=prefix, pattern=pattern, since=since, until=until)]
 
 
     def clear(self):
         """
-        Clear trashinfo dir
+        Clear trashinfo
         """
-        clear_dir(self.trashinfo_path)
+        self.backend.clear()
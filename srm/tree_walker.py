@@ -0,0 +1,236 @@
+#!/usr/bin/env python2.7
+# -*- coding: utf-8 -*-
+
+
+"""
+The module provides the traversal of directory trees.
+"""
+
+
+import collections
+import fnmatch
+import os
+import re
+import stat
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from srm.file_operations import scandir
+
+
+# predicates of find_matches besides the pattern
+FILTERS = ("node_type", "older_than", "larger_than", "exclude")
+# node types of the predicate, like find -type
+NODE_TYPES = {
+    "f": stat.S_ISREG,
+    "d": stat.S_ISDIR,
+    "l": stat.S_ISLNK
+}
+
+
+def dir_id(directory_stat):
+    """
+    Returns the identifier of the directory by its stat.
+    """
+    return (directory_stat.st_dev, directory_stat.st_ino)
+
+
+def scan_dir(directory, match, recursive=False, exclude=None):
+    """
+    Lists the directory once. Returns a tuple of lists (matches, subdirs).
+
+    matches - full paths of entries for which match(entry) is true;
+    subdirs - tuples (full path, dir_id) of the rest directories, if recursive.
+
+    Entries for which exclude(entry) is true are skipped with their subtrees.
+    Node types are taken from the directory entries without stat.
+    """
+    matches, subdirs = [], []
+    for entry in scandir(directory):
+        if exclude is not None and exclude(entry):
+            continue
+        if match(entry):
+            matches.append(entry.path)
+        elif recursive and entry.is_dir():
+            subdirs.append((entry.path, dir_id(entry.stat())))
+
+    return matches, subdirs
+
+
+def walk(directory, match, recursive=False, workers=1, exclude=None):
+    """
+    Yields full paths of nodes in the directory for which match(entry) is true.
+
+    Using breadth-first search, every directory is listed once.
+    Matched directories are not searched. Directories are identified by
+    dir_id, so symlink loops are visited once.
+
+    recursive - if set, searches in subdirectories;
+    workers   - number of threads listing directories, see parallel_walk;
+    exclude   - if set, the entries for which exclude(entry) is true
+                are pruned, see scan_dir.
+    """
+    if workers > 1:
+        return parallel_walk(directory, match, recursive, workers, exclude)
+
+    return sequential_walk(directory, match, recursive, exclude)
+
+
+def sequential_walk(directory, match, recursive=False, exclude=None):
+    visited_dirs = set([dir_id(os.stat(directory))])
+
+    frontier = collections.deque([directory])
+    while frontier:
+        matches, subdirs = scan_dir(frontier.popleft(), match, recursive, exclude)
+
+        for path in matches:
+            yield path
+
+        for path, subdir_id in subdirs:
+            if subdir_id not in visited_dirs:
+                visited_dirs.add(subdir_id)
+                frontier.append(path)
+
+
+def parallel_walk(directory, match, recursive=False, workers=2, exclude=None):
+    """
+    Works like sequential_walk, but directories are listed by the pool
+    of threads taking them from the shared queue.
+
+    Matches of a directory are yielded together in the order of the listing,
+    directories are yielded in the order of the listing completion.
+    """
+    visited_dirs = set([dir_id(os.stat(directory))])
+
+    dirs_queue, results_queue = queue.Queue(), queue.Queue()
+
+    def worker():
+        while True:
+            current_dir = dirs_queue.get()
+            if current_dir is None:
+                break
+
+            try:
+                results_queue.put((scan_dir(current_dir, match, recursive, exclude), None))
+            except OSError as exception:
+                results_queue.put((None, exception))
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        dirs_queue.put(directory)
+        pending_dirs = 1
+
+        while pending_dirs:
+            result, exception = results_queue.get()
+            pending_dirs -= 1
+            if exception is not None:
+                raise exception
+
+            matches, subdirs = result
+            for path, subdir_id in subdirs:
+                if subdir_id not in visited_dirs:
+                    visited_dirs.add(subdir_id)
+                    dirs_queue.put(path)
+                    pending_dirs += 1
+
+            for path in matches:
+                yield path
+    finally:
+        for _ in threads:
+            dirs_queue.put(None)
+
+
+def make_match(pattern, node_type=None, older_than=None, larger_than=None):
+    """
+    Return match(entry) true for the entries which names match the pattern
+    and which pass the predicates, like find does.
+
+    node_type   - type of the node, see NODE_TYPES;
+    older_than  - datetime.timedelta, the node is modified earlier than it ago;
+    larger_than - bytes, the size of the node itself is greater than it.
+
+    The checks go from the cheap to the expensive ones: the name, the type
+    of the directory entry, then the stat, which is taken once and cached
+    by the entry. Symlinks are not followed.
+    """
+    regex = re.compile(pattern)
+    deadline = None
+    if older_than is not None:
+        deadline = time.time() - older_than.total_seconds()
+    if node_type is not None and node_type not in NODE_TYPES:
+        raise ValueError("Unknown node type {type}".format(type=node_type))
+
+    def match(entry):
+        if regex.match(entry.name) is None:
+            return False
+
+        if node_type == "l":
+            if not entry.is_symlink():
+                return False
+        elif node_type == "d":
+            if not entry.is_dir(follow_symlinks=False):
+                return False
+        elif node_type == "f":
+            if not entry.is_file(follow_symlinks=False):
+                return False
+
+        if deadline is None and larger_than is None:
+            return True
+
+        entry_stat = entry.stat(follow_symlinks=False)
+        if deadline is not None and entry_stat.st_mtime >= deadline:
+            return False
+        if larger_than is not None and entry_stat.st_size <= larger_than:
+            return False
+
+        return True
+
+    return match
+
+
+def make_exclude(patterns):
+    """
+    Return exclude(entry) true for the entries matching any of the glob
+    patterns, by the name or, if the pattern has a separator, by the full path.
+    """
+    name_patterns = [pattern for pattern in patterns if os.sep not in pattern]
+    path_patterns = [pattern for pattern in patterns if os.sep in pattern]
+
+    def compile_patterns(globs):
+        if not globs:
+            return None
+        return re.compile("|".join(fnmatch.translate(glob) for glob in globs))
+
+    name_regex = compile_patterns(name_patterns)
+    path_regex = compile_patterns(path_patterns)
+
+    def exclude(entry):
+        if name_regex is not None and name_regex.match(entry.name):
+            return True
+        return path_regex is not None and path_regex.match(entry.path) is not None
+
+    return exclude
+
+
+def find_matches(directory, pattern, recursive=False, workers=1, node_type=None,
+                 older_than=None, larger_than=None, exclude=None):
+    """
+    Yields full paths of nodes in the directory which names match the pattern
+    and which pass the predicates, see make_match. See walk.
+
+    exclude - list of glob patterns of the pruned subtrees, see make_exclude.
+    """
+    match = make_match(pattern, node_type, older_than, larger_than)
+    if exclude:
+        exclude = make_exclude(exclude)
+
+    return walk(directory, match, recursive, workers, exclude or None)
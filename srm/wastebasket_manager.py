@@ -7,26 +7,116 @@ The module provides functions for working with the WasteBasket.
 """
 
 
+import collections
 import datetime
-import re
-import os
+import errno
+import heapq
+import itertools
 import json
+import os
+import stat
+import time
 
 from srm.file_operations import(
-    clear_dir, move,
+    MovedNode,
+    move, purge, rename,
     get_full_path,
     create_path,
-    get_dir_size
+    get_node_size,
+    find_mount_point,
+    locked, replace_file
 )
-from srm.trashinfo import TrashInfo
+from srm.trashinfo import TrashInfo, DEFAULT_BACKEND, sort_key, to_timestamp
 from srm.move_error import MoveError
+from srm.metrics import error_name
+from srm import metrics
+from srm.remove_policy import RemovePolicy
 
 
 TRASHDIR_PATH = os.path.expanduser("~/Trash")
+TRASH_ROOT_NAME = ".Trash-{uid}"
+BATCH_SIZE = 1000
+# dirs with more entries are removed without walking them, see size_pending
+SIZE_WALK_LIMIT = 1000
 MAX_SIZE = 32
+HIGH_WATERMARK = 1.0
+LOW_WATERMARK = 0.8
+CHECK_INTERVAL = datetime.timedelta(hours=1)
+# arguments of WasteBasketManager which can be changed by configure
+SETTINGS = ("dry_run", "force", "rmdir", "max_size", "storage_time", "ttl",
+            "eviction", "high_watermark", "low_watermark", "check_interval",
+            "cold_after", "compression", "workers", "background_clear")
+EVICTION_ORDERS = ("oldest", "largest")
+# the dir of the WasteBasket given as the old path of the adopted payloads, see fsck
+RECOVERED_DIR = "recovered"
+COMPRESSIONS = ("deflate", "bzip2", "lzma")
 STORAGE_TIME = datetime.timedelta(days=30)
 
 
+def collect_moved_files(moved_files):
+    """
+    Returns a list of tuples from the old and new paths.
+
+    If MoveError is raised, it gets the list of successfully moved files.
+    """
+    success_moved_files = []
+    try:
+        for src_dst in moved_files:
+            success_moved_files.append(src_dst)
+    except MoveError as exception:
+        exception.success = success_moved_files
+        raise
+
+    return success_moved_files
+
+
+def original_name(name):
+    """
+    Return the basename of the removed node by its trash name "basename.index".
+    """
+    basename, _, index = name.rpartition(".")
+    return basename if basename and index.isdigit() else name
+
+
+def is_private_dir(path):
+    """
+    Returns True if the path is a directory, not a symlink, owned by the user
+    with mode 0700, like FreeDesktop trash requires of $topdir/.Trash-$uid,
+    so another user can not prepare it to take the removed files.
+    """
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+
+    return (stat.S_ISDIR(path_stat.st_mode) and path_stat.st_uid == os.getuid() and
+            stat.S_IMODE(path_stat.st_mode) == 0o700)
+
+
+def merge_sorted(iterables, key, reverse=False):
+    """
+    Yields items of the sorted iterables in the sorted order, like
+    heapq.merge with key and reverse. The iterables are few,
+    so the next item is chosen among their heads.
+    """
+    heads = []
+    for iterator in [iter(iterable) for iterable in iterables]:
+        for item in iterator:
+            heads.append([item, iterator])
+            break
+
+    choose = max if reverse else min
+    while heads:
+        head = choose(heads, key=lambda head: key(head[0]))
+        yield head[0]
+
+        for item in head[1]:
+            head[0] = item
+            break
+        else:
+            heads.remove(head)
+
+
 class WasteBasketManager(object):
     """
     The object of this class provides methods for working with the WasteBasket.
@@ -39,30 +129,86 @@ class WasteBasketManager(object):
 
         max_size     - sets the maximum WasteBasket size, if exceeded, clears it
                        WasteBasket capacity indicated in GB
+        eviction     - if set, the WasteBasket is not cleared when max_size is exceeded,
+                       items are removed in the order of eviction instead, see evict
+        high_watermark - part of max_size above which the size policy is applied
+        low_watermark  - part of max_size to which the items are evicted
+        check_interval - minimal time between the policy checks, see enforce_policy
 
         storage_time - sets the storage time of the trash items, if exceeded, clears it
+        ttl          - if set, the storage time of the items removed by the object,
+                       the items expire regardless of the storage_time
+
+        cold_after  - if set, the items removed earlier are packed into
+                      compressed archives of cold/, see archive_old
+        compression - compression of the archives, see COMPRESSIONS
 
 
         wastebasket_path - specifies the path to the WasteBasket directory.
                            If it does not exist, сreates it
+
+        metadata_backend - specifies the name of the trashinfo backend,
+                           see srm.trashinfo.BACKENDS
+
+        workers - number of threads listing directories and purging items.
+
+        background_clear - if set, clear returns at once and the WasteBasket
+                           is removed by the reclaimer process, see srm.reclaimer
+
+        route_devices - if set, files from other file systems are moved into
+                        their own trash roots, see wastebasket_for
+        progress      - if set, it is called with the number of copied bytes
+                        when files are copied between file systems
     """
 
     def __init__(self, dry_run=False, force=False, rmdir=False,
-                 max_size=MAX_SIZE, storage_time=STORAGE_TIME,
-                 wastebasket_path=TRASHDIR_PATH): 
+                 max_size=MAX_SIZE, storage_time=STORAGE_TIME, ttl=None,
+                 eviction=None, high_watermark=HIGH_WATERMARK, low_watermark=LOW_WATERMARK,
+                 check_interval=CHECK_INTERVAL, cold_after=None, compression=COMPRESSIONS[0],
+                 wastebasket_path=TRASHDIR_PATH,
+                 metadata_backend=DEFAULT_BACKEND, workers=1, background_clear=False,
+                 route_devices=True, progress=None):
         self.dry_run = dry_run
         self.rmdir = rmdir
         self.force = force
+        self.workers = workers
+        self.background_clear = background_clear
+        self.route_devices = route_devices
+        self.progress = progress
+        self.metadata_backend = metadata_backend
 
         self.wastebasket_path = wastebasket_path
         self.trashinfo_dir = os.path.join(self.wastebasket_path, "info/")
         self.file_dir = os.path.join(self.wastebasket_path, "files/")
+        self.purging_dir = os.path.join(self.wastebasket_path, "purging/")
+        self.cold_dir = os.path.join(self.wastebasket_path, "cold/")
 
         self.create_wastebasket(self.wastebasket_path)
-        self.trashinfo = TrashInfo(self.trashinfo_dir)
+        self.trashinfo = TrashInfo(self.trashinfo_dir, backend=metadata_backend)
 
         self.max_size = max_size * (1024 ** 3)
         self.storage_time = storage_time
+        self.ttl = ttl
+        self.eviction = eviction
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.check_interval = check_interval
+        self.cold_after = cold_after
+        self.compression = compression
+        self.policy_state_path = os.path.join(self.wastebasket_path, "policy.json")
+
+        self.device = os.stat(self.wastebasket_path).st_dev
+        self.trash_roots_path = os.path.join(self.wastebasket_path, "roots.json")
+        self.device_wastebaskets = {}
+        self.root_wastebaskets = None
+
+        if self.trashinfo.migrated:
+            self.recount()
+
+        # generations left by the crashed reclaimer
+        if self.background_clear and os.listdir(self.purging_dir):
+            from srm import reclaimer
+            reclaimer.spawn(self.purging_dir, self.workers)
 
 
     def create_wastebasket(self, path):
@@ -77,6 +223,168 @@ class WasteBasketManager(object):
             create_path(self.file_dir)
         if not os.path.exists(self.trashinfo_dir):
             create_path(self.trashinfo_dir)
+        if not os.path.exists(self.purging_dir):
+            create_path(self.purging_dir)
+        if not os.path.exists(self.cold_dir):
+            create_path(self.cold_dir)
+
+
+    def settings(self):
+        """
+        Return dictionary of the settings in the units of the constructor, see SETTINGS.
+        """
+        settings = dict((name, getattr(self, name)) for name in SETTINGS)
+        settings["max_size"] = float(self.max_size) / (1024 ** 3)
+        return settings
+
+
+    def configure(self, **settings):
+        """
+        Changes the settings of the WasteBasket and of the opened trash roots
+        on other file systems. Takes the arguments of the constructor, see SETTINGS.
+        """
+        for name, value in settings.items():
+            if name not in SETTINGS:
+                raise TypeError("Unknown setting {name}".format(name=name))
+            if name == "max_size":
+                value = value * (1024 ** 3)
+            setattr(self, name, value)
+
+        for wastebasket in (self.root_wastebaskets or {}).values():
+            wastebasket.configure(**settings)
+
+
+    # Trash roots methods
+    def wastebasket_for(self, path, node_stat):
+        """
+        Returns the WasteBasketManager on the file system of the path,
+        so the path is removed by rename.
+
+        It is self for the file system of the WasteBasket and the trash
+        root $topdir/.Trash-$uid for others, like FreeDesktop trash does.
+        If the trash root cannot be created, self is returned
+        and the path will be copied.
+        """
+        device = node_stat.st_dev
+        if not self.route_devices or device == self.device:
+            return self
+
+        self.external_wastebaskets()
+        if device not in self.device_wastebaskets:
+            self.device_wastebaskets[device] = self.create_trash_root(path)
+
+        return self.device_wastebaskets[device] or self
+
+
+    def create_trash_root(self, path):
+        """
+        Creates the trash root on the file system of the path.
+        Return its WasteBasketManager or None if it is not possible
+        or the existing root is not private, see is_private_dir.
+        """
+        top_dir = find_mount_point(path)
+        if top_dir == get_full_path(path):
+            return None
+
+        root = os.path.join(top_dir, TRASH_ROOT_NAME.format(uid=os.getuid()))
+        if self.dry_run and not os.path.exists(root):
+            return None
+
+        try:
+            try:
+                os.mkdir(root, 0o700)
+            except OSError as exception:
+                if exception.errno != errno.EEXIST:
+                    raise
+            # the existing root may be made by another user
+            if not is_private_dir(root):
+                return None
+            wastebasket = self.open_trash_root(root)
+        except (IOError, OSError):
+            return None
+
+        with locked(self.trash_roots_path):
+            roots = self.load_trash_roots()
+            roots.append(root)
+            replace_file(self.trash_roots_path, json.dumps(sorted(set(roots))))
+
+        return wastebasket
+
+
+    def open_trash_root(self, root):
+        """
+        Return WasteBasketManager of the trash root with the settings of self.
+        """
+        wastebasket = WasteBasketManager(
+            wastebasket_path=root, metadata_backend=self.metadata_backend,
+            route_devices=False, progress=self.progress, **self.settings()
+        )
+
+        if self.root_wastebaskets is None:
+            self.root_wastebaskets = {}
+        self.root_wastebaskets[wastebasket.wastebasket_path] = wastebasket
+        self.device_wastebaskets[wastebasket.device] = wastebasket
+
+        return wastebasket
+
+
+    def load_trash_roots(self):
+        """
+        Return list of paths to the trash roots on other file systems.
+        The unparsable list is taken as empty.
+        """
+        if not os.path.exists(self.trash_roots_path):
+            return []
+
+        with open(self.trash_roots_path, "r") as roots_file:
+            try:
+                return json.load(roots_file)
+            except ValueError:
+                return []
+
+
+    def external_wastebaskets(self):
+        """
+        Return list of WasteBasketManager of the trash roots on other
+        file systems. Unmounted and not private trash roots are skipped.
+        """
+        if not self.route_devices:
+            return []
+
+        if self.root_wastebaskets is None:
+            self.root_wastebaskets = {}
+            for root in self.load_trash_roots():
+                if not is_private_dir(root):
+                    continue
+                try:
+                    self.open_trash_root(root)
+                except (IOError, OSError):
+                    continue
+
+        return [self.root_wastebaskets[root] for root in sorted(self.root_wastebaskets)]
+
+
+    def trash_path(self, name):
+        """
+        Return full path of the WasteBasket item.
+        """
+        return os.path.join(get_full_path(self.file_dir), name)
+
+
+    def locate(self, name):
+        """
+        Return a tuple (WasteBasketManager, name) for the name of the item.
+
+        Items of the trash roots on other file systems are given
+        by their full path, see trash_path.
+        """
+        if os.path.isabs(name):
+            file_dir = os.path.dirname(name)
+            for wastebasket in [self] + self.external_wastebaskets():
+                if get_full_path(wastebasket.file_dir) == file_dir:
+                    return (wastebasket, os.path.basename(name))
+
+        return (self, name)
 
 
     # Remove methods
@@ -89,84 +397,344 @@ class WasteBasketManager(object):
 
         If path doesn't exist, OSError will be raised.
         """
-        success_moved_files = []
+        return collect_moved_files(self.remove_many(paths))
+
+
+    def remove_many(self, paths, batch_size=BATCH_SIZE):
+        """
+        Remove directories and files from the iterable in WasteBasket.
+
+        Paths are removed by batches, trashinfo of a batch is written at once.
+        Yields a tuple from the old and new paths for every successfully
+        moved file.
+
+        If path doesn't exist, MoveError will be raised
+        after the previous paths are yielded.
+
+        If dry_run, the removal is only planned, see plan_remove.
+        """
+        if self.dry_run:
+            for src_dst in self.plan_remove(paths).moves():
+                yield src_dst
+            return
+
+        batch = []
         for path in paths:
-            path = get_full_path(path)
-            filename = self.trashinfo.push(path)
+            batch.append(path)
+            if len(batch) >= batch_size:
+                for src_dst in self.remove_batch(batch):
+                    yield src_dst
+                batch = []
 
-            try:
-                if os.path.isdir(path) and not self.rmdir:
-                    raise OSError(13, "Rmdir mode in not active")
+        for src_dst in self.remove_batch(batch):
+            yield src_dst
 
-                src_dst = move(path, os.path.join(self.file_dir, filename), dry_run=self.dry_run)
-                success_moved_files.append(src_dst)
 
-                if self.dry_run:
-                    self.trashinfo.pop(filename) 
+    def remove_batch(self, paths):
+        """
+        Remove the batch of directories and files in WasteBasket.
+
+        Every path is stated once, names and trashinfo of the batch
+        are created by one write per file system, see wastebasket_for.
+        Yields a tuple from the old and new paths.
 
+        If path doesn't exist, the paths before it are moved,
+        then MoveError is raised.
+        """
+        wastebasket_nodes = collections.OrderedDict()
+        error = None
+        for path in paths:
+            path = get_full_path(path)
+            try:
+                node_stat = self.stat_node(path)
+                wastebasket = self.wastebasket_for(path, node_stat)
+                node = (path, get_node_size(path, node_stat, SIZE_WALK_LIMIT))
+                wastebasket_nodes.setdefault(wastebasket, []).append(node)
             except OSError as exception:
-                self.trashinfo.pop(filename)
+                metrics.increment("errors_total", operation="remove", error=error_name(exception))
                 if not self.force:
-                    raise MoveError(message=exception.strerror,
-                                    raised_path=path,
-                                    success=success_moved_files)
-        
-        return success_moved_files
+                    error = MoveError(message=exception.strerror, raised_path=path)
+                    break
+
+        for wastebasket, nodes in wastebasket_nodes.items():
+            for src_dst in wastebasket.move_nodes(nodes):
+                yield src_dst
+
+        if error is not None:
+            raise error
+
+
+    def stat_node(self, path):
+        """
+        Return os.lstat of the path to remove.
+        Raise OSError if it is a dir and rmdir mode is not active.
+        """
+        node_stat = os.lstat(path)
+        if stat.S_ISDIR(node_stat.st_mode) and not self.rmdir:
+            raise OSError(13, "Rmdir mode in not active")
+
+        return node_stat
+
+
+    def move_nodes(self, nodes):
+        """
+        Moves the list of (path, size) into the WasteBasket.
+
+        Trashinfo is created by one write. Paths from other file systems
+        are copied. Yields a tuple from the old and new paths.
+        The size None is not known yet, it is counted in background,
+        see size_pending.
+        """
+        start = time.time()
+        filenames = self.trashinfo.push_many(nodes, ttl=self.ttl)
+
+        file_dir = get_full_path(self.file_dir)
+        failed_filenames, processed, moved_bytes = [], 0, 0
+        pending = False
+        try:
+            for (path, size), filename in zip(nodes, filenames):
+                trash_path = os.path.join(file_dir, filename)
+                processed += 1
+                try:
+                    rename(path, trash_path, self.progress)
+                    moved_bytes += size or 0
+                    pending = pending or size is None
+                except OSError as exception:
+                    metrics.increment("errors_total", operation="remove",
+                                      error=error_name(exception))
+                    failed_filenames.append(filename)
+                    if not self.force:
+                        raise MoveError(message=exception.strerror, raised_path=path)
+                    continue
+
+                yield MovedNode(path, trash_path, size or 0)
+        finally:
+            # trashinfo of the failed and not moved paths is removed
+            failed_filenames.extend(filenames[processed:])
+            if failed_filenames:
+                self.trashinfo.pop_many(failed_filenames)
+            if pending:
+                self.spawn_sizer()
 
+            metrics.increment("items_removed_total", len(nodes) - len(failed_filenames))
+            metrics.increment("bytes_removed_total", moved_bytes)
+            metrics.observe("operation_seconds", time.time() - start, operation="remove")
 
-    def remove_regex(self, pattern, search_dirs=False):
+
+    def remove_regex(self, pattern, search_dirs=False, workers=None, filters=None):
+        """
+        Removes files by regex. Using breadth-first search,
+        matches are removed by batches while the search goes on.
+
+        workers - number of threads listing directories, self.workers by default;
+        filters - dictionary of the predicates of the search, like find has,
+                  see srm.tree_walker.FILTERS and find_matches.
+        """
+        return collect_moved_files(self.remove_many(self.find_regex(pattern, search_dirs,
+                                                                    workers, filters)))
+
+
+    def find_regex(self, pattern, search_dirs=False, workers=None, filters=None):
         """
-        Removes files by regex. Using breadth-first search.
+        Return iterator of the paths matching regex, see remove_regex.
         """
+        from srm.tree_walker import find_matches, FILTERS
+
+        if workers is None:
+            workers = self.workers
+
+        filters = filters or {}
+        for name in filters:
+            if name not in FILTERS:
+                raise TypeError("Unknown filter {name}".format(name=name))
+
         full_pattern_path = get_full_path(pattern)
         pattern = os.path.basename(pattern)
 
-        success_moved_files = []
+        return find_matches(os.path.dirname(full_pattern_path), pattern,
+                            recursive=search_dirs, workers=workers, **filters)
 
-        queue, visited_dirs = [], []
-        queue.append(os.path.dirname(full_pattern_path))
-        while queue:
-            current_dir = queue.pop()
-            visited_dirs.append(current_dir)
 
-            for path in os.listdir(current_dir):
-                if re.match(pattern, path):
-                    path = os.path.join(current_dir, path)
-                    src_dst = self.remove(path)
-                    success_moved_files.extend(src_dst)
+    def remove_roots(self, roots, regex=False, search_dirs=False, processes=None,
+                     filters=None):
+        """
+        Removes the independent roots, or the matches of their patterns
+        if regex, in parallel by the process pool, see srm.parallel_remove.
+        Filters are the predicates of the search, see remove_regex.
 
-                    if os.path.isdir(path):
-                        visited_dirs.append(path)
+        processes - number of worker processes, one per device of the roots
+                    by default. If it is 1, the roots are removed in turn
+                    in this process.
 
-            if os.path.exists(current_dir):
-                for path in os.listdir(current_dir):
-                    full_path = os.path.join(current_dir, path)
-                    if search_dirs and os.path.isdir(full_path) and full_path not in visited_dirs:
-                        queue.insert(0, full_path)
+        Returns a list of tuples from the old and new paths.
+        """
+        from srm import parallel_remove
 
-        return success_moved_files
+        if processes is None:
+            processes = parallel_remove.count_processes(roots, regex)
+
+        if processes > 1 and len(roots) > 1:
+            settings = self.settings()
+            settings.update(wastebasket_path=self.wastebasket_path,
+                            metadata_backend=self.metadata_backend,
+                            route_devices=self.route_devices)
+            return parallel_remove.remove_roots(settings, roots, regex, search_dirs, processes,
+                                                filters)
+
+        if not regex:
+            return self.remove(*roots)
+
+        moved_files = []
+        for pattern in roots:
+            try:
+                moved_files.extend(self.remove_regex(pattern, search_dirs=search_dirs,
+                                                     filters=filters))
+            except MoveError as exception:
+                exception.success = moved_files + exception.success
+                raise
+
+        return moved_files
+
+
+    # Plan methods
+    def plan_remove(self, paths):
+        """
+        Return the Plan of the removal of directories and files
+        from the iterable in WasteBasket, see srm.plan.
+
+        Nothing is written: names are not taken and trash roots are not
+        created, the paths from file systems without a trash root are planned
+        to be copied into the WasteBasket. Every path is stated once.
+
+        If path doesn't exist, MoveError will be raised.
+        """
+        from srm.plan import Plan
+
+        wastebasket_nodes = collections.OrderedDict()
+        for path in paths:
+            path = get_full_path(path)
+            try:
+                node_stat = self.stat_node(path)
+                wastebasket = self.planned_wastebasket(path, node_stat)
+                node = (path, get_node_size(path, node_stat), node_stat)
+                wastebasket_nodes.setdefault(wastebasket, []).append(node)
+            except OSError as exception:
+                if not self.force:
+                    raise MoveError(message=exception.strerror, raised_path=path)
+
+        plan = Plan()
+        for wastebasket, nodes in wastebasket_nodes.items():
+            names = wastebasket.trashinfo.allocate_names([node[0] for node in nodes])
+            for (path, size, node_stat), name in zip(nodes, names):
+                plan.add(path, name, wastebasket.wastebasket_path, size, node_stat)
+
+        return plan
+
+
+    def plan_remove_regex(self, pattern, search_dirs=False, workers=None, filters=None):
+        """
+        Return the Plan of the removal of files by regex, see remove_regex and plan_remove.
+        """
+        return self.plan_remove(self.find_regex(pattern, search_dirs, workers, filters))
+
+
+    def planned_wastebasket(self, path, node_stat):
+        """
+        Returns the WasteBasketManager which would take the path, see
+        wastebasket_for, it is self if the trash root does not exist.
+        Trash roots are not created.
+        """
+        device = node_stat.st_dev
+        if not self.route_devices or device == self.device:
+            return self
+
+        self.external_wastebaskets()
+        if device in self.device_wastebaskets:
+            return self.device_wastebaskets[device] or self
+
+        top_dir = find_mount_point(path)
+        root = os.path.join(top_dir, TRASH_ROOT_NAME.format(uid=os.getuid()))
+        if top_dir == get_full_path(path) or not is_private_dir(root):
+            return self
+
+        try:
+            return self.open_trash_root(root)
+        except (IOError, OSError):
+            return self
+
+
+    def apply_plan(self, plan, batch_size=BATCH_SIZE):
+        """
+        Removes the items of the Plan in WasteBasket, see plan_remove.
+
+        Trees are not walked again, sizes are taken from the plan. Every
+        path is stated once to check that it is the planned node. Names are
+        taken again, they are the planned ones unless the WasteBasket is
+        changed since the plan. Yields a tuple from the old and new paths.
+
+        If path doesn't exist or it is another node, MoveError will be raised
+        after the previous paths are moved and yielded.
+        """
+        if self.dry_run:
+            for src_dst in plan.moves():
+                yield src_dst
+            return
+
+        for start in range(0, len(plan.items), batch_size):
+            wastebasket_nodes = collections.OrderedDict()
+            error = None
+            for item in plan.items[start:start + batch_size]:
+                path = item["path"]
+                try:
+                    node_stat = self.stat_node(path)
+                    if (node_stat.st_dev, node_stat.st_ino) != (item["device"], item["inode"]):
+                        raise OSError(errno.ESTALE, "Node is changed since the plan")
+
+                    wastebasket = self.wastebasket_for(path, node_stat)
+                    wastebasket_nodes.setdefault(wastebasket, []).append((path, item["size"]))
+                except OSError as exception:
+                    metrics.increment("errors_total", operation="remove",
+                                      error=error_name(exception))
+                    if not self.force:
+                        error = MoveError(message=exception.strerror, raised_path=path)
+                        break
+
+            for wastebasket, nodes in wastebasket_nodes.items():
+                for src_dst in wastebasket.move_nodes(nodes):
+                    yield src_dst
+
+            if error is not None:
+                raise error
 
 
     # Restore methods
     def restore(self, *names):
         """
         Restore directories and files from WasteBasket
+
+        Items of the trash roots on other file systems are given
+        by their full path, see content.
         """
         try:
             success_moved_files = []
             for name in names:
-                trashinfo = self.trashinfo.get(name)
+                wastebasket, name = self.locate(name)
+                trashinfo = wastebasket.trashinfo.get(name)
 
                 restore_full_path = trashinfo["old path"]
-                full_trashname = "{dir}{name}".format(dir=self.file_dir, name=name)
+                archive = trashinfo.get("archive")
 
                 create_path(os.path.dirname(restore_full_path))
-                src_dst = move(full_trashname, restore_full_path, dry_run=self.dry_run)
+                src_dst = wastebasket.restore_node(name, restore_full_path, archive)
                 success_moved_files.append(src_dst)
 
                 if not self.dry_run:
-                    self.trashinfo.pop(name)
+                    wastebasket.trashinfo.pop(name)
+                    if archive:
+                        wastebasket.drop_archives([archive])
+                    metrics.increment("items_restored_total")
         except (KeyError, OSError) as exception:
+            metrics.increment("errors_total", operation="restore", error=error_name(exception))
             if not self.force:
                 raise MoveError(message="No such file or directory",
                                 raised_path=exception.args[0],
@@ -175,75 +743,745 @@ class WasteBasketManager(object):
         return success_moved_files
 
 
+    def restore_matching(self, prefix=None, pattern=None, since=None, until=None):
+        """
+        Restore directories and files deleted from the paths starting
+        with prefix and matching the glob pattern between the datetimes
+        since and until, see find.
+
+        If several items are deleted from the same path, only the newest
+        one is restored, the older ones are kept in the WasteBasket.
+
+        Returns a list of successfully moved files. The list item contains a
+        tuple from the old and new paths.
+        """
+        items = self.newest_versions(self.find(prefix, pattern, since, until))
+        return collect_moved_files(self.restore_many(items))
+
+
+    def newest_versions(self, items):
+        """
+        Return the list of (name, old path) from the items keeping the newest
+        deleted item of every old path, by the deletion date and the index
+        of the name.
+        """
+        versions = collections.OrderedDict()
+        for name, old_path in items:
+            versions.setdefault(old_path, []).append(name)
+
+        newest_items = []
+        for old_path, names in versions.items():
+            name = names[0] if len(names) == 1 else max(names, key=self.version_key)
+            newest_items.append((name, old_path))
+
+        return newest_items
+
+
+    def version_key(self, name):
+        wastebasket, trash_name = self.locate(name)
+        _, _, index = trash_name.rpartition(".")
+        return (to_timestamp(wastebasket.trashinfo.get(trash_name)["deletion date"]),
+                int(index) if index.isdigit() else -1)
+
+
+    def restore_many(self, items, batch_size=BATCH_SIZE):
+        """
+        Restore the items from the iterable of (name, old path) by batches.
+
+        Yields a tuple from the old and new paths for every successfully
+        moved file. If the item cannot be restored, MoveError will be raised
+        after the previous items are yielded.
+        """
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                for src_dst in self.restore_batch(batch):
+                    yield src_dst
+                batch = []
+
+        for src_dst in self.restore_batch(batch):
+            yield src_dst
+
+
+    def restore_batch(self, items):
+        """
+        Restore the batch of (name, old path) from the WasteBasket
+        and the trash roots on other file systems, see restore_items.
+        """
+        wastebasket_items = collections.OrderedDict()
+        for name, old_path in items:
+            wastebasket, name = self.locate(name)
+            wastebasket_items.setdefault(wastebasket, []).append((name, old_path))
+
+        for wastebasket, items in wastebasket_items.items():
+            for src_dst in wastebasket.restore_items(items):
+                yield src_dst
+
+
+    def restore_items(self, items):
+        """
+        Restore the list of (name, old path) from this WasteBasket.
+
+        Parent directories are created once per unique parent,
+        trashinfo of the restored items is removed by one write.
+        Yields a tuple from the old and new paths.
+        """
+        start = time.time()
+        parents = set()
+        for name, old_path in items:
+            parents.add(os.path.dirname(old_path))
+
+        if not self.dry_run:
+            for parent in sorted(parents):
+                try:
+                    create_path(parent)
+                except OSError as exception:
+                    metrics.increment("errors_total", operation="restore",
+                                      error=error_name(exception))
+                    if not self.force:
+                        raise MoveError(message=exception.strerror, raised_path=parent)
+
+        archives = self.trashinfo.archives(name for name, old_path in items)
+        sizes = self.trashinfo.sizes(name for name, old_path in items)
+        restored_names = []
+        try:
+            for name, old_path in items:
+                try:
+                    src, dst = self.restore_node(name, old_path, archives.get(name))
+                except OSError as exception:
+                    metrics.increment("errors_total", operation="restore",
+                                      error=error_name(exception))
+                    if not self.force:
+                        raise MoveError(message=exception.strerror, raised_path=old_path)
+                    continue
+
+                restored_names.append(name)
+                yield MovedNode(src, dst, sizes.get(name, 0))
+        finally:
+            if restored_names and not self.dry_run:
+                self.trashinfo.pop_many(restored_names)
+                self.drop_archives(set(archives[name] for name in restored_names
+                                       if name in archives))
+                metrics.increment("items_restored_total", len(restored_names))
+            metrics.observe("operation_seconds", time.time() - start, operation="restore")
+
+
+    def restore_node(self, name, old_path, archive=None):
+        """
+        Moves the item of this WasteBasket to old_path or, if it is packed
+        into the archive of cold/, extracts it. See srm.cold_tier.
+
+        Return a tuple from the old and new paths.
+        Raise OSError if old_path exists, it is not overwritten,
+        only the restored dir is merged into the dir of old_path.
+        """
+        try:
+            target_mode = os.lstat(old_path).st_mode
+        except OSError:
+            target_mode = None
+        if target_mode is not None and not stat.S_ISDIR(target_mode):
+            raise OSError(errno.EEXIST, os.strerror(errno.EEXIST), old_path)
+
+        if archive is None:
+            return move(self.trash_path(name), old_path, dry_run=self.dry_run,
+                        progress=self.progress)
+
+        archive_path = os.path.join(get_full_path(self.cold_dir), archive)
+        if not self.dry_run:
+            from srm import cold_tier
+            cold_tier.extract(archive_path, name, old_path)
+
+        return (os.path.join(archive_path, name), get_full_path(old_path))
+
+
     # Show method
-    def content(self, short=True, in_lines=False):
+    def find(self, prefix=None, pattern=None, since=None, until=None):
+        """
+        Return list of tuples (name, old path) of the items deleted from
+        the paths starting with prefix and matching the glob pattern
+        between the datetimes since and until, see TrashInfo.find.
+
+        Items of the trash roots on other file systems are given
+        by their full path.
+        """
+        items = self.trashinfo.find(prefix, pattern, since, until)
+        for wastebasket in self.external_wastebaskets():
+            items.extend((wastebasket.trash_path(name), old_path) for name, old_path
+                         in wastebasket.trashinfo.find(prefix, pattern, since, until))
+
+        return items
+
+
+    def content(self, sort="name", reverse=False, prefix=None, pattern=None,
+                since=None, until=None, limit=None, offset=0):
         """
-        Return list of files in WasteBasket.
+        Yields tuples (name, trashinfo) of the items in WasteBasket sorted
+        by the key of srm.trashinfo.SORT_FIELDS and filtered like find.
+
+        The first offset items are skipped, at most limit items are yielded.
+        Items are read from the trashinfo indexes lazily, items of the trash
+        roots on other file systems are merged by the key and listed
+        by their full path.
         """
-        return self.trashinfo.content()
+        stop = offset + limit if limit is not None else None
+        query = {"sort": sort, "reverse": reverse, "prefix": prefix, "pattern": pattern,
+                 "since": since, "until": until, "limit": stop}
+
+        roots = [self.trashinfo.items(**query)]
+        for wastebasket in self.external_wastebaskets():
+            roots.append(((wastebasket.trash_path(name), trashinfo)
+                          for name, trashinfo in wastebasket.trashinfo.items(**query)))
+
+        try:
+            for item in itertools.islice(merge_sorted(roots, sort_key(sort), reverse),
+                                         offset, stop):
+                yield item
+        finally:
+            for root in roots:
+                root.close()
 
 
     # Clear method
-    def clear(self):
+    def clear(self, background=None):
         """
         Removes all content from directories files/ and info
+        of the WasteBasket and the trash roots on other file systems.
+
+        background - if set, files/ and info/ are atomically renamed into
+                     a new generation of purging/, the empty ones are created
+                     and the reclaimer process removes the generation.
+                     self.background_clear by default.
+
+        Return a tuple (removed files, freed bytes). In background the removed
+        files are counted by the reclaimer, so None is returned instead.
+        If dry_run, nothing is removed and None is returned too.
+        """
+        if background is None:
+            background = self.background_clear
+
+        removed_files, freed_bytes = 0, 0
+        with metrics.timer("operation_seconds", operation="clear"):
+            for wastebasket in [self] + self.external_wastebaskets():
+                files, size = wastebasket.clear_root(background)
+                if files is None or removed_files is None:
+                    removed_files = None
+                else:
+                    removed_files += files
+                freed_bytes += size
+
+        if not self.dry_run:
+            metrics.increment("bytes_purged_total", freed_bytes)
+        return (removed_files, freed_bytes)
+
+
+    def clear_root(self, background=False):
+        """
+        Clears only this WasteBasket, see clear.
         """
-        clear_dir(self.file_dir)
+        freed_bytes = self.trashinfo.total_size()
+        if self.dry_run:
+            return (None, freed_bytes)
+
+        if not background:
+            removed_files, _ = purge(self.file_dir, workers=self.workers)
+            removed_files += purge(self.cold_dir)[0]
+            self.trashinfo.clear()
+            return (removed_files, freed_bytes)
+
+        import tempfile
+        from srm import reclaimer
+
+        # the reclaimer takes the generation only when it is complete
+        staging = tempfile.mkdtemp(prefix=reclaimer.STAGING_PREFIX, dir=self.purging_dir)
+        os.rename(get_full_path(self.file_dir), os.path.join(staging, "files"))
+        os.rename(get_full_path(self.trashinfo_dir), os.path.join(staging, "info"))
+        os.rename(get_full_path(self.cold_dir), os.path.join(staging, "cold"))
+        generation = os.path.basename(staging)[len(reclaimer.STAGING_PREFIX):]
+        os.rename(staging, os.path.join(self.purging_dir, generation))
+        create_path(self.file_dir)
+        create_path(self.trashinfo_dir)
+        create_path(self.cold_dir)
+
         self.trashinfo.clear()
+        reclaimer.spawn(self.purging_dir, self.workers)
+
+        return (None, freed_bytes)
+
+
+    def recount(self):
+        """
+        Recounts sizes of all items in the WasteBasket.
+
+        Sizes are recorded once at removing, use it if the total size
+        has drifted. Return the total WasteBasket size in bytes.
+        """
+        for wastebasket in [self] + self.external_wastebaskets():
+            names = wastebasket.trashinfo.content()
+            archives = wastebasket.trashinfo.archives(names)
+            archive_sizes = dict((archive, wastebasket.archive_item_sizes(archive))
+                                 for archive in set(archives.values()))
+
+            sizes = []
+            for name in names:
+                path = os.path.join(wastebasket.file_dir, name)
+                if name in archives:
+                    size = archive_sizes[archives[name]].get(name, 0)
+                else:
+                    size = get_node_size(path) if os.path.lexists(path) else 0
+                sizes.append((name, size))
+
+            wastebasket.trashinfo.update_sizes(sizes)
+
+        return self.total_size()
+
+
+    def total_size(self):
+        """
+        Return the total size in bytes of the WasteBasket and
+        the trash roots on other file systems.
+
+        The trash roots are not opened only for their totals: unless they
+        are opened already, the totals saved by the last policy check are
+        taken, see root_sizes, so a stale mount does not stall every run.
+        """
+        size = self.trashinfo.total_size()
+        if self.route_devices and self.root_wastebaskets is None:
+            return size + sum(self.load_policy_state().get("root sizes", {}).values())
+
+        return size + sum(wastebasket.trashinfo.total_size()
+                          for wastebasket in self.external_wastebaskets())
+
+
+    def size_pending(self):
+        """
+        Records the sizes of the items removed without them, see move_nodes,
+        until none is left. Items missing in files/ get 0 bytes.
+
+        Return the number of the sized items.
+        """
+        sized_names = set()
+        names = self.trashinfo.pending_sizes()
+        while names:
+            sizes = []
+            for name in names:
+                sized_names.add(name)
+                try:
+                    sizes.append((name, get_node_size(self.trash_path(name))))
+                except OSError:
+                    sizes.append((name, 0))
+            self.trashinfo.update_sizes(sizes)
+            names = [name for name in self.trashinfo.pending_sizes()
+                     if name not in sized_names]
+
+        return len(sized_names)
+
+
+    def spawn_sizer(self):
+        """
+        Starts the background sizer of the pending items, see srm.sizer.
+        """
+        from srm import sizer
+        sizer.spawn(self.wastebasket_path, self.metadata_backend)
+
+
+    def spawn_packer(self):
+        """
+        Starts the background packer of the old items, see srm.packer.
+        """
+        from srm import packer
+        packer.spawn(self.wastebasket_path, self.metadata_backend, self.cold_after,
+                     self.compression, self.workers, self.route_devices)
+
+
+    def root_sizes(self):
+        """
+        Return dictionary of the path of the trash root on other file
+        system: its total size in bytes.
+        """
+        return dict((wastebasket.wastebasket_path, wastebasket.trashinfo.total_size())
+                    for wastebasket in self.external_wastebaskets())
+
+
+    # Consistency check methods
+    def fsck(self):
+        """
+        Reconciles files/ and the trashinfo of the WasteBasket and
+        the trash roots on other file systems, see fsck_root.
+
+        Return a tuple (adopted names, dropped names). Names of the trash
+        roots on other file systems are given by their full path.
+        """
+        adopted_names, dropped_names = self.fsck_root()
+        for wastebasket in self.external_wastebaskets():
+            adopted, dropped = wastebasket.fsck_root()
+            adopted_names.extend(wastebasket.trash_path(name) for name in adopted)
+            dropped_names.extend(wastebasket.trash_path(name) for name in dropped)
+
+        return (adopted_names, dropped_names)
+
+
+    def fsck_root(self):
+        """
+        Reconciles only this WasteBasket by one merge of the sorted names
+        of files/ and of the trashinfo, no name is looked up on its own.
+
+        Payloads without trashinfo are adopted: the size is counted,
+        the deletion date is their ctime set by the rename into files/,
+        the old path is lost, so it is the basename in recovered/ of the WasteBasket.
+        Trashinfo without the payload in files/ or its archive in cold/ is dropped.
+
+        Nodes being moved by another srm process look broken,
+        so it should not run aside them, srmd serves requests one by one.
+        """
+        file_dir = get_full_path(self.file_dir)
+        payloads = sorted(os.listdir(file_dir))
+        archives = set(os.listdir(self.cold_dir)) if os.path.isdir(self.cold_dir) else set()
+
+        orphan_names, dangling_names, lost_archives, index = [], [], set(), 0
+        for name, archive in self.trashinfo.name_archives():
+            while index < len(payloads) and payloads[index] < name:
+                orphan_names.append(payloads[index])
+                index += 1
+
+            if index < len(payloads) and payloads[index] == name:
+                index += 1
+            elif archive is None or archive not in archives:
+                dangling_names.append(name)
+                if archive is not None:
+                    lost_archives.add(archive)
+        orphan_names.extend(payloads[index:])
+
+        if self.dry_run:
+            return (orphan_names, dangling_names)
+
+        recovered_dir = os.path.join(get_full_path(self.wastebasket_path), RECOVERED_DIR)
+        items = []
+        for name in orphan_names:
+            path = os.path.join(file_dir, name)
+            try:
+                node_stat = os.lstat(path)
+            except OSError as exception:
+                if exception.errno != errno.ENOENT:
+                    raise
+                continue
+            items.append((name, os.path.join(recovered_dir, original_name(name)),
+                          datetime.datetime.fromtimestamp(node_stat.st_ctime),
+                          get_node_size(path, node_stat)))
+
+        self.trashinfo.adopt(items)
+        self.trashinfo.pop_many(dangling_names)
+        self.drop_archives(lost_archives)
+
+        return ([item[0] for item in items], dangling_names)
+
+
+    # Cold tier methods
+    def archive_old(self, cold_after=None):
+        """
+        Packs the items removed more than cold_after ago, self.cold_after
+        by default, into a new compressed archive of cold/ per trash root.
+        Sizes of the packed items become their compressed bytes.
+        See srm.cold_tier.
+
+        Return list of packed filenames.
+        """
+        if cold_after is None:
+            cold_after = self.cold_after
+        if cold_after is None:
+            return []
+
+        deadline = datetime.datetime.now() - cold_after
+        packed_names = self.archive_root(deadline)
+        for wastebasket in self.external_wastebaskets():
+            packed_names.extend(wastebasket.trash_path(name)
+                                for name in wastebasket.archive_root(deadline))
+
+        return packed_names
+
+
+    def archive_root(self, deadline):
+        """
+        Packs the items of only this WasteBasket removed before the datetime,
+        see archive_old.
+        """
+        names = [name for name in self.trashinfo.unarchived_before(deadline)
+                 if os.path.lexists(self.trash_path(name))]
+        if not names or self.dry_run:
+            return names
+
+        import tempfile
+        from srm import cold_tier
+
+        archive_fd, archive_path = tempfile.mkstemp(suffix=".zip", dir=self.cold_dir)
+        os.close(archive_fd)
+        try:
+            sizes = cold_tier.pack(archive_path, [(name, self.trash_path(name)) for name in names],
+                                   self.compression)
+        except BaseException:
+            os.remove(archive_path)
+            raise
+
+        # the items are removed from files/ only after the archive is recorded
+        self.trashinfo.set_archive(os.path.basename(archive_path), sizes)
+        purge(self.file_dir, names, workers=self.workers)
+        metrics.increment("items_archived_total", len(names))
+
+        return names
+
+
+    def archive_item_sizes(self, archive):
+        """
+        Return dictionary of name: compressed bytes of the items
+        in the archive of cold/, empty if the archive is lost.
+        """
+        from srm import cold_tier
+
+        archive_path = os.path.join(self.cold_dir, archive)
+        if not os.path.exists(archive_path):
+            return {}
+
+        return cold_tier.item_sizes(archive_path)
+
+
+    def drop_archives(self, archives):
+        """
+        Removes the archives of cold/ with no packed items left, only then
+        the sizes of their restored and purged items are not counted,
+        see TrashInfo.release_archive.
+        """
+        for archive in archives:
+            if self.trashinfo.archive_used(archive):
+                continue
+            try:
+                os.remove(os.path.join(self.cold_dir, archive))
+            except OSError as exception:
+                if exception.errno != errno.ENOENT:
+                    raise
+            self.trashinfo.release_archive(archive)
 
 
     # Check methods
+    def load_policy_state(self):
+        """
+        Return dictionary of the policy state, see enforce_policy.
+        """
+        if not os.path.exists(self.policy_state_path):
+            return {}
+
+        try:
+            with open(self.policy_state_path, "r") as state_file:
+                return json.load(state_file)
+        except ValueError:
+            return {}
+
+
+    def save_policy_state(self, state):
+        """
+        Atomically replaces the policy state.
+        """
+        state_path = self.policy_state_path + ".tmp"
+        with open(state_path, "w") as state_file:
+            json.dump(state, state_file)
+        os.rename(state_path, self.policy_state_path)
+
+
+    def size_limit(self):
+        """
+        Return the size in bytes above which the size policy is applied.
+        """
+        return self.max_size * self.high_watermark
+
+
+    def enforce_policy(self, policy, force=False):
+        """
+        Applies the cleaning policy if it is due.
+
+        The policy is checked if self.check_interval has passed since
+        the last check or force is set, then the packer of the old items
+        into the cold tier is started too, see srm.packer. Between the checks only the size
+        policy is applied, when the running total size exceeds the high
+        watermark, so nothing else is read from the trashinfo.
+        The last check time and the totals of the trash roots on other file
+        systems, see total_size, are kept in policy.json of the WasteBasket.
+
+        Return a tuple (True if WasteBasket was cleaned, list of removed filenames).
+        """
+        with metrics.timer("operation_seconds", operation="policy"):
+            now = time.time()
+            due = force or self.check_interval is None
+            if not due:
+                last_check = self.load_policy_state().get("last check", 0)
+                due = not 0 <= now - last_check < self.check_interval.total_seconds()
+
+            if not due:
+                if policy == RemovePolicy.SIZE and self.total_size() > self.size_limit():
+                    return (self.clear_by_size_policy(), [])
+                return (False, [])
+
+            # the sizer could stop before the items removed in the meantime
+            if not self.dry_run and self.trashinfo.pending_sizes():
+                self.spawn_sizer()
+
+            cleaned, removed_filenames = False, []
+            if policy == RemovePolicy.SIZE:
+                removed_filenames = self.clear_expired()
+                cleaned = self.clear_by_size_policy()
+            elif policy == RemovePolicy.TIME:
+                removed_filenames = self.clear_by_time_policy()
+
+            if not self.dry_run:
+                if self.cold_after is not None:
+                    self.spawn_packer()
+                state = self.load_policy_state()
+                state["last check"] = now
+                state["root sizes"] = self.root_sizes()
+                self.save_policy_state(state)
+
+            return (cleaned, removed_filenames)
+
+
     def clear_by_size_policy(self):
         """
         Check the basket for cleaning by size.
 
-           If the total WasteBasket volume is greater than the self.max_size
-           then we clear the WasteBasket.
+           If the total WasteBasket volume is greater than the high watermark
+           of self.max_size then we clear the WasteBasket or, if self.eviction
+           is set, evict its items. The volume is taken from the sizes recorded
+           at removing, so the WasteBasket is not walked.
 
            Return True if WasteBasket was cleaned, else return False.
         """
-        wastebasket_size = get_dir_size(self.file_dir)
+        wastebasket_size = self.total_size()
 
-        if wastebasket_size > self.max_size:
-            self.clear()
+        if wastebasket_size > self.size_limit():
+            if self.eviction is None:
+                self.clear()
+            else:
+                self.evict()
             return True
 
         return False
 
 
+    def evict(self, target_size=None):
+        """
+        Removes items in the order of self.eviction ("oldest" by default)
+        until the total size is not greater than target_size,
+        self.max_size * self.low_watermark by default.
+
+        Victims are read from the trashinfo indexes of all trash roots
+        merged by the order, only as many as needed.
+
+        Return list of removed filenames.
+        """
+        if target_size is None:
+            target_size = self.max_size * self.low_watermark
+        order = self.eviction or EVICTION_ORDERS[0]
+
+        total_size = self.total_size()
+        if total_size <= target_size:
+            return []
+
+        candidates = [self.trashinfo.eviction_candidates(order)]
+        for wastebasket in self.external_wastebaskets():
+            candidates.append((key, wastebasket.trash_path(name), size)
+                              for key, name, size in wastebasket.trashinfo.eviction_candidates(order))
+
+        victims = []
+        try:
+            for _, name, size in heapq.merge(*candidates):
+                victims.append(name)
+                total_size -= size
+                if total_size <= target_size:
+                    break
+        finally:
+            for candidate in candidates:
+                candidate.close()
+
+        self.purge(*victims)
+        return victims
+
+
     def clear_by_time_policy(self):
         """
         Check the basket for cleaning by time.
 
         If some file has a difference of its deletion time and
         the current time is greater than indicated in self.storage_time
-        than this file will be deleted.
+        or its ttl has expired than this file will be deleted.
+
+        Only expired items are read from the trashinfo index.
 
         Return list removable filenames.
         """
-        removable_filenames = []
-        for filename in self.trashinfo.content():
-            with open(filename, 'r') as trashinfo_file:
-                trashinfo = json.load(trashinfo_file)
-
-            node_deletion_date = trashinfo["deletion date"]
-            node_deletion_date = datetime.datetime.strptime(node_deletion_date, r"%Y-%m-%dT%H:%M:%S")
+        removable_filenames = self.expired(self.storage_time)
+        self.purge(*removable_filenames)
 
-            delta_time = datetime.datetime.now() - node_deletion_date
+        return removable_filenames
 
-            if delta_time > self.storage_time:
-                removable_filenames.append(filename)
 
-        for filename in removable_filenames:
-            filename = os.path.basename(filename)
-            path = os.path.join(self.file_dir, filename)
-            
-            if os.path.isfile(path):
-                os.remove(path)
-            else:
-                clear_dir(path)
-                os.rmdir(path)
+    def clear_expired(self):
+        """
+        Removes the items which ttl has expired.
 
-            self.trashinfo.pop(filename)
+        Return list removable filenames.
+        """
+        removable_filenames = self.expired()
+        self.purge(*removable_filenames)
 
         return removable_filenames
+
+
+    def expired(self, storage_time=None):
+        """
+        Return list of expired items, see TrashInfo.expired.
+
+        Items of the trash roots on other file systems are given
+        by their full path.
+        """
+        now = datetime.datetime.now()
+
+        expired_names = self.trashinfo.expired(now, storage_time)
+        for wastebasket in self.external_wastebaskets():
+            expired_names.extend(wastebasket.trash_path(name)
+                                 for name in wastebasket.trashinfo.expired(now, storage_time))
+
+        return expired_names
+
+
+    def purge(self, *names):
+        """
+        Removes items from the WasteBasket permanently.
+
+        Freed bytes are taken from the sizes recorded at removing.
+        Return a tuple (removed files, freed bytes). If dry_run, nothing
+        is removed, the items are counted instead of the files.
+        """
+        wastebasket_names = collections.OrderedDict()
+        for name in names:
+            wastebasket, name = self.locate(name)
+            wastebasket_names.setdefault(wastebasket, []).append(name)
+
+        if self.dry_run:
+            sizes = [wastebasket.trashinfo.get(name)["size"] or 0
+                     for wastebasket, root_names in wastebasket_names.items()
+                     for name in root_names]
+            return (len(sizes), sum(sizes))
+
+        removed_files, freed_bytes = 0, 0
+        with metrics.timer("operation_seconds", operation="purge"):
+            for wastebasket, names in wastebasket_names.items():
+                total_size = wastebasket.trashinfo.total_size()
+                archives = wastebasket.trashinfo.archives(names)
+
+                files, _ = purge(wastebasket.file_dir, names, workers=self.workers)
+                wastebasket.trashinfo.pop_many(names)
+                wastebasket.drop_archives(set(archives.values()))
+
+                removed_files += files
+                freed_bytes += total_size - wastebasket.trashinfo.total_size()
+                metrics.increment("items_purged_total", len(names))
+
+        metrics.increment("bytes_purged_total", freed_bytes)
+        return (removed_files, freed_bytes)
@@ -4,13 +4,41 @@
 
 import unittest
 import os
+import errno
 import re
 import datetime
 import time
+import io
+import json
+import threading
+import multiprocessing
+import sys
+import logging
+import stat
+import tempfile
 
-from srm.file_operations import create_path, clear_dir
+from srm.file_operations import(
+    create_path, clear_dir, purge,
+    move_across,
+    find_mount_point,
+    get_node_size,
+    MovedNode
+)
 from srm.wastebasket_manager import WasteBasketManager
+from srm.main import write_content, create_parser, run_actions, get_filters, write_metrics
+from srm.logger_tools import BackgroundHandler, JsonFormatter, log_moved_files
+from srm.trashinfo import TrashInfo, prefix_end
+from srm import (
+    reclaimer, daemon, daemon_client, metrics, wastebasket_manager, parallel_remove, sizer,
+    packer
+)
+from srm.remove_policy import RemovePolicy
 from srm.move_error import MoveError
+from srm.plan import load_plan
+
+if sys.version_info >= (3, 7):
+    import asyncio
+    from srm.async_wastebasket_manager import AsyncWasteBasketManager
 
 
 class TestWasteBasketRemove(unittest.TestCase):
@@ -88,6 +116,39 @@ class TestWasteBasketRemove(unittest.TestCase):
         self.assertTrue(self.wbm.trashinfo.get("remove_me.txt.0"))
 
 
+    def test_remove_many_batches(self):
+        self.wbm.rmdir = True
+        paths = ["srm_test/remove_me.txt", "srm_test/dir/four.txt",
+                 "srm_test/and_me.txt", "srm_test/dir/a"]
+        moved_files = list(self.wbm.remove_many(iter(paths), batch_size=3))
+
+        self.assertEqual(len(moved_files), len(paths))
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(self.wbm.trashinfo.content()), len(paths))
+
+
+    def test_remove_many_same_names(self):
+        create_path("srm_test/dir/remove_me.txt", is_file=True)
+        moved_files = list(self.wbm.remove_many(["srm_test/remove_me.txt",
+                                                 "srm_test/dir/remove_me.txt"]))
+
+        trash_names = [os.path.basename(dst) for src, dst in moved_files]
+        self.assertEqual(trash_names, ["remove_me.txt.0", "remove_me.txt.1"])
+
+
+    def test_remove_many_error_rollback(self):
+        with self.assertRaises(MoveError) as context:
+            self.wbm.remove("srm_test/remove_me.txt", "srm_test/ghost", "srm_test/and_me.txt")
+
+        self.assertEqual(context.exception.success,
+                         [(os.path.abspath("srm_test/remove_me.txt"),
+                           self.wbm.trash_path("remove_me.txt.0"))])
+        self.assertEqual(self.wbm.trashinfo.content(), ["remove_me.txt.0"])
+        self.assertFalse(os.path.exists("srm_test/remove_me.txt"))
+        self.assertTrue(os.path.exists("srm_test/and_me.txt"))
+
+
     def test_remove_regex_search_dirs(self):
         """
         Tests for the presence of a file in the WasteBasket and dictionary.
@@ -120,6 +181,141 @@ class TestWasteBasketRemove(unittest.TestCase):
                 self.assertTrue(self.wbm.trashinfo.get(trash_name))
 
 
+    def test_remove_regex_nested(self):
+        moved_files = self.wbm.remove_regex(r"srm_test/.*\.txt$", search_dirs=True)
+
+        removed = sorted(os.path.basename(src) for src, dst in moved_files)
+        self.assertEqual(removed, ["123.txt", "and_me.txt", "four.txt",
+                                   "me_too.txt", "remove_me.txt"])
+        self.assertTrue(os.path.exists("srm_test/dir/cX.notxt"))
+
+
+    def test_remove_regex_workers(self):
+        moved_files = self.wbm.remove_regex(r"srm_test/.*\.txt$", search_dirs=True, workers=4)
+
+        removed = sorted(os.path.basename(src) for src, dst in moved_files)
+        self.assertEqual(removed, ["123.txt", "and_me.txt", "four.txt",
+                                   "me_too.txt", "remove_me.txt"])
+
+
+    def test_remove_regex_symlink_loop(self):
+        os.symlink(os.path.abspath("srm_test/dir"), "srm_test/dir/a/loop")
+        moved_files = self.wbm.remove_regex(r"srm_test/four\.txt$", search_dirs=True)
+
+        self.assertEqual(len(moved_files), 1)
+
+
+    def test_remove_regex_filters(self):
+        with open("srm_test/dir/four.txt", "w") as test_file:
+            test_file.write("12345")
+        old_time = time.time() - 3600
+        os.utime("srm_test/and_me.txt", (old_time, old_time))
+        os.symlink("x", "srm_test/link.txt")
+
+        def removed(filters):
+            moved_files = self.wbm.plan_remove_regex(r"srm_test/.*\.txt$", search_dirs=True,
+                                                     filters=filters).moves()
+            return sorted(os.path.relpath(src) for src, dst in moved_files)
+
+        self.assertEqual(removed({"larger_than": 4}), ["srm_test/dir/four.txt"])
+        self.assertEqual(removed({"older_than": datetime.timedelta(minutes=30),
+                                  "node_type": "f"}), ["srm_test/and_me.txt"])
+        self.assertEqual(removed({"node_type": "l"}), ["srm_test/link.txt"])
+        self.assertEqual(removed({"exclude": ["dir", "*_me.txt"]}),
+                         ["srm_test/link.txt", "srm_test/me_too.txt"])
+        self.assertEqual(removed({"exclude": [os.path.abspath("srm_test/dir/*")]}),
+                         ["srm_test/and_me.txt", "srm_test/link.txt",
+                          "srm_test/me_too.txt", "srm_test/remove_me.txt"])
+
+        with self.assertRaises(TypeError):
+            self.wbm.remove_regex(r"srm_test/.*\.txt$", filters={"newer_than": 1})
+
+
+    def test_remove_regex_relative_exclude(self):
+        open("srm_test/dir/four.txt", "w").close()
+        args = create_parser().parse_args(["--regex", "--exclude", "./srm_test/dir/*",
+                                           "--exclude", "srm_test/and_me.txt", "x"])
+
+        self.wbm.remove_regex(r"srm_test/.*\.txt$", search_dirs=True, filters=get_filters(args))
+
+        self.assertTrue(os.path.exists("srm_test/dir/four.txt"))
+        self.assertTrue(os.path.exists("srm_test/and_me.txt"))
+        self.assertFalse(os.path.exists("srm_test/remove_me.txt"))
+
+
+    def test_plan_remove(self):
+        with open("srm_test/remove_me.txt", "w") as test_file:
+            test_file.write("12345")
+        self.wbm.remove("srm_test/and_me.txt")
+        create_path("srm_test/and_me.txt", is_file=True)
+        trash_files = os.listdir(self.wbm.file_dir)
+
+        plan = self.wbm.plan_remove(["srm_test/remove_me.txt", "srm_test/and_me.txt"])
+        plan.save("srm_test/plan.json")
+
+        self.assertEqual([item["name"] for item in plan.items], ["remove_me.txt.0",
+                                                                 "and_me.txt.1"])
+        self.assertEqual(plan.total_size(), 5)
+        self.assertEqual(os.listdir(self.wbm.file_dir), trash_files)
+        self.assertEqual(len(self.wbm.trashinfo.content()), 1)
+
+        moved_files = list(self.wbm.apply_plan(load_plan("srm_test/plan.json")))
+
+        self.assertEqual(moved_files, plan.moves())
+        self.assertFalse(os.path.exists("srm_test/remove_me.txt"))
+        self.assertEqual(self.wbm.trashinfo.get("remove_me.txt.0")["size"], 5)
+
+
+    def test_save_plan_changes_nothing(self):
+        with open("srm_test/remove_me.txt", "w") as test_file:
+            test_file.write("12345")
+        self.wbm.remove("srm_test/remove_me.txt", "srm_test/and_me.txt")
+        self.wbm.save_policy_state({"last check": 0})
+
+        def snapshot():
+            with open(self.wbm.policy_state_path) as state_file:
+                state = state_file.read()
+            trashinfo = TrashInfo(self.wbm.trashinfo_dir)
+            return (sorted(os.listdir(self.wbm.file_dir)), state,
+                    dict((name, trashinfo.get(name)) for name in trashinfo.content()))
+
+        before = snapshot()
+        args = create_parser().parse_args(["--save-plan", "srm_test/plan.json", "--enforce-now",
+                                           "srm_test/me_too.txt"])
+        self.wbm.dry_run = True
+        self.wbm.storage_time = datetime.timedelta(0)
+        self.wbm.max_size = 1
+        for policy, eviction in [(RemovePolicy.TIME, None), (RemovePolicy.SIZE, None),
+                                 (RemovePolicy.SIZE, "oldest")]:
+            self.wbm.eviction = eviction
+            run_actions(args, {"cleaning_policy": policy, "content": False, "clear": False,
+                               "restore": False, "regex": False}, self.wbm)
+
+        self.assertEqual(snapshot(), before)
+        self.assertTrue(os.path.exists("srm_test/me_too.txt"))
+        self.assertEqual(len(load_plan("srm_test/plan.json")), 1)
+
+
+    def test_apply_changed_plan(self):
+        plan = self.wbm.plan_remove(["srm_test/remove_me.txt", "srm_test/me_too.txt"])
+        os.rename("srm_test/and_me.txt", "srm_test/me_too.txt")
+
+        with self.assertRaises(MoveError) as context:
+            list(self.wbm.apply_plan(plan))
+
+        self.assertEqual(context.exception.raised_path, os.path.abspath("srm_test/me_too.txt"))
+        self.assertTrue(os.path.exists("srm_test/me_too.txt"))
+
+
+    def test_dry_run_regex(self):
+        self.wbm.dry_run = True
+        moved_files = self.wbm.remove_regex(r"srm_test/.*\.txt$", search_dirs=True)
+
+        self.assertEqual(len(moved_files), 5)
+        self.assertFalse(os.listdir(self.wbm.file_dir))
+        self.assertFalse(self.wbm.trashinfo.content())
+
+
     def test_restore_existing_file(self):
         for path in os.listdir("srm_test"):
             path = os.path.join("srm_test", path)
@@ -146,6 +342,26 @@ class TestWasteBasketRemove(unittest.TestCase):
             self.wbm.restore(*[i + ".0" for i in trash_items])
 
 
+    def test_remove_large_dir(self):
+        self.wbm.rmdir = True
+        spawned = []
+        self.wbm.spawn_sizer = lambda: spawned.append(True)
+        size_walk_limit = wastebasket_manager.SIZE_WALK_LIMIT
+        wastebasket_manager.SIZE_WALK_LIMIT = 2
+        try:
+            moved_files = self.wbm.remove("srm_test/dir")
+        finally:
+            wastebasket_manager.SIZE_WALK_LIMIT = size_walk_limit
+
+        self.assertEqual(moved_files[0].size, 0)
+        self.assertEqual(self.wbm.trashinfo.pending_sizes(), ["dir.0"])
+        self.assertEqual(spawned, [True])
+
+        self.assertEqual(sizer.size("Trash_TEST", self.wbm.metadata_backend), 1)
+        self.assertEqual(self.wbm.trashinfo.pending_sizes(), [])
+        self.assertEqual(self.wbm.total_size(), get_node_size(self.wbm.trash_path("dir.0")))
+
+
     def test_restore_merge_case(self):
         self.wbm.rmdir = True
         self.wbm.remove("srm_test/dir")
@@ -192,6 +408,77 @@ class TestWasteBasketRemove(unittest.TestCase):
             self.wbm.trashinfo.get("remove_me.txt.0")
 
 
+    def test_restore_matching(self):
+        self.wbm.rmdir = True
+        self.wbm.remove("srm_test/dir", "srm_test/remove_me.txt", "srm_test/v_a")
+
+        moved_files = self.wbm.restore_matching(prefix="srm_test/d")
+        self.assertEqual(moved_files, [(os.path.abspath("Trash_TEST/files/dir.0"),
+                                        os.path.abspath("srm_test/dir"))])
+
+        self.wbm.restore_matching(pattern="srm_test/*.txt")
+        self.assertTrue(os.path.exists("srm_test/remove_me.txt"))
+        self.assertEqual(self.wbm.trashinfo.content(), ["v_a.0"])
+
+
+    def test_restore_matching_glob_nested(self):
+        self.wbm.remove("srm_test/remove_me.txt", "srm_test/dir/four.txt",
+                        "srm_test/dir/a/.shhhh")
+
+        moved_files = self.wbm.restore_matching(pattern="srm_test/*")
+        self.assertEqual([dst for src, dst in moved_files],
+                         [os.path.abspath("srm_test/remove_me.txt")])
+        self.assertEqual(sorted(self.wbm.trashinfo.content()), [".shhhh.0", "four.txt.0"])
+
+        moved_files = self.wbm.restore_matching(pattern="srm_test/[!a]*/?our.txt")
+        self.assertEqual([dst for src, dst in moved_files],
+                         [os.path.abspath("srm_test/dir/four.txt")])
+        self.assertEqual(self.wbm.trashinfo.content(), [".shhhh.0"])
+
+
+    def test_restore_matching_versions(self):
+        for text in ["old", "new"]:
+            with open("srm_test/remove_me.txt", "w") as test_file:
+                test_file.write(text)
+            self.wbm.remove("srm_test/remove_me.txt")
+
+        moved_files = self.wbm.restore_matching(prefix="srm_test/remove_me")
+        self.assertEqual(moved_files, [(os.path.abspath("Trash_TEST/files/remove_me.txt.1"),
+                                        os.path.abspath("srm_test/remove_me.txt"))])
+        with open("srm_test/remove_me.txt") as test_file:
+            self.assertEqual(test_file.read(), "new")
+        self.assertEqual(self.wbm.trashinfo.content(), ["remove_me.txt.0"])
+
+        # the restored version is not overwritten by the older one
+        with self.assertRaises(MoveError) as context:
+            self.wbm.restore_matching(prefix="srm_test/remove_me")
+        self.assertEqual(context.exception.raised_path, os.path.abspath("srm_test/remove_me.txt"))
+        with open("srm_test/remove_me.txt") as test_file:
+            self.assertEqual(test_file.read(), "new")
+        self.assertEqual(self.wbm.trashinfo.content(), ["remove_me.txt.0"])
+
+
+    def test_restore_matching_time_window(self):
+        self.wbm.remove("srm_test/remove_me.txt", "srm_test/and_me.txt")
+        self.wbm.trashinfo.backend.connection.execute(
+            "UPDATE trashinfo SET deleted_at = deleted_at - 7200 WHERE name = 'and_me.txt.0'")
+
+        since = datetime.datetime.now() - datetime.timedelta(hours=1)
+        self.assertEqual(self.wbm.find(prefix="srm_test/", since=since),
+                         [("remove_me.txt.0", os.path.abspath("srm_test/remove_me.txt"))])
+
+        gone_dir = "srm_test/gone/"
+        create_path(gone_dir + "a/one.txt", is_file=True)
+        create_path(gone_dir + "a/two.txt", is_file=True)
+        self.wbm.remove(gone_dir + "a/one.txt", gone_dir + "a/two.txt")
+        os.rmdir(gone_dir + "a")
+
+        moved_files = self.wbm.restore_matching(prefix=gone_dir, since=since)
+        self.assertEqual(len(moved_files), 2)
+        self.assertTrue(os.path.exists(gone_dir + "a/two.txt"))
+        self.assertEqual(self.wbm.trashinfo.content(), ["and_me.txt.0", "remove_me.txt.0"])
+
+
     def test_time_policy(self):
         self.wbm.storage_time = datetime.timedelta(seconds=1)
         self.wbm.rmdir = True
@@ -207,6 +494,22 @@ class TestWasteBasketRemove(unittest.TestCase):
         self.assertFalse(os.listdir(self.wbm.file_dir))
     
 
+    def test_ttl(self):
+        self.wbm.ttl = datetime.timedelta(seconds=1)
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.ttl = None
+        self.wbm.remove("srm_test/and_me.txt")
+
+        time.sleep(2)
+        removed_files = self.wbm.clear_expired()
+
+        self.assertEqual(removed_files, ["remove_me.txt.0"])
+        self.assertEqual(self.wbm.trashinfo.content(), ["and_me.txt.0"])
+        self.assertEqual(os.listdir(self.wbm.file_dir), ["and_me.txt.0"])
+
+        self.assertFalse(self.wbm.clear_by_time_policy())
+
+
     def test_size_policy(self):
         self.wbm.rmdir = True
         self.wbm.remove(*self.paths)
@@ -218,6 +521,1020 @@ class TestWasteBasketRemove(unittest.TestCase):
         self.assertFalse(os.listdir(self.wbm.file_dir))
 
 
+    def test_eviction_oldest(self):
+        for index, path in enumerate(["srm_test/remove_me.txt", "srm_test/and_me.txt",
+                                      "srm_test/me_too.txt"]):
+            with open(path, "w") as test_file:
+                test_file.write("x" * 100)
+            self.wbm.remove(path)
+            self.wbm.trashinfo.backend.connection.execute(
+                "UPDATE trashinfo SET deleted_at = deleted_at - ? WHERE name = ?",
+                (100 - index, os.path.basename(path) + ".0"))
+
+        self.wbm.eviction = "oldest"
+        self.wbm.max_size = 250
+        self.wbm.low_watermark = 0.5
+
+        self.assertTrue(self.wbm.clear_by_size_policy())
+        self.assertEqual(self.wbm.trashinfo.content(), ["me_too.txt.0"])
+        self.assertEqual(os.listdir(self.wbm.file_dir), ["me_too.txt.0"])
+
+
+    def test_eviction_largest(self):
+        for size, path in [(10, "srm_test/remove_me.txt"), (300, "srm_test/and_me.txt"),
+                           (20, "srm_test/me_too.txt")]:
+            with open(path, "w") as test_file:
+                test_file.write("x" * size)
+            self.wbm.remove(path)
+
+        self.wbm.eviction = "largest"
+
+        self.assertEqual(self.wbm.evict(target_size=100), ["and_me.txt.0"])
+        self.assertEqual(self.wbm.trashinfo.total_size(), 30)
+        self.assertFalse(self.wbm.evict(target_size=100))
+
+
+    def test_enforce_policy_interval(self):
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.storage_time = datetime.timedelta(0)
+        self.wbm.save_policy_state({"last check": time.time()})
+
+        self.assertEqual(self.wbm.enforce_policy(RemovePolicy.TIME), (False, []))
+        self.assertEqual(self.wbm.trashinfo.content(), ["remove_me.txt.0"])
+
+        self.assertEqual(self.wbm.enforce_policy(RemovePolicy.TIME, force=True),
+                         (False, ["remove_me.txt.0"]))
+        self.assertEqual(self.wbm.trashinfo.content(), [])
+
+        last_check = self.wbm.load_policy_state()["last check"]
+        self.wbm.check_interval = datetime.timedelta(0)
+        self.wbm.enforce_policy(RemovePolicy.TIME)
+        self.assertGreaterEqual(self.wbm.load_policy_state()["last check"], last_check)
+
+
+    def test_enforce_policy_watermark(self):
+        for path in ["srm_test/remove_me.txt", "srm_test/and_me.txt"]:
+            with open(path, "w") as test_file:
+                test_file.write("x" * 100)
+            self.wbm.remove(path)
+        self.wbm.save_policy_state({"last check": time.time()})
+
+        self.wbm.max_size = 250
+        self.wbm.high_watermark = 0.9
+        self.assertEqual(self.wbm.enforce_policy(RemovePolicy.SIZE), (False, []))
+
+        self.wbm.high_watermark = 0.5
+        self.assertEqual(self.wbm.enforce_policy(RemovePolicy.SIZE), (True, []))
+        self.assertEqual(self.wbm.trashinfo.total_size(), 0)
+
+
+    def test_size_accounting(self):
+        with open("srm_test/remove_me.txt", "w") as test_file:
+            test_file.write("x" * 100)
+
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.assertEqual(self.wbm.trashinfo.total_size(), 100)
+
+        self.wbm.restore("remove_me.txt.0")
+        self.assertEqual(self.wbm.trashinfo.total_size(), 0)
+
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.clear()
+        self.assertEqual(self.wbm.trashinfo.total_size(), 0)
+
+
+    def test_recount(self):
+        self.wbm.remove("srm_test/remove_me.txt")
+        with open(os.path.join(self.wbm.file_dir, "remove_me.txt.0"), "w") as test_file:
+            test_file.write("x" * 100)
+
+        self.assertEqual(self.wbm.trashinfo.total_size(), 0)
+        self.assertEqual(self.wbm.recount(), 100)
+        self.assertEqual(self.wbm.trashinfo.total_size(), 100)
+
+
+    def test_clear_report(self):
+        with open("srm_test/dir/four.txt", "w") as test_file:
+            test_file.write("x" * 100)
+        self.wbm.rmdir = True
+        self.wbm.workers = 4
+        self.wbm.remove("srm_test/dir", "srm_test/v_a", "srm_test/empty_dir")
+
+        removed_files, freed_bytes = self.wbm.clear(background=False)
+
+        self.assertEqual(removed_files, 6)
+        self.assertGreaterEqual(freed_bytes, 100)
+        self.assertFalse(os.listdir(self.wbm.file_dir))
+
+
+    def test_background_clear(self):
+        self.wbm.rmdir = True
+        self.wbm.remove("srm_test/dir", "srm_test/v_a")
+
+        removed_files, freed_bytes = self.wbm.clear(background=True)
+
+        self.assertIsNone(removed_files)
+        self.assertFalse(os.listdir(self.wbm.file_dir))
+        self.assertFalse(self.wbm.trashinfo.content())
+
+        for _ in range(100):
+            if not os.listdir(self.wbm.purging_dir):
+                break
+            time.sleep(0.1)
+        self.assertFalse(os.listdir(self.wbm.purging_dir))
+
+
+    def test_background_clear_reclaimer_race(self):
+        self.wbm.remove("srm_test/remove_me.txt")
+        mkdtemp, spawn = tempfile.mkdtemp, reclaimer.spawn
+
+        def reclaim_after_mkdtemp(*args, **kwargs):
+            # the reclaimer runs between the creation and the filling of the generation
+            path = mkdtemp(*args, **kwargs)
+            reclaimer.reclaim(self.wbm.purging_dir)
+            return path
+
+        tempfile.mkdtemp, reclaimer.spawn = reclaim_after_mkdtemp, lambda *args: None
+        try:
+            self.wbm.clear(background=True)
+        finally:
+            tempfile.mkdtemp, reclaimer.spawn = mkdtemp, spawn
+
+        generations = os.listdir(self.wbm.purging_dir)
+        self.assertEqual(len(generations), 1)
+        self.assertFalse(generations[0].startswith(reclaimer.STAGING_PREFIX))
+        self.assertEqual(reclaimer.reclaim(self.wbm.purging_dir), 1)
+        self.assertFalse(os.listdir(self.wbm.purging_dir))
+
+
+    def test_reclaim_crashed_generation(self):
+        create_path(os.path.join(self.wbm.purging_dir, "generation/files/a.0/b"), is_file=True)
+        create_path(os.path.join(self.wbm.purging_dir, ".staged/files/c.0"), is_file=True)
+        staged_time = time.time() - reclaimer.STAGING_TIMEOUT - 1
+        os.utime(os.path.join(self.wbm.purging_dir, ".staged"), (staged_time, staged_time))
+
+        lock_fd = reclaimer.lock(self.wbm.purging_dir)
+        self.assertIsNone(reclaimer.reclaim(self.wbm.purging_dir))
+        os.close(lock_fd)
+
+        self.assertEqual(reclaimer.reclaim(self.wbm.purging_dir), 2)
+        self.assertFalse(os.listdir(self.wbm.purging_dir))
+
+
+    def test_content(self):
+        for size, path in [(30, "srm_test/remove_me.txt"), (10, "srm_test/and_me.txt"),
+                           (20, "srm_test/dir/four.txt")]:
+            with open(path, "w") as test_file:
+                test_file.write("x" * size)
+            self.wbm.remove(path)
+        external = self.wbm.open_trash_root("Trash_TEST/external")
+        external.remove("srm_test/me_too.txt")
+
+        names = [name for name, _ in self.wbm.content(sort="size", reverse=True)]
+        self.assertEqual(names, ["remove_me.txt.0", "four.txt.0", "and_me.txt.0",
+                                 external.trash_path("me_too.txt.0")])
+
+        items = list(self.wbm.content(sort="size", limit=2, offset=1))
+        self.assertEqual([name for name, _ in items], ["and_me.txt.0", "four.txt.0"])
+        self.assertEqual(items[0][1]["old path"], os.path.abspath("srm_test/and_me.txt"))
+
+        names = [name for name, _ in self.wbm.content(pattern="srm_test/*_me.txt")]
+        self.assertEqual(names, ["and_me.txt.0", "remove_me.txt.0"])
+
+
+    def test_write_content(self):
+        self.wbm.remove("srm_test/remove_me.txt", "srm_test/and_me.txt")
+
+        stream = io.BytesIO() if str is bytes else io.StringIO()
+        write_content(self.wbm.content(), stream, "null")
+        self.assertEqual(stream.getvalue(), "and_me.txt.0\0remove_me.txt.0\0")
+
+        stream = io.BytesIO() if str is bytes else io.StringIO()
+        write_content(self.wbm.content(limit=1), stream, "json")
+        record = json.loads(stream.getvalue())
+        self.assertEqual(record["name"], "and_me.txt.0")
+        self.assertEqual(record["size"], 0)
+
+
+    def test_archive_old(self):
+        self.wbm.rmdir = True
+        with open("srm_test/dir/123.txt", "w") as test_file:
+            test_file.write("x" * 10000)
+        os.symlink("123.txt", "srm_test/dir/link")
+        os.chmod("srm_test/remove_me.txt", 0o600)
+        self.wbm.remove("srm_test/dir", "srm_test/remove_me.txt", "srm_test/and_me.txt")
+        self.wbm.trashinfo.backend.connection.execute(
+            "UPDATE trashinfo SET deleted_at = deleted_at - 7200 WHERE name != 'and_me.txt.0'")
+
+        packed = self.wbm.archive_old(datetime.timedelta(hours=1))
+        self.assertEqual(sorted(packed), ["dir.0", "remove_me.txt.0"])
+        self.assertEqual(os.listdir(self.wbm.file_dir), ["and_me.txt.0"])
+        self.assertEqual(len(os.listdir(self.wbm.cold_dir)), 1)
+        self.assertLess(self.wbm.trashinfo.get("dir.0")["size"], 10000)
+
+        size = self.wbm.total_size()
+        self.assertEqual(self.wbm.recount(), size)
+        self.assertFalse(self.wbm.archive_old(datetime.timedelta(hours=1)))
+
+        self.wbm.restore("dir.0")
+        self.assertEqual(self.wbm.total_size(), size)
+        self.assertEqual(os.path.getsize("srm_test/dir/123.txt"), 10000)
+        self.assertEqual(os.readlink("srm_test/dir/link"), "123.txt")
+        self.assertTrue(os.path.isdir("srm_test/dir/a"))
+        self.assertEqual(len(os.listdir(self.wbm.cold_dir)), 1)
+
+        self.wbm.restore_matching(prefix="srm_test/remove_me.txt")
+        self.assertEqual(os.stat("srm_test/remove_me.txt").st_mode & 0o777, 0o600)
+        self.assertFalse(os.listdir(self.wbm.cold_dir))
+        self.assertEqual(self.wbm.trashinfo.content(), ["and_me.txt.0"])
+        self.assertEqual(self.wbm.total_size(), self.wbm.trashinfo.get("and_me.txt.0")["size"])
+
+
+    def test_purge_archived(self):
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.archive_old(datetime.timedelta(0))
+
+        self.wbm.purge("remove_me.txt.0")
+        self.assertFalse(os.listdir(self.wbm.cold_dir))
+        self.assertEqual(self.wbm.total_size(), 0)
+
+
+    def test_pack_in_background(self):
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.cold_after = datetime.timedelta(0)
+        spawned = []
+        self.wbm.spawn_packer = lambda: spawned.append(True)
+
+        self.wbm.enforce_policy(RemovePolicy.TIME, force=True)
+        self.assertEqual(spawned, [True])
+        self.assertEqual(os.listdir(self.wbm.file_dir), ["remove_me.txt.0"])
+
+        self.assertEqual(packer.pack("Trash_TEST", self.wbm.metadata_backend,
+                                     datetime.timedelta(0), self.wbm.compression),
+                         ["remove_me.txt.0"])
+        self.assertFalse(os.listdir(self.wbm.file_dir))
+        self.assertEqual(len(os.listdir(self.wbm.cold_dir)), 1)
+
+
+    def test_fsck(self):
+        self.wbm.remove("srm_test/remove_me.txt", "srm_test/and_me.txt", "srm_test/me_too.txt")
+        self.wbm.archive_old(datetime.timedelta(0))
+        self.wbm.remove("srm_test/v_a", "srm_test/v_b")
+
+        # killed between the trashinfo and the move and during the clear
+        self.wbm.trashinfo.push("srm_test/v_c")
+        self.wbm.trashinfo.pop("v_b.0")
+        os.rename(os.path.join(self.wbm.file_dir, "v_a.0"), "srm_test/v_a")
+        os.remove(os.path.join(self.wbm.cold_dir, os.listdir(self.wbm.cold_dir)[0]))
+        create_path(os.path.join(self.wbm.file_dir, "lost"), is_file=True)
+
+        self.assertEqual(self.wbm.fsck(), (["lost", "v_b.0"],
+                                           ["and_me.txt.0", "me_too.txt.0",
+                                            "remove_me.txt.0", "v_a.0", "v_c.0"]))
+        self.assertEqual(self.wbm.trashinfo.content(), ["lost", "v_b.0"])
+        self.assertEqual(self.wbm.trashinfo.get("v_b.0")["old path"],
+                         os.path.abspath("Trash_TEST/recovered/v_b"))
+        self.assertEqual(self.wbm.fsck(), ([], []))
+        self.assertEqual(self.wbm.trashinfo.held_sizes(), {})
+
+
+    def test_external_trash_root(self):
+        external = self.wbm.open_trash_root("Trash_TEST/external")
+        external.remove("srm_test/remove_me.txt")
+        external_item = external.trash_path("remove_me.txt.0")
+
+        self.assertIn(external_item, [name for name, _ in self.wbm.content()])
+        self.assertIs(self.wbm.locate(external_item)[0], external)
+
+        self.wbm.restore(external_item)
+        self.assertTrue(os.path.exists("srm_test/remove_me.txt"))
+        self.assertFalse(external.trashinfo.content())
+
+
+    def test_create_trash_root_checks(self):
+        root = os.path.abspath("srm_test/.Trash-{uid}".format(uid=os.getuid()))
+        find_mount_point = wastebasket_manager.find_mount_point
+        wastebasket_manager.find_mount_point = lambda path: os.path.abspath("srm_test")
+        try:
+            os.mkdir(root, 0o755)
+            self.assertIsNone(self.wbm.create_trash_root("srm_test/remove_me.txt"))
+            os.rmdir(root)
+
+            os.mkdir("Trash_TEST/other", 0o700)
+            os.symlink(os.path.abspath("Trash_TEST/other"), root)
+            self.assertIsNone(self.wbm.create_trash_root("srm_test/remove_me.txt"))
+            self.assertFalse(os.listdir("Trash_TEST/other"))
+            os.remove(root)
+
+            external = self.wbm.create_trash_root("srm_test/remove_me.txt")
+            self.assertEqual(external.wastebasket_path, root)
+            self.assertEqual(stat.S_IMODE(os.lstat(root).st_mode), 0o700)
+        finally:
+            wastebasket_manager.find_mount_point = find_mount_point
+
+        os.chmod(root, 0o755)
+        self.assertEqual(WasteBasketManager(wastebasket_path="Trash_TEST").external_wastebaskets(),
+                         [])
+
+
+    def test_total_size_of_unopened_roots(self):
+        with open("srm_test/remove_me.txt", "w") as test_file:
+            test_file.write("12345")
+        external = self.wbm.open_trash_root("Trash_TEST/external")
+        external.remove("srm_test/remove_me.txt")
+        os.chmod(external.wastebasket_path, 0o700)
+        with open(self.wbm.trash_roots_path, "w") as roots_file:
+            json.dump([external.wastebasket_path], roots_file)
+
+        WasteBasketManager(wastebasket_path="Trash_TEST").enforce_policy(RemovePolicy.TIME)
+        wbm = WasteBasketManager(wastebasket_path="Trash_TEST")
+        wbm.enforce_policy(RemovePolicy.SIZE)
+
+        self.assertEqual(wbm.total_size(), 5)
+        self.assertIsNone(wbm.root_wastebaskets)
+
+
+    def test_trash_roots_list(self):
+        with open(self.wbm.trash_roots_path, "w") as roots_file:
+            roots_file.write('["/trunc')
+        self.assertEqual(self.wbm.load_trash_roots(), [])
+
+        processes = [multiprocessing.Process(target=create_root_concurrently, args=(worker,))
+                     for worker in range(8)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        self.assertEqual(self.wbm.load_trash_roots(), sorted(
+            os.path.abspath("srm_test/m{worker}/.Trash-{uid}".format(worker=worker,
+                                                                     uid=os.getuid()))
+            for worker in range(8)))
+        self.assertFalse([name for name in os.listdir("Trash_TEST") if name.endswith(".tmp")])
+
+
+    def test_external_trash_root_policy(self):
+        external = self.wbm.open_trash_root("Trash_TEST/external")
+        external.remove("srm_test/remove_me.txt")
+        self.wbm.storage_time = datetime.timedelta(seconds=-1)
+
+        removed_files = self.wbm.clear_by_time_policy()
+
+        self.assertEqual(removed_files, [external.trash_path("remove_me.txt.0")])
+        self.assertFalse(os.listdir(external.file_dir))
+
+
+def create_root_concurrently(worker):
+    mount_point = os.path.abspath("srm_test/m{worker}".format(worker=worker))
+    os.mkdir(mount_point)
+    wastebasket_manager.find_mount_point = lambda path: mount_point
+    WasteBasketManager(wastebasket_path="Trash_TEST").create_trash_root(mount_point + "/file")
+
+
+def remove_concurrently(worker, files, batch_size, backend):
+    wbm = WasteBasketManager(wastebasket_path="Trash_TEST", metadata_backend=backend)
+    paths = ["srm_test/{worker}/{index}/same.txt".format(worker=worker, index=index)
+             for index in range(files)]
+    list(wbm.remove_many(paths, batch_size=batch_size))
+
+
+class TestConcurrentRemove(unittest.TestCase):
+    WORKERS = 8
+    FILES = 60
+
+    def setUp(self):
+        for worker in range(self.WORKERS):
+            for index in range(self.FILES):
+                create_path("srm_test/{worker}/{index}/same.txt".format(worker=worker,
+                                                                        index=index),
+                            is_file=True)
+
+    def tearDown(self):
+        for path in ["Trash_TEST", "srm_test"]:
+            clear_dir(path)
+            os.rmdir(path)
+
+
+    def run_removers(self, backend):
+        WasteBasketManager(wastebasket_path="Trash_TEST", metadata_backend=backend)
+        processes = [multiprocessing.Process(target=remove_concurrently,
+                                             args=(worker, self.FILES, 1 + worker % 3, backend))
+                     for worker in range(self.WORKERS)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        trashinfo = TrashInfo("Trash_TEST/info/", backend=backend)
+        names = trashinfo.content()
+        total = self.WORKERS * self.FILES
+
+        self.assertEqual(len(names), total)
+        self.assertEqual(sorted(names), sorted("same.txt.{index}".format(index=index)
+                                               for index in range(total)))
+        self.assertEqual(sorted(os.listdir("Trash_TEST/files")), sorted(names))
+        old_paths = set(trashinfo.get(name)["old path"] for name in names)
+        self.assertEqual(len(old_paths), total)
+
+
+    def test_sqlite(self):
+        self.run_removers("sqlite")
+
+
+    def test_json(self):
+        self.run_removers("json")
+
+
+    def test_remove_roots_regex(self):
+        wbm = WasteBasketManager(wastebasket_path="Trash_TEST")
+        patterns = [r"srm_test/{worker}/same\.txt$".format(worker=worker)
+                    for worker in range(self.WORKERS)]
+        moved_files = wbm.remove_roots(patterns, regex=True, search_dirs=True, processes=4)
+
+        total = self.WORKERS * self.FILES
+        self.assertEqual(len(moved_files), total)
+        self.assertEqual(len(wbm.trashinfo.content()), total)
+        self.assertEqual(len(set(dst for src, dst in moved_files)), total)
+        self.assertFalse([path for src, dst in moved_files if os.path.exists(src)])
+
+
+    def test_remove_roots_error(self):
+        metrics.REGISTRY.clear()
+        wbm = WasteBasketManager(wastebasket_path="Trash_TEST")
+        paths = ["srm_test/0/{index}/same.txt".format(index=index) for index in range(10)]
+
+        # the dir fails in the middle of its shard, the workers stop like remove does
+        roots = paths[:3] + ["srm_test/1"] + paths[3:] + ["srm_test/ghost"]
+
+        with self.assertRaises(MoveError) as context:
+            wbm.remove_roots(roots, processes=2)
+
+        self.assertIn(context.exception.raised_path,
+                      [os.path.abspath("srm_test/ghost"), os.path.abspath("srm_test/1")])
+        moved_paths = sorted(src for src, dst in context.exception.success)
+        self.assertTrue(set(moved_paths) < set(os.path.abspath(path) for path in paths))
+        self.assertEqual(metrics.REGISTRY.get("items_removed_total"), len(moved_paths))
+        self.assertEqual(len(wbm.trashinfo.content()), len(moved_paths))
+        self.assertTrue(os.path.isdir("srm_test/1"))
+
+        # the failed roots are skipped with force
+        wbm.force = True
+        moved_files = wbm.remove_roots(roots, processes=2)
+        self.assertEqual(sorted(src for src, dst in moved_files),
+                         sorted(set(os.path.abspath(path) for path in paths) - set(moved_paths)))
+        self.assertEqual(len(wbm.trashinfo.content()), len(paths))
+
+
+    def test_shard_roots(self):
+        WasteBasketManager(wastebasket_path="Trash_TEST")
+        paths = ["srm_test/0/{index}/same.txt".format(index=index) for index in range(10)]
+
+        shards = parallel_remove.shard_roots(paths + ["srm_test/ghost"], 3)
+        self.assertEqual(sorted(len(shard) for shard in shards), [1, 5, 5])
+        self.assertIn(["srm_test/ghost"], shards)
+        self.assertEqual(sorted(sum(shards, [])), sorted(paths + ["srm_test/ghost"]))
+
+        self.assertEqual(parallel_remove.shard_roots(paths + ["srm_test/ghost"], 1),
+                         [paths + ["srm_test/ghost"]])
+
+
+@unittest.skipIf(sys.version_info < (3, 7), "asyncio API requires python 3.7+")
+class TestAsyncWasteBasketManager(unittest.TestCase):
+    def setUp(self):
+        self.paths = ["srm_test/{index}.txt".format(index=index) for index in range(600)]
+        for path in self.paths:
+            create_path(path, is_file=True)
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.wbm = AsyncWasteBasketManager(workers=3, wastebasket_path="Trash_TEST")
+
+    def tearDown(self):
+        self.wbm.close()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        for path in ["Trash_TEST", "srm_test"]:
+            clear_dir(path)
+            os.rmdir(path)
+
+
+    def run_loop(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+
+    def collect(self, iterator, limit=None):
+        items = []
+        while limit is None or len(items) < limit:
+            try:
+                items.append(self.run_loop(iterator.__anext__()))
+            except StopAsyncIteration:
+                break
+
+        return items
+
+
+    def test_remove_restore(self):
+        moved_files = self.run_loop(asyncio.gather(*[self.wbm.remove(path)
+                                                     for path in self.paths[:20]]))
+        removed = self.collect(self.wbm.remove_many(self.paths[20:]))
+
+        self.assertEqual(sum(len(files) for files in moved_files) + len(removed), 600)
+        self.assertEqual(len(self.collect(self.wbm.content(sort="path"))), 600)
+
+        self.assertEqual(len(self.run_loop(self.wbm.restore_matching(prefix="srm_test/"))), 600)
+        for path in self.paths:
+            self.assertTrue(os.path.exists(path))
+
+
+    def test_remove_regex_workers(self):
+        moved_files = self.run_loop(self.wbm.remove_regex(r"srm_test/1\d*\.txt$", workers=4))
+        self.assertEqual(len(moved_files), 111)
+        self.assertFalse(os.path.exists("srm_test/1.txt"))
+
+
+    def test_stop_stream(self):
+        self.run_loop(self.wbm.remove(*self.paths))
+
+        # the stream is closed after its first item
+        content = self.wbm.content()
+        items = self.collect(content, limit=1)
+        self.run_loop(content.aclose())
+
+        self.assertEqual(items[0][0], "0.txt.0")
+        self.assertEqual(self.run_loop(self.wbm.clear_by_time_policy()), [])
+
+
+class TestCopy(unittest.TestCase):
+    def setUp(self):
+        create_path("srm_test/src/dir/file", is_file=True)
+        with open("srm_test/src/big", "wb") as test_file:
+            test_file.write(b"x" * 100000)
+        os.symlink("dir/file", "srm_test/src/link")
+
+    def tearDown(self):
+        clear_dir("srm_test")
+        os.rmdir("srm_test")
+
+
+    def test_move_across(self):
+        copied = []
+        move_across("srm_test/src", "srm_test/dst", progress=copied.append)
+
+        self.assertFalse(os.path.exists("srm_test/src"))
+        self.assertEqual(sum(copied), 100000)
+        self.assertEqual(os.path.getsize("srm_test/dst/big"), 100000)
+        self.assertEqual(os.readlink("srm_test/dst/link"), "dir/file")
+        self.assertTrue(os.path.isfile("srm_test/dst/dir/file"))
+
+
+    def test_move_across_failed(self):
+        def no_space(size):
+            raise IOError(errno.ENOSPC, "No space left on device")
+
+        with self.assertRaises(IOError):
+            move_across("srm_test/src", "srm_test/dst", progress=no_space)
+
+        self.assertFalse(os.path.lexists("srm_test/dst"))
+        self.assertEqual(os.path.getsize("srm_test/src/big"), 100000)
+
+
+    def test_find_mount_point(self):
+        mount_point = find_mount_point("srm_test/src/big")
+
+        self.assertTrue(os.path.abspath("srm_test").startswith(mount_point))
+        self.assertEqual(os.stat(mount_point).st_dev, os.stat("srm_test").st_dev)
+
+
+class TestPurge(unittest.TestCase):
+    def setUp(self):
+        for path in ["srm_test/a/b/c.txt", "srm_test/a/d.txt", "srm_test/e.txt"]:
+            create_path(path, is_file=True)
+        with open("srm_test/a/b/c.txt", "w") as test_file:
+            test_file.write("x" * 10)
+        os.symlink(os.path.abspath("srm_test/a"), "srm_test/link")
+
+    def tearDown(self):
+        clear_dir("srm_test")
+        os.rmdir("srm_test")
+
+
+    def test_purge_names(self):
+        link_size = len(os.path.abspath("srm_test/a"))
+        removed = purge("srm_test", ["a", "link", "ghost"], count_bytes=True)
+
+        self.assertEqual(removed, (3, 10 + link_size))
+        self.assertEqual(os.listdir("srm_test"), ["e.txt"])
+
+
+    def test_purge_workers(self):
+        self.assertEqual(purge("srm_test", workers=3)[0], 4)
+        self.assertFalse(os.listdir("srm_test"))
+
+
+def write_metrics_concurrently(runs):
+    for _ in range(runs):
+        metrics.REGISTRY.clear()
+        metrics.increment("items_removed_total")
+        write_metrics("srm_test/srm.prom", WasteBasketManager(wastebasket_path="Trash_TEST"))
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.REGISTRY.clear()
+        self.wbm = WasteBasketManager(wastebasket_path="Trash_TEST")
+        create_path("srm_test/remove_me.txt", is_file=True)
+        with open("srm_test/remove_me.txt", "w") as test_file:
+            test_file.write("x" * 10)
+
+    def tearDown(self):
+        metrics.REGISTRY.clear()
+        for path in ["Trash_TEST", "srm_test"]:
+            clear_dir(path)
+            os.rmdir(path)
+
+
+    def test_operations(self):
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.restore("remove_me.txt.0")
+        self.wbm.remove("srm_test/remove_me.txt")
+        self.wbm.purge("remove_me.txt.1")
+        with self.assertRaises(MoveError):
+            self.wbm.remove("srm_test/ghost")
+
+        registry = metrics.REGISTRY
+        self.assertEqual(registry.get("items_removed_total"), 2)
+        self.assertEqual(registry.get("bytes_removed_total"), 20)
+        self.assertEqual(registry.get("items_restored_total"), 1)
+        self.assertEqual(registry.get("items_purged_total"), 1)
+        self.assertEqual(registry.get("bytes_purged_total"), 10)
+        self.assertEqual(registry.get("errors_total", operation="remove", error="ENOENT"), 1)
+        self.assertEqual(registry.get("operation_seconds", operation="remove").count, 2)
+
+
+    def test_textfile(self):
+        metrics.increment("items_removed_total", 3)
+        metrics.observe("operation_seconds", 0.02, operation="purge")
+        metrics.set_gauge("wastebasket_size_bytes", 100)
+        metrics.write_textfile("srm_test/srm.prom")
+
+        with open("srm_test/srm.prom") as metrics_file:
+            text = metrics_file.read()
+        self.assertIn("# TYPE srm_items_removed_total counter\nsrm_items_removed_total 3\n", text)
+        self.assertIn('srm_operation_seconds_bucket{operation="purge",le="0.01"} 0\n', text)
+        self.assertIn('srm_operation_seconds_bucket{operation="purge",le="0.05"} 1\n', text)
+
+        registry = metrics.Registry()
+        registry.set("wastebasket_size_bytes", 50)
+        metrics.load_textfile("srm_test/srm.prom", registry)
+        metrics.load_textfile("srm_test/srm.prom", registry)
+
+        self.assertEqual(registry.get("items_removed_total"), 6)
+        self.assertEqual(registry.get("wastebasket_size_bytes"), 50)
+        histogram = registry.get("operation_seconds", operation="purge")
+        self.assertEqual((histogram.count, histogram.counts[3]), (2, 2))
+
+
+    def test_concurrent_textfile(self):
+        processes = [multiprocessing.Process(target=write_metrics_concurrently, args=(20,))
+                     for _ in range(8)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+        registry = metrics.Registry()
+        metrics.load_textfile("srm_test/srm.prom", registry)
+        self.assertEqual(registry.get("items_removed_total"), 160)
+
+
+class TestLogging(unittest.TestCase):
+    class ListHandler(logging.Handler):
+        def __init__(self):
+            logging.Handler.__init__(self)
+            self.lines = []
+
+        def emit(self, record):
+            self.lines.append(self.format(record))
+
+
+    def setUp(self):
+        create_path("srm_test/dir/a.txt", is_file=True)
+        with open("srm_test/dir/a.txt", "w") as test_file:
+            test_file.write("x" * 10)
+        create_path("srm_test/b.txt", is_file=True)
+
+        self.root_logger = logging.getLogger()
+        self.old_level = self.root_logger.level
+        self.root_logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        self.root_logger.setLevel(self.old_level)
+        clear_dir("srm_test")
+        os.rmdir("srm_test")
+
+
+    def log(self, handler, moved_files, action):
+        background = BackgroundHandler(handler)
+        self.root_logger.addHandler(background)
+        try:
+            return log_moved_files(moved_files, action, action.lower())
+        finally:
+            self.root_logger.removeHandler(background)
+            background.close()
+
+
+    def test_summary(self):
+        handler = self.ListHandler()
+        handler.setLevel(logging.INFO)
+        moved_files = [MovedNode("/src/a.txt", "srm_test/dir/a.txt", 10),
+                       MovedNode("/src/b.txt", "srm_test/b.txt", 0),
+                       MovedNode("/src/dir/c.txt", "srm_test/ghost", 5)]
+
+        self.assertEqual(self.log(handler, moved_files, "Removed"), 3)
+        self.assertEqual(handler.lines, ['Removed 2 items, 10 bytes from "/src".',
+                                         'Removed 1 items, 5 bytes from "/src/dir".'])
+
+
+    def test_summary_on_error(self):
+        def moved_files():
+            yield MovedNode("/src/a.txt", "srm_test/a.txt", 10)
+            raise MoveError(message="No such file or directory", raised_path="/src/b.txt")
+
+        handler = self.ListHandler()
+        handler.setLevel(logging.INFO)
+        with self.assertRaises(MoveError):
+            self.log(handler, moved_files(), "Removed")
+        self.assertEqual(handler.lines, ['Removed 1 items, 10 bytes from "/src".'])
+
+
+    def test_summary_of_removed_dir(self):
+        handler = self.ListHandler()
+        handler.setLevel(logging.INFO)
+        wastebasket = WasteBasketManager(wastebasket_path="Trash_TEST", rmdir=True)
+        try:
+            moved_files = wastebasket.remove("srm_test/dir")
+            size = wastebasket.trashinfo.get("dir.0")["size"]
+            self.log(handler, moved_files, "Removed")
+        finally:
+            clear_dir("Trash_TEST")
+            os.rmdir("Trash_TEST")
+
+        # the tree is counted, not the node of the dir
+        self.assertGreaterEqual(size, 10)
+        self.assertEqual(handler.lines, ['Removed 1 items, {size} bytes from "{dir}".'.format(
+            size=size, dir=os.path.abspath("srm_test"))])
+
+
+    def test_clear_message(self):
+        handler = self.ListHandler()
+        handler.setLevel(logging.INFO)
+        wastebasket = WasteBasketManager(wastebasket_path="Trash_TEST")
+        wastebasket.remove("srm_test/b.txt")
+        args = create_parser().parse_args(["--clear"])
+
+        self.root_logger.addHandler(handler)
+        try:
+            for dry_run in [True, False]:
+                wastebasket.dry_run = dry_run
+                run_actions(args, {"cleaning_policy": RemovePolicy.TIME, "content": False,
+                                   "clear": True, "restore": False, "regex": False,
+                                   "dry_run": dry_run}, wastebasket)
+        finally:
+            self.root_logger.removeHandler(handler)
+            clear_dir("Trash_TEST")
+            os.rmdir("Trash_TEST")
+
+        self.assertIn("WasteBasket would be cleared: 0 bytes would be freed.", handler.lines)
+        self.assertIn("WasteBasket was cleared: 1 files, 0 bytes are freed.", handler.lines)
+
+
+    def test_structured(self):
+        handler = self.ListHandler()
+        handler.setFormatter(JsonFormatter())
+        self.log(handler, [("srm_test/b.txt", "/trash/b.txt.0")], "Restored")
+
+        records = [json.loads(line) for line in handler.lines]
+        self.assertEqual([record.get("event") for record in records], ["restored", None])
+        self.assertEqual((records[0]["src"], records[0]["dst"]),
+                         ("srm_test/b.txt", "/trash/b.txt.0"))
+        self.assertNotIn("message", records[0])
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        create_path("srm_test/remove_me.txt", is_file=True)
+
+        started = threading.Event()
+
+        def serve():
+            self.server = daemon.Server(WasteBasketManager(wastebasket_path="Trash_TEST"))
+            started.set()
+            self.server.serve_forever(poll_interval=0.05)
+
+        self.thread = threading.Thread(target=serve)
+        self.thread.start()
+        started.wait()
+
+        self.client = daemon_client.connect(wastebasket_path="Trash_TEST", rmdir=True)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+        for path in ["Trash_TEST", "srm_test"]:
+            clear_dir(path)
+            os.rmdir(path)
+
+
+    def test_remove_restore(self):
+        moved_files = self.client.remove_many(["srm_test/remove_me.txt"])
+
+        self.assertEqual(moved_files, [(os.path.abspath("srm_test/remove_me.txt"),
+                                        os.path.abspath("Trash_TEST/files/remove_me.txt.0"))])
+        self.assertEqual(moved_files[0].size, 0)
+        self.assertEqual([name for name, _ in self.client.content()], ["remove_me.txt.0"])
+
+        self.client.restore("remove_me.txt.0")
+        self.assertTrue(os.path.exists("srm_test/remove_me.txt"))
+        self.assertEqual(list(self.client.content()), [])
+
+
+    def test_content_stream(self):
+        paths = ["srm_test/stream_{index}.txt".format(index=index) for index in range(5)]
+        for path in paths:
+            create_path(path, is_file=True)
+        self.client.remove(*paths)
+
+        frames = []
+        old_chunk_size, old_receive = daemon_client.CHUNK_SIZE, daemon_client.receive_message
+        daemon_client.CHUNK_SIZE = 2
+
+        def receive_message(connection):
+            frames.append(old_receive(connection))
+            return frames[-1]
+
+        daemon_client.receive_message = receive_message
+        try:
+            content = self.client.content()
+            self.assertEqual(next(content)[0], "stream_0.txt.0")
+            self.assertEqual(len(frames), 1)
+            # the unread rows are skipped, the next call gets its own response
+            content.close()
+            self.assertEqual(self.client.recount(), 0)
+
+            names = [name for name, _ in self.client.content()]
+        finally:
+            daemon_client.CHUNK_SIZE, daemon_client.receive_message = old_chunk_size, old_receive
+
+        self.assertEqual(names, [os.path.basename(path) + ".0" for path in paths])
+        self.assertEqual([list(frame) for frame in frames[-4:]],
+                         [["chunk"], ["chunk"], ["chunk"], ["end"]])
+
+
+    def test_restore_matching(self):
+        self.client.remove("srm_test/remove_me.txt")
+        since = datetime.datetime.now() - datetime.timedelta(hours=1)
+
+        self.assertEqual(len(self.client.restore_matching(prefix="srm_test/", since=since)), 1)
+        self.assertTrue(os.path.exists("srm_test/remove_me.txt"))
+
+
+    def test_move_error(self):
+        with self.assertRaises(MoveError) as context:
+            self.client.remove("srm_test/remove_me.txt", "srm_test/ghost")
+
+        self.assertEqual(context.exception.raised_path, os.path.abspath("srm_test/ghost"))
+        self.assertEqual([src for src, dst in context.exception.success],
+                         [os.path.abspath("srm_test/remove_me.txt")])
+        self.assertFalse(os.path.exists("srm_test/remove_me.txt"))
+
+
+    def test_fallback(self):
+        self.assertIsNone(daemon_client.connect(wastebasket_path="srm_test"))
+        with self.assertRaises(OSError):
+            daemon.Server(WasteBasketManager(wastebasket_path="Trash_TEST"))
+
+
+class TestTrashInfo(unittest.TestCase):
+    def setUp(self):
+        create_path("Trash_TEST/info/")
+
+    def tearDown(self):
+        clear_dir("Trash_TEST")
+        os.rmdir("Trash_TEST")
+
+
+    def test_migrate_json_layout(self):
+        old_trashinfo = TrashInfo("Trash_TEST/info/", backend="json")
+        name = old_trashinfo.push("srm_test/remove_me.txt")
+
+        with open(os.path.join("Trash_TEST/info/", name)) as trashinfo_file:
+            old_item = json.load(trashinfo_file)
+
+        trashinfo = TrashInfo("Trash_TEST/info/")
+
+        self.assertFalse(os.listdir("Trash_TEST/info/"))
+        self.assertEqual(trashinfo.content(), [name])
+        self.assertEqual(trashinfo.get(name), old_item)
+
+
+    def test_migrate_conflict(self):
+        name = TrashInfo("Trash_TEST/info/").push("srm_test/dir/remove_me.txt")
+        old_name = TrashInfo("Trash_TEST/info/", backend="json").push("srm_test/remove_me.txt")
+        self.assertEqual(old_name, name)
+
+        trashinfo = TrashInfo("Trash_TEST/info/")
+        self.assertEqual(trashinfo.migrated, [])
+        self.assertEqual(trashinfo.conflicts, [name])
+        self.assertEqual(os.listdir("Trash_TEST/info/"), [name])
+        self.assertEqual(trashinfo.get(name)["old path"],
+                         os.path.abspath("srm_test/dir/remove_me.txt"))
+
+
+    def test_find_by_prefix(self):
+        for backend in ["json", "sqlite"]:
+            trashinfo = TrashInfo("Trash_TEST/info/", backend=backend)
+            first = trashinfo.push("srm_test/dir/a.txt")
+            trashinfo.push("srm_test/dir_b/b.txt")
+            third = trashinfo.push("srm_test/dir/c/d.bin")
+
+            self.assertEqual([name for name, _ in trashinfo.find(prefix="srm_test/dir/")],
+                             [first, third])
+            self.assertEqual([name for name, _ in trashinfo.find(pattern="srm_test/dir/*.txt")],
+                             [first])
+            trashinfo.clear()
+
+
+    def test_prefix_end(self):
+        last = chr(255) if str is bytes else chr(sys.maxunicode)
+        self.assertEqual(prefix_end("/ab"), "/ac")
+        self.assertEqual(prefix_end("/a" + last + last), "/b")
+        self.assertIsNone(prefix_end(last))
+
+        trashinfo = TrashInfo("Trash_TEST/info/")
+        name = trashinfo.push("srm_test/dir/a.txt")
+        self.assertEqual([item_name for item_name, _ in trashinfo.find(prefix="srm_test/" + last)],
+                         [])
+        self.assertEqual([item_name for item_name, _ in trashinfo.find(prefix="srm_test/")],
+                         [name])
+
+
+    def test_clear_total_size(self):
+        trashinfo = TrashInfo("Trash_TEST/info/")
+        for size in [10, 20]:
+            trashinfo.push("srm_test/remove_me.txt", size)
+        self.assertEqual(trashinfo.total_size(), 30)
+
+        trashinfo.clear()
+        self.assertEqual(trashinfo.total_size(), 0)
+
+        # the total is kept by the triggers after the clear
+        name = trashinfo.push("srm_test/remove_me.txt", 5)
+        self.assertEqual(name, "remove_me.txt.0")
+        trashinfo.push("srm_test/and_me.txt", 7)
+        trashinfo.pop(name)
+        self.assertEqual(trashinfo.total_size(), 7)
+
+
+    def test_held_sizes(self):
+        for backend in ["json", "sqlite"]:
+            trashinfo = TrashInfo("Trash_TEST/info/", backend=backend)
+            names = [trashinfo.push("srm_test/remove_me.txt", 100) for _ in range(3)]
+            trashinfo.set_archive("cold.zip", {names[0]: 10, names[1]: 20})
+            self.assertEqual(trashinfo.total_size(), 130)
+
+            # the archive takes its space until it is released
+            trashinfo.pop_many(names)
+            self.assertEqual(trashinfo.held_sizes(), {"cold.zip": 30})
+            self.assertEqual(trashinfo.total_size(), 30)
+
+            trashinfo.release_archive("cold.zip")
+            self.assertEqual(trashinfo.held_sizes(), {})
+            self.assertEqual(trashinfo.total_size(), 0)
+            trashinfo.clear()
+
+
+    def test_find_by_old_path(self):
+        trashinfo = TrashInfo("Trash_TEST/info/")
+        first = trashinfo.push("srm_test/remove_me.txt")
+        second = trashinfo.push("srm_test/remove_me.txt")
+        trashinfo.push("srm_test/and_me.txt")
+
+        self.assertEqual(trashinfo.find_by_old_path("srm_test/remove_me.txt"), [first, second])
+
+
+    def test_pop_nonexisting_name(self):
+        trashinfo = TrashInfo("Trash_TEST/info/")
+
+        with self.assertRaises(IOError):
+            trashinfo.pop("ghost.0")
+
+
 def main():
     """
     Run tests